@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+from typing import List
+
+from KeypressDetector import KeypressDetector
+from PhysicalSystems import PhysicalSystems
+from PhysicalSystemsInterface import PhysicalSystemsInterface
+from PumpTasks import PumpTask
+from RecordStore import RecordStore
+from Scheduler import Scheduler
+from VirtualClock import AsyncVirtualClock
+
+
+class AsyncPhysicalSystems:
+    # Adapter that lets the asyncio scheduler use a PhysicalSystemsInterface.
+    # The ph-meter and the pumps are separate resources, each guarded by its own lock, and the blocking calls are
+    # run in worker threads. This way the pumps can be used while the ph-meter is being read and the other way around.
+
+    def __init__(self, physical_systems: PhysicalSystemsInterface) -> None:
+        self.physical_systems = physical_systems
+        self.ph_meter_lock = asyncio.Lock()
+        if isinstance(physical_systems, PhysicalSystems):
+            self.pump_lock = asyncio.Lock()
+        else:
+            # The client sends all its requests through one socket, which only allows one request at a time.
+            self.pump_lock = self.ph_meter_lock
+
+    async def run_on_ph_meter(self, function, *args):
+        async with self.ph_meter_lock:
+            return await asyncio.to_thread(function, *args)
+
+    async def run_on_pumps(self, function, *args):
+        async with self.pump_lock:
+            return await asyncio.to_thread(function, *args)
+
+
+class AsyncScheduler(Scheduler):
+    # Scheduler that waits for the tasks using asyncio instead of sleeping until the next task is ready.
+    # Each ready task (or group of tasks sharing a pH module) is handled by its own coroutine,
+    # so a slow pH reading or a task pumping many times does not hold back tasks that can use the other device.
+
+    async_timer = asyncio  # can be accessed for testing
+
+    def use_clock(self, clock) -> None:
+        super().use_clock(clock)
+        self.async_timer = AsyncVirtualClock(clock)
+
+    def handle_tasks_until_done(self, records: RecordStore, results_file_path: str, task_queue: List[PumpTask]) -> None:
+        asyncio.run(self.handle_tasks_until_done_async(records, results_file_path, task_queue))
+
+    async def handle_tasks_until_done_async(self, records: RecordStore, results_file_path: str,
+                                            task_queue: List[PumpTask]) -> None:
+        devices = AsyncPhysicalSystems(self.physical_systems)
+        detector = KeypressDetector()
+        running_handlers: dict[asyncio.Task, List[PumpTask]] = dict()  # With the tasks each handler is handling
+
+        while 0 < len(task_queue) or 0 < len(running_handlers):
+            if detector.get_has_key_been_pressed():
+                await asyncio.to_thread(self.pause_on_keypress, detector)
+            ready_tasks = self.get_ready_tasks(task_queue)
+            for tasks in ready_tasks:
+                handler = asyncio.create_task(self.handle_tasks_async(tasks, devices, records, task_queue, results_file_path))
+                running_handlers[handler] = tasks
+            if len(ready_tasks) == 0:
+                await self.wait_for_next_task_or_handler(task_queue, running_handlers)
+            finished_handlers = [handler for handler in running_handlers if handler.done()]
+            for handler in finished_handlers:
+                handler.result()  # Raises any error from the handler
+                del running_handlers[handler]
+            if self.is_checkpoint_due(records):
+                self.save_checkpoint(len(records), results_file_path,
+                                     task_queue + self.get_tasks_being_handled(task_queue, running_handlers))
+
+    def get_tasks_being_handled(self, task_queue: List[PumpTask], running_handlers: dict) -> List[PumpTask]:
+        # The tasks being handled are included in the checkpoints, so they are handled again when resuming.
+        # Those already rescheduled by their handler are in the queue.
+        queued_pump_ids = {task.pump_id for task in task_queue}
+        return [task for tasks in running_handlers.values() for task in tasks if task.pump_id not in queued_pump_ids]
+
+    def get_ready_tasks(self, task_queue: List[PumpTask]) -> List[List[PumpTask]]:
+        ready_tasks = []
+        while 0 < len(task_queue) and task_queue[0].time_next_operation <= self.timer.now():
+            current_task = heapq.heappop(task_queue)
+            if self.settings["scheduler"]['ShouldPrintSchedulingMessages']:
+                print(f"Task: {current_task.pump_id}, at: {self.timer.now()}")
+            ready_tasks.append([current_task] + self.get_tasks_sharing_module_read(current_task, task_queue))
+        return ready_tasks
+
+    async def wait_for_next_task_or_handler(self, task_queue: List[PumpTask], running_handlers: dict) -> None:
+        seconds_until_next_task = None
+        if 0 < len(task_queue):
+            seconds_until_next_task = max(0.0, (task_queue[0].time_next_operation - self.timer.now()).total_seconds())
+        if 0 < len(running_handlers):
+            # A handler finishing reschedules its tasks, which might then be the next ones to be ready.
+            await asyncio.wait(set(running_handlers), timeout=seconds_until_next_task, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await self.async_timer.sleep(seconds_until_next_task)
+
+    async def handle_tasks_async(self, tasks: List[PumpTask], devices: AsyncPhysicalSystems, records: RecordStore,
+                                 task_queue: List[PumpTask], results_file_path: str) -> None:
+        step_timings = [self.start_step_timing(task) for task in tasks]
+        time_measuring_started = self.timer.now()
+        if len(tasks) == 1:
+            measured_ph_values = [await devices.run_on_ph_meter(self.measure_associated_task_ph, tasks[0])]
+        else:
+            measured_ph_values = await devices.run_on_ph_meter(self.measure_associated_tasks_ph, tasks)
+        measure_seconds = self.get_seconds_since(time_measuring_started)  # Including waiting for the ph-meter
+        for current_task, measured_ph, step_timing in zip(tasks, measured_ph_values, step_timings):
+            step_timing.measure_seconds = measure_seconds
+            expected_ph = current_task.get_expected_ph_at_current_time()
+            number_of_pumps = self.calculate_number_of_pumps(current_task.controller, expected_ph, measured_ph)
+            if self.should_pump_in_step(measured_ph, number_of_pumps):
+                time_pumping_started = self.timer.now()
+                await devices.run_on_pumps(self.physical_systems.pump_n_times, current_task.pump_id, number_of_pumps)
+                step_timing.pump_seconds = self.get_seconds_since(time_pumping_started)
+            self.finish_step(current_task, expected_ph, measured_ph, number_of_pumps, records, task_queue, results_file_path,
+                             step_timing)
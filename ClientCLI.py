@@ -1,19 +1,23 @@
 import os
+import time
 import traceback
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilename, askopenfilenames
 from typing import List
 
 import yaml
-import pandas
 
 import Logger
 from KeypressDetector import KeypressDetector
 from Networking.PhysicalSystemsClient import PhysicalSystemsClient
 from PhMeter import PhReadException
 from PhysicalSystems import PhysicalSystems
+from ProtocolLoader import load_protocol
 from Scheduler import Scheduler
+from Schedulers import create_scheduler
 from Networking import EmailConnector
 
+LIVE_READ_INTERVAL_IN_SECONDS = 1  # How often the probes are read and printed when live reading and calibrating
+
 
 class ClientCLI:
 
@@ -63,6 +67,9 @@ class ClientCLI:
                 elif inputCommand == "7":
                     self.pump_liquid(protocol_path)
                 elif inputCommand == "8":
+                    self.start_runs(self.set_protocols_used_for_runs())
+                    break
+                elif inputCommand == "9":
                     print("Exiting program.")
                     break
                 else:
@@ -75,7 +82,7 @@ class ClientCLI:
 
     def start_run(self, protocol_path: str) -> None:
         try:
-            scheduler = Scheduler(self.settings, self.physical_systems)
+            scheduler = self.create_scheduler()
             scheduler.start(protocol_path)
         except Exception as e:
             Logger.standardLogger.log(e)
@@ -88,6 +95,25 @@ class ClientCLI:
             self.email_connector.send_is_done(f"Run of protocol \"{protocol_path}\" has successfully finished")
             print("Has send email repporting finished run")
 
+    def start_runs(self, protocol_paths: List[str]) -> None:
+        # The protocols are run by this program alone, so no server and clients are needed to run them at the same time.
+        try:
+            scheduler = self.create_scheduler()
+            scheduler.start_protocols(protocol_paths)
+        except Exception as e:
+            Logger.standardLogger.log(e)
+            if self.settings["email"]["ShouldSendEmail"]:
+                self.email_connector.send_error(f"Run of protocols {protocol_paths} failed with error: {str(e)}, {traceback.format_exc()}")
+                print("Has send email with error")
+            raise e
+        print("Runs have finished")
+        if self.settings["email"]["ShouldSendEmail"]:
+            self.email_connector.send_is_done(f"Run of protocols {protocol_paths} has successfully finished")
+            print("Has send email repporting finished runs")
+
+    def create_scheduler(self) -> Scheduler:
+        return create_scheduler(self.settings, self.physical_systems)
+
     def printPossibleCommands(self, protocol_path: str) -> None:
         print("Options:")
         print(f"1 - Set protocol used for run. Currently \"{protocol_path}\".")
@@ -97,7 +123,8 @@ class ClientCLI:
         print("5 - Restart failed run.")
         print("6 - Live read pH. pH will be measured using all probes in the selected protocol.")
         print("7 - Pump liquid. Useful after the liquid in the syringes have been changed.")
-        print("8 - Exit program.")
+        print("8 - Run several protocols at the same time, using the same pH-meter and pumps.")
+        print("9 - Exit program.")
         print()
         print("Input:")
 
@@ -111,7 +138,7 @@ class ClientCLI:
             self.restart_failed_run(protocol_path)
         print(f"The run ”{filename}” will be restarted based on the protocol: {protocol_path}")
 
-        scheduler = Scheduler(self.settings, self.physical_systems)
+        scheduler = self.create_scheduler()
         scheduler.restart_run(protocol_path, filename)
 
     def assign_pump_ids(self) -> None:
@@ -136,6 +163,11 @@ class ClientCLI:
         Logger.standardLogger.set_logging_path(selected_protocol)
         return selected_protocol
 
+    def set_protocols_used_for_runs(self) -> List[str]:
+        selected_protocols = list(askopenfilenames())
+        print(f"Selected protocols: {selected_protocols}")
+        return selected_protocols
+
     def calibrate_ph_probes(self, selected_protocol_path: str) -> None:
         ph_probes_used_in_protocol = self.get_probes_used_in_protocol(selected_protocol_path)
 
@@ -149,10 +181,7 @@ class ClientCLI:
 
     def get_probes_used_in_protocol(self, selected_protocol_path: str) -> list[str]:
         if os.path.exists(selected_protocol_path):
-            selected_protocol = pandas.read_excel(selected_protocol_path)
-            ph_probes_used_in_protocol: list[str] = list(set(selected_protocol["pH probe"].to_list()))
-            ph_probes_used_in_protocol.sort()
-            return ph_probes_used_in_protocol
+            return list(load_protocol(selected_protocol_path).ph_probes)
         else:
             return []
 
@@ -163,14 +192,18 @@ class ClientCLI:
 
         print("The mV readings of the ph probes in the buffer need to stabilize.")
         print("Wait until the mV values for the pH probes have stabilized.")
-        print("The values will be printed to the console. This will take about ~1 second per selected probe.")
+        print(f"The values will be printed to the console about every {LIVE_READ_INTERVAL_IN_SECONDS} second, "
+              "or as often as the selected probes can be read.")
         print("Press a key when the values have stabilized to continue. It will then update the values one final time.")
 
         detector = KeypressDetector()
-        pH_mv_values = self.physical_systems.get_mv_values_of_selected_probes(selected_probes)
+        time_read_started = time.monotonic()
+        pH_mv_values = self.physical_systems.get_mv_values_of_selected_probes(selected_probes, False)
         while not detector.get_has_key_been_pressed():
             self.pretty_print_pH_mV_values(pH_mv_values, probes_to_pumps)
-            pH_mv_values = self.physical_systems.get_mv_values_of_selected_probes(selected_probes)
+            self.wait_for_new_readings(time_read_started)
+            time_read_started = time.monotonic()
+            pH_mv_values = self.physical_systems.get_mv_values_of_selected_probes(selected_probes, False)
 
         print(f"The final mV values for the different probes are: {pH_mv_values}")
 
@@ -219,12 +252,15 @@ class ClientCLI:
         print()
 
         print("Printing the pH's measured by the selected probes, until a key is pressed. "
-              "An update will take ~1 second per probe used in the protocol.")
+              f"They are updated about every {LIVE_READ_INTERVAL_IN_SECONDS} second, "
+              "or as often as the probes used in the protocol can be read.")
         detector = KeypressDetector()
+        probes_to_pumps = self.get_probe_to_pump(ph_probes, protocol_path)
 
         while not detector.has_key_been_pressed:
+            time_read_started = time.monotonic()
             try:
-                ph_values = self.physical_systems.get_ph_values_of_selected_probes(ph_probes)
+                ph_values = self.physical_systems.get_ph_values_of_selected_probes(ph_probes, False)
             except PhReadException:
                 print("Error when trying to read pH values from the pH meter. "
                       "Try checking the probe connections if this continues. Retrying...")
@@ -233,24 +269,26 @@ class ClientCLI:
                 print("Unknown error occurred. Will attempt to read probe pH values again...")
                 continue
 
-            probes_to_pumps = self.get_probe_to_pump(ph_probes, protocol_path)
             self.pretty_print_pH_mV_values(ph_values, probes_to_pumps)
+            self.wait_for_new_readings(time_read_started)
 
         print("A key has been pressed. Stopped live-reading pH values.")
 
+    # The probes are read anew every time, without reusing the readings cached by the ph-meter, so only what is left
+    # of the interval after reading them is waited.
+    def wait_for_new_readings(self, time_read_started: float):
+        seconds_left = LIVE_READ_INTERVAL_IN_SECONDS - (time.monotonic() - time_read_started)
+        if 0 < seconds_left:
+            time.sleep(seconds_left)
+
     def pretty_print_pH_mV_values(self, ph_values: dict[str, float], probe_to_pump):
         rounded_ph_values = {k: "{:.2f}".format(v) for k, v in ph_values.items()}
         rounded_ph_values_with_pump = {(f"pump {probe_to_pump[k]}"): v for k, v in rounded_ph_values.items()}
         print(rounded_ph_values_with_pump)
 
     def get_probe_to_pump(self, ph_probes, protocol_path):
-        protocol = pandas.read_excel(protocol_path)
-        probe_to_pump = {}
-        for probe in ph_probes:
-            rows_with_probe = protocol[protocol["pH probe"] == probe]  # Normally only one
-            associated_pump = rows_with_probe["Pump"].iloc[0]
-            probe_to_pump[probe] = associated_pump
-        return probe_to_pump
+        protocol = load_protocol(protocol_path)
+        return {probe: protocol.probe_to_pump[probe] for probe in ph_probes}
 
     def pump_liquid(self, protocol_path: str):
         pumps_used_in_protocol = self.get_pumps_used_in_protocol(protocol_path)
@@ -275,10 +313,7 @@ class ClientCLI:
 
     def get_pumps_used_in_protocol(self, protocol_path: str):
         if os.path.exists(protocol_path):
-            selected_protocol = pandas.read_excel(protocol_path)
-            pumps_used_in_protocol: list[str] = list(set(selected_protocol["Pump"].to_list()))
-            pumps_used_in_protocol.sort()
-            return pumps_used_in_protocol
+            return list(load_protocol(protocol_path).pumps)
         else:
             return []
 
@@ -0,0 +1,198 @@
+# Compares controllers with other queue lengths and allowed deltas than DerivativeControllerWithMemory, without a run
+# of several days. The controllers are replayed on models of the samples: either fitted to recorded results, or made
+# from a protocol and the simulation settings. Each combination of parameters is replayed in a worker process.
+# Run from the root of the repository, e.g.:
+# python ControllerSweep.py --results run_results.xlsx --queue-lengths 3 5 8 --max-allowed-deltas 0.005 0.01 0.02
+import argparse
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from Controllers import ControllerBank, DerivativeControllerWithMemory
+from ProtocolLoader import load_protocol
+from ResultsJournal import load_journal
+
+SWEEP_COLUMNS = ["QueueLength", "MaxAllowedDelta", "MeanAbsoluteError", "RootMeanSquareError", "PumpCommands", "Pumps"]
+
+
+@dataclass(frozen=True)
+class ControllerParameters:
+    queue_length: int = DerivativeControllerWithMemory.QUEUE_LENGTH
+    max_allowed_delta: float = DerivativeControllerWithMemory.MAX_ALLOWED_DELTA
+
+
+@dataclass(frozen=True)
+class SampleModel:
+    # How the pH of a sample changes: it rises with each pump and falls with time, like the SimulatedPlant.
+    initial_ph: float
+    ph_increase_per_pump: float
+    acid_production_in_ph_per_hour: float
+    measurement_noise_in_ph: float = 0.0
+
+
+@dataclass(frozen=True)
+class ReplayTrace:
+    # The steps of one task to replay, with the time of each step and the pH expected at it.
+    name: str
+    minutes: np.ndarray  # Since the start of the run
+    expected_ph: np.ndarray
+    sample: SampleModel
+
+
+def fit_sample_model(task_records: pd.DataFrame) -> SampleModel:
+    # The change in pH between two steps is the pumps of the first step times the rise per pump, minus the acid
+    # produced in the time between them, which is fitted by least squares.
+    task_records = task_records.dropna(subset=["ActualPH"])
+    hours = (task_records["TimePoint"] - task_records["TimePoint"].iloc[0]).dt.total_seconds().to_numpy()/3600
+    actual_ph = task_records["ActualPH"].to_numpy()
+    pumps = task_records["PumpMultiplier"].to_numpy(dtype=np.float64)
+    ph_changes = np.diff(actual_ph)
+    predictors = np.column_stack([pumps[:-1], -np.diff(hours)])
+    (ph_increase_per_pump, acid_production), _, _, _ = np.linalg.lstsq(predictors, ph_changes, rcond=None)
+    residual_changes = ph_changes - predictors @ [ph_increase_per_pump, acid_production]
+    return SampleModel(initial_ph=actual_ph[0],
+                       ph_increase_per_pump=max(0.0, ph_increase_per_pump),
+                       acid_production_in_ph_per_hour=acid_production,
+                       measurement_noise_in_ph=residual_changes.std()/np.sqrt(2))  # Each change has two measurements
+
+
+def load_results(results_path: str) -> pd.DataFrame:
+    if results_path.endswith(".csv"):
+        return load_journal(results_path)
+    return pd.read_excel(results_path)
+
+
+def get_traces_from_results(results_path: str) -> List[ReplayTrace]:
+    # One trace per task, at the time points and expected pH of the recorded steps
+    records = load_results(results_path)
+    start_time = records["TimePoint"].iloc[0]
+    traces = []
+    for pump_id, task_records in records.groupby("PumpTask"):
+        if len(task_records.dropna(subset=["ActualPH"]).index) < 3:
+            continue  # Too few steps to fit a model of the sample
+        traces.append(ReplayTrace(name=f"{os.path.basename(results_path)}:{pump_id}",
+                                  minutes=(task_records["TimePoint"] - start_time).dt.total_seconds().to_numpy()/60,
+                                  expected_ph=task_records["ExpectedPH"].to_numpy(dtype=np.float64),
+                                  sample=fit_sample_model(task_records)))
+    return traces
+
+
+def get_traces_from_protocol(protocol_path: str, simulation_settings: dict) -> List[ReplayTrace]:
+    # One trace per task, with a step every minimum delay, and the samples of the simulation settings.
+    traces = []
+    for task in load_protocol(protocol_path).tasks:
+        if task.on_or_off == 0:
+            continue
+        minutes, expected_ph = [], []
+        segment_start = 0.0
+        for segment in task.segments:
+            segment_minutes = np.arange(0, segment.task_time, segment.minimum_delay)
+            minutes.append(segment_start + segment_minutes)
+            expected_ph.append(segment.ph_at_start + (segment.ph_at_end - segment.ph_at_start)*segment_minutes/segment.task_time)
+            segment_start += segment.task_time
+        sample = SampleModel(initial_ph=simulation_settings["InitialPH"],
+                             ph_increase_per_pump=simulation_settings["PHIncreasePerMicroLiterOfBase"]*task.segments[0].dose_volume,
+                             acid_production_in_ph_per_hour=simulation_settings["AcidProductionInPHPerHour"],
+                             measurement_noise_in_ph=simulation_settings["MeasurementNoiseInPH"])
+        traces.append(ReplayTrace(name=f"{os.path.basename(protocol_path)}:{task.pump_id}",
+                                  minutes=np.concatenate(minutes), expected_ph=np.concatenate(expected_ph), sample=sample))
+    return traces
+
+
+def replay(traces: List[ReplayTrace], parameters: ControllerParameters, adaptive_pumping_after_hours: float = 0.0,
+           random_seed: int = 0) -> dict:
+    # Replays the controllers of all the traces step by step, with the controllers of the traces that have a step
+    # at that index calculated in one call to a ControllerBank. Like in the Scheduler, a task pumps once when it is
+    # below the expected pH until the adaptive pumping is activated.
+    bank = ControllerBank(len(traces), parameters.queue_length, parameters.max_allowed_delta)
+    indices = np.array([bank.add_controller() for _ in traces], dtype=np.int64)
+    random_generator = random.Random(random_seed)
+    ph = np.array([trace.sample.initial_ph for trace in traces])
+    ph_increase_per_pump = np.array([trace.sample.ph_increase_per_pump for trace in traces])
+    acid_production = np.array([trace.sample.acid_production_in_ph_per_hour for trace in traces])
+    last_minutes = np.zeros(len(traces))
+    errors = []
+    pump_commands, pumps = 0, 0
+    for step in range(max(len(trace.minutes) for trace in traces)):
+        is_active = np.array([step < len(trace.minutes) for trace in traces])
+        active = indices[is_active]
+        minutes = np.array([trace.minutes[step] for trace in traces if step < len(trace.minutes)])
+        expected_ph = np.array([trace.expected_ph[step] for trace in traces if step < len(trace.minutes)])
+        ph[active] -= (minutes - last_minutes[active])/60*acid_production[active]
+        last_minutes[active] = minutes
+        noise = [random_generator.gauss(0, traces[index].sample.measurement_noise_in_ph) for index in active]
+        measured_ph = ph[active] + noise
+
+        number_of_pumps = (measured_ph < expected_ph).astype(np.int64)
+        is_adaptive = (adaptive_pumping_after_hours <= 0) | (adaptive_pumping_after_hours*60 < minutes)
+        if is_adaptive.any():
+            number_of_pumps[is_adaptive] = bank.calculate_outputs(active[is_adaptive], expected_ph[is_adaptive],
+                                                                  measured_ph[is_adaptive])
+        ph[active] += number_of_pumps*ph_increase_per_pump[active]
+        errors.append(measured_ph - expected_ph)
+        pump_commands += int((0 < number_of_pumps).sum())
+        pumps += int(number_of_pumps.sum())
+
+    errors = np.concatenate(errors)
+    return {"QueueLength": parameters.queue_length,
+            "MaxAllowedDelta": parameters.max_allowed_delta,
+            "MeanAbsoluteError": np.abs(errors).mean(),
+            "RootMeanSquareError": np.sqrt((errors**2).mean()),
+            "PumpCommands": pump_commands,
+            "Pumps": pumps}
+
+
+def sweep(traces: List[ReplayTrace], parameter_grid: List[ControllerParameters], adaptive_pumping_after_hours: float = 0.0,
+          max_workers: Optional[int] = None, random_seed: int = 0) -> pd.DataFrame:
+    # One row per combination of parameters, best tracking first. The noise is the same for every combination.
+    arguments = [(traces, parameters, adaptive_pumping_after_hours, random_seed) for parameters in parameter_grid]
+    if max_workers == 1:
+        results = [replay(*replay_arguments) for replay_arguments in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(replay, *zip(*arguments)))
+    return pd.DataFrame(results, columns=SWEEP_COLUMNS).sort_values("MeanAbsoluteError", ignore_index=True)
+
+
+def get_parameter_grid(queue_lengths: List[int], max_allowed_deltas: List[float]) -> List[ControllerParameters]:
+    return [ControllerParameters(queue_length, max_allowed_delta)
+            for queue_length, max_allowed_delta in itertools.product(queue_lengths, max_allowed_deltas)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays the controllers with different parameters")
+    parser.add_argument("--results", nargs="*", default=[], help="Results files (.xlsx) or journals (.csv) of runs")
+    parser.add_argument("--protocols", nargs="*", default=[], help="Protocols replayed with the simulation settings")
+    parser.add_argument("--queue-lengths", nargs="+", type=int, default=[DerivativeControllerWithMemory.QUEUE_LENGTH])
+    parser.add_argument("--max-allowed-deltas", nargs="+", type=float,
+                        default=[DerivativeControllerWithMemory.MAX_ALLOWED_DELTA])
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, the number of CPUs by default")
+    parser.add_argument("--config", default="config.yml")
+    parser.add_argument("--output", default=None, help="Saves the results as csv")
+    arguments = parser.parse_args()
+
+    with open(arguments.config, "r") as file:
+        settings = yaml.safe_load(file)
+    traces = [trace for results_path in arguments.results for trace in get_traces_from_results(results_path)]
+    traces += [trace for protocol_path in arguments.protocols
+               for trace in get_traces_from_protocol(protocol_path, settings["simulation"])]
+    if len(traces) == 0:
+        parser.error("No results or protocols to replay")
+    print(f"Replaying {len(traces)} tasks")
+    results = sweep(traces, get_parameter_grid(arguments.queue_lengths, arguments.max_allowed_deltas),
+                    settings["scheduler"]["AdaptivePumpingActivateAfterNHours"], arguments.workers,
+                    settings["simulation"]["RandomSeed"])
+    print(results.to_string(index=False))
+    if arguments.output is not None:
+        results.to_csv(arguments.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import math
 import queue
 
+import numpy as np
+
+
 class DerivativeControllerWithMemory:
 
     last_pump_amount = 0
@@ -50,4 +53,289 @@ class DerivativeControllerWithMemory:
         totalIncrease = (queue_values[self.QUEUE_LENGTH - 1] - queue_values[0])
         return totalIncrease < 5*self.MAX_ALLOWED_DELTA
 
+    def reset(self) -> None:
+        # Forgets everything, like a new controller
+        self.measured_values = queue.Queue()
+        self.last_pump_amount = 0
+
+    # Called when its task starts on its next segment (task period). The pumping of a segment says nothing about the
+    # next one, so it starts over.
+    def start_new_segment(self) -> None:
+        self.reset()
+
+    # The state is what the controller remembers, used when saving the state of a run, e.g. in a checkpoint.
+    def get_state(self) -> dict:
+        return {"measured_values": list(self.measured_values.queue), "last_pump_amount": self.last_pump_amount}
+
+    def set_state(self, state: dict) -> None:
+        self.measured_values = queue.Queue()
+        for measured_value in state["measured_values"]:
+            self.measured_values.put(measured_value)
+        self.last_pump_amount = state["last_pump_amount"]
+
+
+
+
+class CompactDerivativeControllerWithMemory:
+    # Gives the same outputs as DerivativeControllerWithMemory, but the last measurements are stored in a fixed size
+    # list used as a ring buffer instead of a queue.Queue, which comes with a lock and three conditions.
+    # Together with __slots__, this makes the controller much smaller, which matters when there are many tasks.
+
+    __slots__ = ("measured_values", "oldest_index", "last_pump_amount")
+
+    QUEUE_LENGTH = DerivativeControllerWithMemory.QUEUE_LENGTH
+    MAX_ALLOWED_DELTA = DerivativeControllerWithMemory.MAX_ALLOWED_DELTA
+
+    def __init__(self):
+        self.measured_values: list[float] = []
+        self.oldest_index = 0
+        self.last_pump_amount = 0
+
+    def calculate_output(self, setpoint, measured_value: float) -> int:
+        if len(self.measured_values) == 0:  # Initialisation. Only run once.
+            self.measured_values = [measured_value]*self.QUEUE_LENGTH
+
+        last_measurement = self.measured_values[self.oldest_index - 1]
+        delta_measurement = measured_value - last_measurement
+        self.measured_values[self.oldest_index] = measured_value  # Replaces the oldest measurement
+        self.oldest_index = (self.oldest_index + 1) % self.QUEUE_LENGTH
+        if measured_value < setpoint:
+            if delta_measurement < self.MAX_ALLOWED_DELTA or 0.5 < (setpoint - measured_value):
+                if self.within_allowed_delta_over_time_period():
+                    self.last_pump_amount += 1
+            elif 0 < self.last_pump_amount and not self.within_allowed_delta_over_time_period():
+                self.last_pump_amount += -1
+        elif self.MAX_ALLOWED_DELTA*5 < measured_value - setpoint:
+            self.last_pump_amount = max(0, math.floor(self.last_pump_amount*0.5))
+        else:
+            self.last_pump_amount = max(0, self.last_pump_amount - 1)
+        return self.last_pump_amount
+
+    def within_allowed_delta_over_time_period(self) -> bool:
+        newest_value = self.measured_values[self.oldest_index - 1]
+        totalIncrease = newest_value - self.measured_values[self.oldest_index]
+        return totalIncrease < 5*self.MAX_ALLOWED_DELTA
+
+    def reset(self) -> None:
+        self.measured_values = []
+        self.oldest_index = 0
+        self.last_pump_amount = 0
+
+    def start_new_segment(self) -> None:
+        self.reset()
+
+    def get_state(self) -> dict:
+        # Oldest measurement first, like DerivativeControllerWithMemory
+        measured_values = self.measured_values[self.oldest_index:] + self.measured_values[:self.oldest_index]
+        return {"measured_values": measured_values, "last_pump_amount": self.last_pump_amount}
+
+    def set_state(self, state: dict) -> None:
+        self.measured_values = list(state["measured_values"])
+        self.oldest_index = 0
+        self.last_pump_amount = state["last_pump_amount"]
+
+
+class ModelBasedController:
+    # Calculates the number of pumps from a model of the sample, instead of changing it by one pump per step like
+    # DerivativeControllerWithMemory. The model is that between two steps, the pH rises by ph_increase_per_pump for
+    # each pump and falls by acid_per_step, the acid produced by the bacteria. Both are estimated from the measurements
+    # by recursive least squares, forgetting old steps so that it follows the bacteria when they produce more acid.
+    # It only pumps when the pH is predicted to fall clearly below the expected pH at the next step, and then pumps
+    # what is needed to bring it just above it in one step, so that fewer but larger doses are pumped.
+    # Until the pH has been seen to rise by pumping, it pumps once when below the expected pH.
+
+    __slots__ = ("last_measured_value", "last_setpoint", "last_pump_amount", "ph_increase_per_pump", "acid_per_step",
+                 "covariance")
+
+    FORGETTING_FACTOR = 0.97  # The weight of a step compared to the step after it
+    INITIAL_VARIANCE = 1.0  # How uncertain the initial estimates are
+    MINIMUM_PH_INCREASE_PER_PUMP = 0.001  # Below this, pumping is not known to raise the pH, e.g. when the tubes are filling
+    MAX_PUMPS_PER_STEP = 10
+    ALLOWED_PH_BELOW_SETPOINT = 0.02  # How far below the expected pH the pH may be predicted to fall without pumping
+    TARGET_PH_ABOVE_SETPOINT = 0.01  # What the dose aims for, so that the next dose is not needed right away
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.last_measured_value = float("NaN")
+        self.last_setpoint = float("NaN")
+        self.last_pump_amount = 0
+        self.ph_increase_per_pump = 0.0
+        self.acid_per_step = 0.0
+        self.covariance = [self.INITIAL_VARIANCE, 0.0, 0.0, self.INITIAL_VARIANCE]  # 2x2, row by row
+
+    def start_new_segment(self) -> None:
+        # The sample is the same, so the model learned of it is kept. Only the last step is forgotten, as the expected
+        # pH of the new segment is another line, and its first step is handled like the first step of the task.
+        self.last_measured_value = float("NaN")
+        self.last_setpoint = float("NaN")
+        self.last_pump_amount = 0
+
+    def calculate_output(self, setpoint, measured_value: float) -> int:
+        if math.isnan(measured_value):  # Nothing is pumped when the pH could not be measured
+            return 0
+        if not math.isnan(self.last_measured_value):
+            self.update_model(measured_value - self.last_measured_value)
+        # The expected pH usually changes as much until the next step as it did since the last one
+        next_setpoint = setpoint if math.isnan(self.last_setpoint) else 2*setpoint - self.last_setpoint
+        predicted_value = measured_value - self.acid_per_step  # At the next step, if nothing is pumped
+        if self.ph_increase_per_pump < self.MINIMUM_PH_INCREASE_PER_PUMP:
+            amount_to_pump = 1 if measured_value < setpoint else 0
+        elif next_setpoint - self.ALLOWED_PH_BELOW_SETPOINT <= predicted_value:
+            amount_to_pump = 0
+        else:
+            needed_ph_increase = next_setpoint + self.TARGET_PH_ABOVE_SETPOINT - predicted_value
+            amount_to_pump = min(self.MAX_PUMPS_PER_STEP, max(1, round(needed_ph_increase/self.ph_increase_per_pump)))
+        self.last_measured_value = measured_value
+        self.last_setpoint = setpoint
+        self.last_pump_amount = amount_to_pump
+        return amount_to_pump
+
+    def update_model(self, ph_change: float) -> None:
+        # One step of recursive least squares of ph_change = ph_increase_per_pump*pumps - acid_per_step
+        x0, x1 = self.last_pump_amount, -1.0
+        p00, p01, p10, p11 = self.covariance
+        px0, px1 = p00*x0 + p01*x1, p10*x0 + p11*x1
+        gain_denominator = self.FORGETTING_FACTOR + x0*px0 + x1*px1
+        k0, k1 = px0/gain_denominator, px1/gain_denominator
+        error = ph_change - (self.ph_increase_per_pump*x0 + self.acid_per_step*x1)
+        self.ph_increase_per_pump = max(0.0, self.ph_increase_per_pump + k0*error)
+        self.acid_per_step += k1*error
+        xp0, xp1 = x0*p00 + x1*p10, x0*p01 + x1*p11
+        self.covariance = [(p00 - k0*xp0)/self.FORGETTING_FACTOR, (p01 - k0*xp1)/self.FORGETTING_FACTOR,
+                           (p10 - k1*xp0)/self.FORGETTING_FACTOR, (p11 - k1*xp1)/self.FORGETTING_FACTOR]
+
+    def get_state(self) -> dict:
+        return {"last_measured_value": self.last_measured_value, "last_setpoint": self.last_setpoint,
+                "last_pump_amount": self.last_pump_amount, "ph_increase_per_pump": self.ph_increase_per_pump,
+                "acid_per_step": self.acid_per_step, "covariance": list(self.covariance)}
+
+    def set_state(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, list(value) if name == "covariance" else value)
+
+
+class ControllerBank:
+    # The memory of the controllers of many tasks in one place: the last measurements of controller i are row i of
+    # a numpy array used as a ring buffer. calculate_outputs runs the controllers of any set of tasks in one call,
+    # giving the same outputs as a DerivativeControllerWithMemory per task. A task uses its row through a
+    # BankedController, which works like the other controllers.
+
+    QUEUE_LENGTH = DerivativeControllerWithMemory.QUEUE_LENGTH
+    MAX_ALLOWED_DELTA = DerivativeControllerWithMemory.MAX_ALLOWED_DELTA
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY, queue_length: int = QUEUE_LENGTH,
+                 max_allowed_delta: float = MAX_ALLOWED_DELTA):
+        # Other queue lengths and allowed deltas than those of DerivativeControllerWithMemory can be used,
+        # e.g. when comparing controllers, see ControllerSweep.
+        self.queue_length = queue_length
+        self.max_allowed_delta = max_allowed_delta
+        self.measured_values = np.zeros((capacity, queue_length), dtype=np.float64)
+        self.oldest_indices = np.zeros(capacity, dtype=np.int64)
+        self.last_pump_amounts = np.zeros(capacity, dtype=np.int64)
+        self.is_initialized = np.zeros(capacity, dtype=bool)  # Whether a controller has had its first measurement
+        self.number_of_controllers = 0
+
+    def __len__(self) -> int:
+        return self.number_of_controllers
+
+    def add_controller(self) -> int:
+        # Returns the index of the new controller. The arrays grow by doubling, like a list.
+        if self.number_of_controllers == len(self.oldest_indices):
+            capacity = max(1, 2*len(self.oldest_indices))
+            self.measured_values = np.resize(self.measured_values, (capacity, self.queue_length))
+            self.oldest_indices = np.resize(self.oldest_indices, capacity)
+            self.last_pump_amounts = np.resize(self.last_pump_amounts, capacity)
+            self.is_initialized = np.resize(self.is_initialized, capacity)
+        index = self.number_of_controllers
+        self.reset_controller(index)
+        self.number_of_controllers += 1
+        return index
+
+    def reset_controller(self, index: int) -> None:
+        self.oldest_indices[index] = 0
+        self.last_pump_amounts[index] = 0
+        self.is_initialized[index] = False
+
+    def create_controller(self) -> 'BankedController':
+        return BankedController(self, self.add_controller())
+
+    def calculate_outputs(self, indices, setpoints, measured_values) -> np.ndarray:
+        # The number of pumps of each of the controllers, which must all be different.
+        indices = np.asarray(indices, dtype=np.int64)
+        setpoints = np.asarray(setpoints, dtype=np.float64)
+        measured_values = np.asarray(measured_values, dtype=np.float64)
+
+        # Initialisation. Only run once per controller.
+        is_new = ~self.is_initialized[indices]
+        self.measured_values[indices[is_new]] = measured_values[is_new, np.newaxis]
+        self.is_initialized[indices] = True
+
+        oldest_indices = self.oldest_indices[indices]
+        last_measurements = self.measured_values[indices, (oldest_indices - 1) % self.queue_length]
+        delta_measurements = measured_values - last_measurements
+        self.measured_values[indices, oldest_indices] = measured_values  # Replaces the oldest measurements
+        oldest_indices = (oldest_indices + 1) % self.queue_length
+        self.oldest_indices[indices] = oldest_indices
+        total_increases = measured_values - self.measured_values[indices, oldest_indices]
+        within_allowed_delta = total_increases < 5*self.max_allowed_delta
+
+        # The same cases as in DerivativeControllerWithMemory.calculate_output. NaN measurements are in none of the
+        # cases below the setpoint or far above it, like in the controller.
+        pump_amounts = self.last_pump_amounts[indices]
+        is_below = measured_values < setpoints
+        is_slow_increase = (delta_measurements < self.max_allowed_delta) | (0.5 < setpoints - measured_values)
+        should_increase = is_below & is_slow_increase & within_allowed_delta
+        should_decrease = is_below & ~is_slow_increase & (0 < pump_amounts) & ~within_allowed_delta
+        is_far_above = ~is_below & (self.max_allowed_delta*5 < measured_values - setpoints)
+        is_near_above = ~is_below & ~is_far_above
+        pump_amounts = pump_amounts + should_increase - should_decrease
+        pump_amounts = np.where(is_far_above, np.maximum(0, pump_amounts // 2), pump_amounts)
+        pump_amounts = np.where(is_near_above, np.maximum(0, pump_amounts - 1), pump_amounts)
+        self.last_pump_amounts[indices] = pump_amounts
+        return pump_amounts
+
+    def get_state(self, index: int) -> dict:
+        # Oldest measurement first, like DerivativeControllerWithMemory
+        measured_values = []
+        if self.is_initialized[index]:
+            measured_values = np.roll(self.measured_values[index], -self.oldest_indices[index]).tolist()
+        return {"measured_values": measured_values, "last_pump_amount": int(self.last_pump_amounts[index])}
+
+    def set_state(self, index: int, state: dict) -> None:
+        self.reset_controller(index)
+        if 0 < len(state["measured_values"]):
+            self.measured_values[index] = state["measured_values"]
+            self.is_initialized[index] = True
+        self.last_pump_amounts[index] = state["last_pump_amount"]
+
+
+class BankedController:
+    # A controller stored in a ControllerBank, used by a task like the other controllers.
+
+    __slots__ = ("bank", "index")
+
+    def __init__(self, bank: ControllerBank, index: int):
+        self.bank = bank
+        self.index = index
+
+    def calculate_output(self, setpoint, measured_value: float) -> int:
+        return self.bank.calculate_outputs([self.index], [setpoint], [measured_value])[0].item()
+
+    @property
+    def last_pump_amount(self) -> int:
+        return int(self.bank.last_pump_amounts[self.index])
+
+    def reset(self) -> None:
+        self.bank.reset_controller(self.index)
+
+    def start_new_segment(self) -> None:
+        self.reset()
+
+    def get_state(self) -> dict:
+        return self.bank.get_state(self.index)
 
+    def set_state(self, state: dict) -> None:
+        self.bank.set_state(self.index, state)
@@ -0,0 +1,94 @@
+import datetime
+import heapq
+from typing import List
+
+from PumpTasks import PumpTask
+from RecordStore import RecordStore
+from Scheduler import Scheduler
+from StepTimings import StepTiming
+
+# What reading a pH module and pumping once cost before any steps have been timed, in seconds of serial time.
+# These are the waits after sending a command to the ph-meter and to the pumps.
+INITIAL_READ_SECONDS = 1.0
+INITIAL_PUMP_SECONDS = 0.5
+# How much each new step counts in the predictions, compared to the steps before it
+PREDICTION_WEIGHT_OF_NEW_STEP = 0.1
+
+
+class DeadlineScheduler(Scheduler):
+    # Scheduler that handles the ready tasks in the order of their deadlines instead of the order they were scheduled
+    # in (earliest deadline first). The deadline of a step is its scheduled time plus the minimum delay of the task,
+    # after which the next dosing window has been missed. A task with a short minimum delay is thus handled before
+    # a task with a long one that has been waiting for a bit.
+    # When the ph-meter and the pumps cannot keep up, it predicts how long it takes to handle the ready tasks,
+    # using how long reading a module and pumping have taken so far. If module batching is enabled, the tasks using
+    # the same pH module that become ready before then would have to wait anyway, so they share the reading of the
+    # module instead of needing one more. Like in the Scheduler, no task is measured before it is due otherwise.
+
+    def __init__(self, scheduler_settings: dict, physical_systems) -> None:
+        super().__init__(scheduler_settings, physical_systems)
+        self.predicted_read_seconds = INITIAL_READ_SECONDS
+        self.predicted_pump_seconds = INITIAL_PUMP_SECONDS
+        self.predicted_number_of_pumps: dict[int, float] = dict()  # per pump
+
+    def get_next_tasks(self, task_queue: List[PumpTask]) -> List[PumpTask]:
+        task_queue[0].wait_until_time_to_execute_task()
+        current_time = self.timer.now()
+        ready_tasks_by_module = self.get_ready_tasks_by_module(task_queue, current_time)
+        module_id = min(ready_tasks_by_module, key=lambda module: self.get_deadline_of_tasks(ready_tasks_by_module[module]))
+
+        # Tasks of the module that are ready before the other ready tasks have been handled share the reading.
+        backlog_in_seconds = sum(self.predict_seconds_to_handle(tasks) for tasks in ready_tasks_by_module.values())
+        window_in_seconds = self.settings["scheduler"]["ModuleBatchingWindowInSeconds"]
+        if 0 < window_in_seconds:
+            window_in_seconds = max(window_in_seconds, backlog_in_seconds)
+        latest_time = current_time + datetime.timedelta(seconds=window_in_seconds)
+        tasks = [task for task in task_queue if task.ph_meter_id[0] == module_id and task.time_next_operation <= latest_time]
+        ids_of_tasks = {id(task) for task in tasks}  # Like in get_tasks_sharing_module_read
+        task_queue[:] = [task for task in task_queue if id(task) not in ids_of_tasks]
+        heapq.heapify(task_queue)
+        tasks.sort(key=self.get_deadline)
+
+        if self.settings["scheduler"]['ShouldPrintSchedulingMessages']:
+            print(f"Tasks: {[task.pump_id for task in tasks]}, at: {current_time}, deadline: {self.get_deadline(tasks[0])}, "
+                  f"predicted seconds to handle the ready tasks: {round(backlog_in_seconds, 1)}")
+        return tasks
+
+    def get_ready_tasks_by_module(self, task_queue: List[PumpTask], current_time: datetime.datetime) -> dict[str, List[PumpTask]]:
+        ready_tasks_by_module = dict()
+        for task in task_queue:
+            if task.time_next_operation <= current_time:
+                ready_tasks_by_module.setdefault(task.ph_meter_id[0], []).append(task)
+        return ready_tasks_by_module
+
+    def get_deadline(self, task: PumpTask) -> datetime.datetime:
+        return task.time_next_operation + datetime.timedelta(minutes=task.minimum_delay)
+
+    def get_deadline_of_tasks(self, tasks: List[PumpTask]) -> (datetime.datetime, int):
+        # Ties are broken by the pump id, like the tasks in the queue
+        return min((self.get_deadline(task), task.pump_id) for task in tasks)
+
+    def predict_seconds_to_handle(self, tasks: List[PumpTask]) -> float:
+        # One reading of the module, and the pumping of each task, if it is not done in the background.
+        seconds = self.predicted_read_seconds
+        if not self.settings["scheduler"]["ShouldPumpInBackground"]:
+            seconds += sum(self.predicted_pump_seconds*self.predicted_number_of_pumps.get(task.pump_id, 1) for task in tasks)
+        return seconds
+
+    # The predictions are updated using each finished step
+
+    def finish_step(self, current_task: PumpTask, expected_ph: float, measured_ph: float, number_of_pumps: int,
+                    records: RecordStore, task_queue: List[PumpTask], results_file_path: str,
+                    step_timing: StepTiming) -> None:
+        self.predicted_number_of_pumps[current_task.pump_id] = \
+            self.get_updated_prediction(self.predicted_number_of_pumps.get(current_task.pump_id, 1), number_of_pumps)
+        if 0 < step_timing.measure_seconds:  # Otherwise, the reading was made for another task
+            self.predicted_read_seconds = self.get_updated_prediction(self.predicted_read_seconds, step_timing.measure_seconds)
+        if 0 < number_of_pumps and 0 < step_timing.pump_seconds:
+            self.predicted_pump_seconds = self.get_updated_prediction(self.predicted_pump_seconds,
+                                                                      step_timing.pump_seconds/number_of_pumps)
+        super().finish_step(current_task, expected_ph, measured_ph, number_of_pumps, records, task_queue,
+                            results_file_path, step_timing)
+
+    def get_updated_prediction(self, prediction: float, value: float) -> float:
+        return prediction + PREDICTION_WEIGHT_OF_NEW_STEP*(value - prediction)
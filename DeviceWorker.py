@@ -0,0 +1,51 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class DeviceWorker:
+    # Thread that owns one device (like the ph-meter or the pumps) and runs the commands sent to it one at a time,
+    # in the order they were sent. Each device has its own serial port, so the commands to different devices can run
+    # at the same time, e.g. one task can pump while another task is being measured.
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.commands: queue.Queue = queue.Queue()
+        self.thread: threading.Thread = None
+
+    def submit(self, function, *args) -> Future:
+        # Returns at once. The result (or the error) of the command can be found using the returned future.
+        future = Future()
+        self.start_if_not_running()
+        self.commands.put((future, function, args))
+        return future
+
+    def run(self, function, *args):
+        # Waits for the command to be run, and returns its result.
+        if threading.current_thread() is self.thread:  # Commands run by the worker itself would otherwise never start
+            return function(*args)
+        return self.submit(function, *args).result()
+
+    def start_if_not_running(self) -> None:
+        if self.thread is None or not self.thread.is_alive():
+            # It is a daemon thread, so that a worker waiting for commands never keeps the program from stopping.
+            self.thread = threading.Thread(target=self.handle_commands, name=self.name, daemon=True)
+            self.thread.start()
+
+    def handle_commands(self) -> None:
+        while True:
+            future, function, args = self.commands.get()
+            if function is None:  # Sent by stop
+                future.set_result(None)
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def stop(self) -> None:
+        # The commands already sent are run before the worker stops.
+        if self.thread is not None and self.thread.is_alive():
+            self.submit(None).result()
@@ -0,0 +1,45 @@
+import datetime
+import math
+from dataclasses import dataclass
+
+from PumpTasks import PumpTask
+
+
+@dataclass
+class InitialPhCorrection:
+    # The correction of the pH of one sample before a run starts, see Scheduler.run_ensure_correct_start_pH_value.
+    # It learns how much the pH of the sample rises per pump from the measurement after each dose, and uses it to
+    # decide how many times to pump and how long to wait before measuring again.
+    task: PumpTask
+    target_ph: float
+    time_next_check: datetime.datetime
+    last_measured_ph: float = float("NaN")
+    number_of_pumps_last_time: int = 0
+    ph_increase_per_pump: float = float("NaN")  # Unknown until the response to a dose has been measured
+
+    def is_done(self, measured_ph: float) -> bool:
+        return not math.isnan(measured_ph) and self.target_ph <= measured_ph
+
+    def update_ph_increase_per_pump(self, measured_ph: float) -> None:
+        if 0 < self.number_of_pumps_last_time and not math.isnan(self.last_measured_ph) and not math.isnan(measured_ph):
+            ph_increase_per_pump = (measured_ph - self.last_measured_ph)/self.number_of_pumps_last_time
+            if 0 < ph_increase_per_pump:  # Otherwise the base has not reached the sample yet, e.g. the tubes are filling
+                self.ph_increase_per_pump = ph_increase_per_pump
+        self.last_measured_ph = measured_ph
+
+    def get_number_of_pumps(self, measured_ph: float, maximum_number_of_pumps: int) -> int:
+        # As many as are expected to reach the target, so that the pH does not overshoot it.
+        if math.isnan(self.ph_increase_per_pump):
+            return maximum_number_of_pumps
+        number_of_pumps = math.ceil((self.target_ph - measured_ph)/self.ph_increase_per_pump)
+        return max(1, min(maximum_number_of_pumps, number_of_pumps))
+
+    def get_wait_in_seconds(self, measured_ph: float, minimum_wait: float, maximum_wait: float) -> float:
+        # A sample far from the target can get its next doses sooner, while the last dose before reaching the target
+        # gets the whole wait, so that the base is mixed into the sample before it is measured again.
+        if math.isnan(self.ph_increase_per_pump) or self.number_of_pumps_last_time == 0:
+            return maximum_wait
+        number_of_doses_left = (self.target_ph - measured_ph)/(self.ph_increase_per_pump*self.number_of_pumps_last_time)
+        if number_of_doses_left <= 1:
+            return maximum_wait
+        return max(minimum_wait, maximum_wait/number_of_doses_left)
@@ -124,6 +124,7 @@ class PhysicalSystemServer:
         protocol_probes = set([row["pH probe"] for row in protocol_rows])
         self.used_pumps = self.used_pumps - protocol_pumps
         self.used_probes = self.used_probes - protocol_probes
+        self.physical_system.disconnect(protocol)
         reply = "Done"
         return reply
 
@@ -148,7 +149,8 @@ class PhysicalSystemServer:
 
     def get_ph_values_of_selected_probes(self, received_message):
         selected_probes = json.loads(received_message[1])
-        ph_values = self.physical_system.get_ph_values_of_selected_probes(selected_probes)
+        should_use_cached_readings = self.get_should_use_cached_readings(received_message)
+        ph_values = self.physical_system.get_ph_values_of_selected_probes(selected_probes, should_use_cached_readings)
         reply = json.dumps(ph_values)
         return reply
 
@@ -160,10 +162,15 @@ class PhysicalSystemServer:
 
     def get_mv_values_of_selected_probes(self, received_message):
         selected_probes = json.loads(received_message[1])
-        mv_values = self.physical_system.get_mv_values_of_selected_probes(selected_probes)
+        should_use_cached_readings = self.get_should_use_cached_readings(received_message)
+        mv_values = self.physical_system.get_mv_values_of_selected_probes(selected_probes, should_use_cached_readings)
         reply = json.dumps(mv_values)
         return reply
 
+    def get_should_use_cached_readings(self, received_message) -> bool:
+        # Not sent by older clients, which then get the cached readings like before.
+        return json.loads(received_message[2]) if 2 < len(received_message) else True
+
     def set_and_get_address_for_current_pump(self, received_message):
         address = int(received_message[1])
         reply_address = self.physical_system.set_and_get_address_for_current_pump(address)
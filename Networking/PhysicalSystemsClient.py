@@ -1,5 +1,7 @@
 import json
 import random
+import time
+from concurrent.futures import Future
 from multiprocessing import Process
 
 import pandas as pd
@@ -72,19 +74,22 @@ class PhysicalSystemsClient(PhysicalSystemsInterface):
         self.send_and_receive(["pump", pump_id])
 
     # Ph
-    def get_mv_values_of_selected_probes(self, selected_probes: list[str]) -> dict[str, float]:
-        mv_values_json = self.send_and_receive(["get_mv_values_of_selected_probes", json.dumps(selected_probes)])
+    def get_mv_values_of_selected_probes(self, selected_probes: list[str],
+                                         should_use_cached_readings: bool = True) -> dict[str, float]:
+        mv_values_json = self.send_and_receive(["get_mv_values_of_selected_probes", json.dumps(selected_probes),
+                                                json.dumps(should_use_cached_readings)])
         mv_values = json.loads(mv_values_json)
         return mv_values
 
     def measure_ph_with_probe_associated_with_task(self, current_task: PumpTasks) -> float:
-        probe_id = f"{current_task.ph_meter_id[0]}_{current_task.ph_meter_id[1]}"
+        probe_id = current_task.get_ph_probe_id()
         ph_string = self.send_and_receive(["measure_ph_with_probe_associated_with_task", probe_id])
         ph = float(ph_string)
         return ph
 
-    def get_ph_values_of_selected_probes(self, ph_probes: list[str]) -> dict[str, float]:
-        ph_values_json = self.send_and_receive(["get_ph_values_of_selected_probes", json.dumps(ph_probes)])
+    def get_ph_values_of_selected_probes(self, ph_probes: list[str], should_use_cached_readings: bool = True) -> dict[str, float]:
+        ph_values_json = self.send_and_receive(["get_ph_values_of_selected_probes", json.dumps(ph_probes),
+                                                json.dumps(should_use_cached_readings)])
         ph_values = json.loads(ph_values_json)
         return ph_values
 
@@ -97,5 +102,13 @@ class PhysicalSystemsClient(PhysicalSystemsInterface):
     def pump_n_times(self, pump_id: int, pump_multiplier: int) -> None:
         self.send_and_receive(["pump_n_times", str(pump_id), str(pump_multiplier)])
 
+    def pump_n_times_in_background(self, pump_id: int, pump_multiplier: int) -> Future:
+        # The socket only allows one request at a time, so it pumps before returning.
+        future = Future()
+        time_started = time.time()
+        self.pump_n_times(pump_id, pump_multiplier)
+        future.set_result(time.time() - time_started)  # Like PhysicalSystems, the seconds it took to pump
+        return future
+
     def disconnect(self, protocol: pd.DataFrame) -> None:
         self.send_and_receive(["disconnect", protocol.to_json()])
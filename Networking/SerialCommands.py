@@ -53,6 +53,7 @@ class SerialReply:
     length_of_reply: bytes
     command_acted_upon: bytes
     reply_device_id: List[bytes]
-    data: bytes
+    data: Optional[bytes]  # None when the data has been decoded into mv_values instead
     checksum: bytes
+    mv_values: Optional[List[float]] = None  # The mV values of the four probes of a mV reply, in mV
 
@@ -0,0 +1,58 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from PhReadingBuffer import NUMBER_OF_PROBES_PER_MODULE
+
+
+class PhCalibrationTable:
+    # The calibration data of the probes compiled into the slope and intercept of the line from mV to pH of every
+    # probe, in arrays with a row per module and a column per channel. The pH of all four channels of a module, or of
+    # any set of probes, is then found in one numpy operation instead of one probe at a time.
+
+    def __init__(self, probe_calibration_data: dict[str, dict[str, float]]) -> None:
+        module_ids = list(dict.fromkeys(probe_id.split("_")[0] for probe_id in probe_calibration_data))
+        self.index_of_module = {module_id: index for index, module_id in enumerate(module_ids)}
+        self.slopes = np.full((len(module_ids), NUMBER_OF_PROBES_PER_MODULE), np.nan)
+        self.intercepts = np.full((len(module_ids), NUMBER_OF_PROBES_PER_MODULE), np.nan)
+        self.coefficients_of_probes: dict[str, Tuple[float, float]] = dict()  # Used when converting a single value
+        for probe_id, probe_calibration in probe_calibration_data.items():
+            module_index, channel_index = self.get_position_of_probe(probe_id)
+            ph_slope = (probe_calibration["LowPH"] - probe_calibration["HighPH"]) / \
+                       (probe_calibration["LowPHmV"] - probe_calibration["HighPHmV"])
+            ph_intercept = probe_calibration["LowPH"] - probe_calibration["LowPHmV"]*ph_slope
+            self.slopes[module_index, channel_index] = ph_slope
+            self.intercepts[module_index, channel_index] = ph_intercept
+            self.coefficients_of_probes[probe_id] = (ph_slope, ph_intercept)
+        self.positions_of_probes: dict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray]] = dict()
+
+    def get_position_of_probe(self, probe_id: str) -> Tuple[int, int]:
+        # The row of its module and the column of its channel, e.g. the channel of "F.0.1.22_2" is 1.
+        module_id, channel = probe_id.split("_")
+        return self.index_of_module[module_id], int(channel) - 1
+
+    def get_positions_of_probes(self, probe_ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        # Found once per set of probes, as the same probes are usually converted again and again.
+        key = tuple(probe_ids)
+        if key not in self.positions_of_probes:
+            for probe_id in probe_ids:
+                if probe_id not in self.coefficients_of_probes:
+                    raise KeyError(probe_id)
+            positions = [self.get_position_of_probe(probe_id) for probe_id in probe_ids]
+            self.positions_of_probes[key] = (np.array([module_index for module_index, _ in positions], dtype=np.int64),
+                                             np.array([channel_index for _, channel_index in positions], dtype=np.int64))
+        return self.positions_of_probes[key]
+
+    def convert_mv_value_to_ph_value(self, mv_value: float, probe_id: str) -> float:
+        ph_slope, ph_intercept = self.coefficients_of_probes[probe_id]
+        return ph_intercept + mv_value*ph_slope
+
+    def convert_mv_values_to_ph_values(self, mv_values: np.ndarray, probe_ids: List[str]) -> np.ndarray:
+        # The mV values of the probes, in the same order.
+        module_indices, channel_indices = self.get_positions_of_probes(probe_ids)
+        return self.intercepts[module_indices, channel_indices] + mv_values*self.slopes[module_indices, channel_indices]
+
+    def convert_mv_values_of_module_to_ph_values(self, mv_values: np.ndarray, module_id: str) -> np.ndarray:
+        # The mV values of the four channels of the module. A channel without a calibrated probe gets NaN.
+        module_index = self.index_of_module[module_id]
+        return self.intercepts[module_index] + mv_values*self.slopes[module_index]
@@ -1,11 +1,18 @@
+import struct
+import threading
 import time
-from typing import List
+from collections import Counter, deque
+from typing import Callable, List, Optional, Tuple
 
+import numpy as np
 import serial
 
 import Logger
+from PhCalibrationTable import PhCalibrationTable
+from PhReadingBuffer import PhReadingBuffer
 from PumpTasks import PumpTask
-from Networking.SerialCommands import PhSerialCommand, SerialReply
+from StepTimings import PERCENTILES
+from Networking.SerialCommands import LINE_END, PhSerialCommand, SerialReply
 from dataclasses import dataclass
 
 
@@ -21,6 +28,19 @@ class PhReadException(Exception):
     pass
 
 
+# A reply is the recipient, the length, the command acted upon, the four bytes of the device id, the data,
+# the checksum and a line end. The length counts the bytes from the command to the checksum.
+REPLY_HEADER = struct.Struct(">ccc4c")
+MINIMUM_REPLY_LENGTH = 6  # Without data
+FRAME_LENGTH_WITHOUT_DATA = REPLY_HEADER.size + 1 + 2
+MV_REPLY_FRAME_LENGTH = FRAME_LENGTH_WITHOUT_DATA + 8  # Two bytes per probe
+MAX_REPLY_FRAME_LENGTH = 255 + FRAME_LENGTH_WITHOUT_DATA - MINIMUM_REPLY_LENGTH
+MV_VALUES = struct.Struct(">4h")  # In 0.1 mV, in two's complement
+MV_VALUES_AND_CHECKSUM = struct.Struct(">4hc")  # The rest of a mV reply after the header, without the line end
+REPLY_POLL_INTERVAL_IN_SECONDS = 0.01  # About the time it takes to send a mV reply at 19200 baud
+RESPONSE_TIME_WINDOW = 10000  # The number of latest response times the statistics are made from
+
+
 class PhMeter:
 
     serial_connection = None
@@ -29,6 +49,26 @@ class PhMeter:
     def __init__(self, ph_meter_settings: dict, probe_calibration_data: dict[str, dict[str, int]]) -> None:
         self.settings = ph_meter_settings
         self.probe_calibration_data = probe_calibration_data
+        self.calibration_table = self.compile_calibration_data()
+        self.reply_buffer = bytearray(MAX_REPLY_FRAME_LENGTH)  # Reused for every reply
+        self.reply_view = memoryview(self.reply_buffer)
+        self.number_of_reply_bytes_read = 0  # The start of the reply, if wait_for_reply has read it into the buffer
+        # The latest reading of each module, together with the time it was read.
+        self.cached_module_readings: dict[str, (float, SerialReply)] = dict()
+        # The seconds from sending a command until the whole reply had arrived, see wait_for_reply
+        self.response_times: deque[float] = deque(maxlen=RESPONSE_TIME_WINDOW)
+        self.number_of_replies = 0
+        self.number_of_reply_timeouts = 0
+        self.corrupt_replies_of_modules: Counter[str] = Counter()  # Broken replies, e.g. with a wrong checksum
+        # Every reading, also those made by the poller, see start_polling
+        self.reading_buffer = PhReadingBuffer(self.settings["ReadingBufferSize"])
+        self.serial_lock = threading.Lock()  # Also for the callers that do not use the DeviceWorker of the ph-meter
+        self.readings_lock = threading.Lock()
+        self.invalidations_of_modules: Counter[str] = Counter()
+        self.polled_modules: List[str] = []
+        self.polling_thread: Optional[threading.Thread] = None
+        self.should_stop_polling = threading.Event()
+        self.run_polled_reading: Callable = lambda function, *args: function(*args)  # See start_polling
 
     def initialize_connection(self) -> None:
         self.serial_connection = serial.Serial(f'COM{self.settings["ComPort"]}',
@@ -47,43 +87,173 @@ class PhMeter:
         self.serial_connection.close()
 
     def measure_ph_with_probe_associated_with_task(self, current_task: PumpTask) -> float:
-        measured_ph = self.measure_ph_with_probe(f"{current_task.ph_meter_id[0]}_{current_task.ph_meter_id[1]}")
+        measured_ph = self.measure_ph_with_probe(current_task.get_ph_probe_id())
         return measured_ph
 
     def measure_ph_with_probe(self, probe_id: str) -> float:
-        try:
-            mv_response = self.get_mv_values_of_module(probe_id.split("_")[0])
-        except Exception as e:
-            # Something might be wrong with the serial connection, so it will try to measure again,
-            # and otherwise the calling program must handle the error.
-            Logger.standardLogger.log(e)
-            mv_response = self.get_mv_values_of_module(probe_id.split("_")[0])
+        # A broken reply is asked for again in request_mv_values_of_module, so that ReadRetries is the only number of
+        # retries. If the reading still fails, the calling program must handle the error.
+        mv_response = self.get_mv_values_of_module(probe_id.split("_")[0])
         if self.settings["ShouldPrintPhMeterMessages"]:
             print(f"Returned mv response: {mv_response}")
         measured_ph_value = self.get_ph_value_of_probe_from_mv_response(mv_response, probe_id)
         return measured_ph_value
 
-    def get_mv_values_of_module(self, module_id: str) -> SerialReply:
-        self.send_request_mv_command(module_id)
-        mv_response = self.read_mv_result()
+    def get_mv_values_of_module(self, module_id: str, should_use_cached_reading: bool = True) -> SerialReply:
+        # A reading asked for by the user, e.g. when live reading pH, is always made anew, but is still cached.
+        cached_mv_response = self.get_cached_reading_of_module(module_id) if should_use_cached_reading else None
+        if cached_mv_response is not None:
+            return cached_mv_response
+        invalidations = self.invalidations_of_modules[module_id]
+        mv_response = self.request_mv_values_of_module(module_id)
+        self.cache_reading_of_module(module_id, mv_response, invalidations)
+        return mv_response
+
+    def request_mv_values_of_module(self, module_id: str) -> SerialReply:
+        # A broken reply, e.g. one with a wrong checksum, is counted and the module is asked again, up to ReadRetries
+        # times, so that the reading usually succeeds within the same step. The wait before each retry is twice that
+        # of the one before, and what has arrived of the broken reply in the meantime is discarded, so that the next
+        # reply is read from its start.
+        # Every reading is added to the reading buffer.
+        number_of_retries = self.settings["ReadRetries"]
+        with self.serial_lock:
+            for retry in range(number_of_retries + 1):
+                if 0 < retry:
+                    self.timer.sleep(self.settings["ReadRetryBackoffInSeconds"]*2**(retry - 1))
+                    self.discard_unread_reply()
+                self.send_request_mv_command(module_id)
+                try:
+                    mv_response = self.read_mv_result()
+                except PhReadException:
+                    self.corrupt_replies_of_modules[module_id] += 1
+                    if retry == number_of_retries:
+                        raise
+                    continue
+                self.reading_buffer.add(self.timer.time(), module_id, mv_response.mv_values)
+                return mv_response
+
+    def cache_reading_of_module(self, module_id: str, mv_response: SerialReply, invalidations: int) -> None:
+        # A reading is not cached if its module was invalidated while it was read, e.g. by the poller while pumping.
+        with self.readings_lock:
+            if self.invalidations_of_modules[module_id] == invalidations:
+                self.cached_module_readings[module_id] = (self.timer.time(), mv_response)
+
+    # A reading of a module that is younger than the TTL is reused instead of asking the ph-meter again,
+    # as every request waits for the reply of the ph-meter. Setting the TTL to 0 disables this.
+    def get_cached_reading_of_module(self, module_id: str) -> Optional[SerialReply]:
+        if module_id not in self.cached_module_readings:
+            return None
+        time_of_reading, mv_response = self.cached_module_readings[module_id]
+        if self.settings["ReadingCacheTTLInSeconds"] <= self.timer.time() - time_of_reading:
+            return None
         return mv_response
 
+    # Should be called when the pH measured by the probe might have changed, e.g. after pumping into its sample.
+    def invalidate_cached_reading_of_probe(self, probe_id: str) -> None:
+        module_id = probe_id.split("_")[0]
+        with self.readings_lock:
+            self.invalidations_of_modules[module_id] += 1
+            self.cached_module_readings.pop(module_id, None)
+
+    # Polling
+
+    # The poller reads the modules one after the other in a thread of its own, each once per polling interval or as
+    # often as the ph-meter allows. Its readings are cached like any other, so the runs, the live reading of pH and
+    # the calibration can use them without waiting for the ph-meter while they are younger than the cache TTL.
+    # All the readings can be found in the reading buffer, without using the serial port.
+    def start_polling(self, module_ids: List[str], run_reading: Optional[Callable] = None) -> None:
+        # Adds the modules to those read by the poller, and starts it if it is not running. Each reading of the poller
+        # is run by run_reading, e.g. DeviceWorker.run of the ph-meter, so that it is queued with the other commands
+        # to the ph-meter, instead of taking the serial port in between them.
+        if run_reading is not None:
+            self.run_polled_reading = run_reading
+        for module_id in module_ids:
+            if module_id not in self.polled_modules:
+                self.polled_modules.append(module_id)
+        if self.polling_thread is None or not self.polling_thread.is_alive():
+            self.should_stop_polling.clear()
+            self.polling_thread = threading.Thread(target=self.poll_modules, name="ph-meter poller", daemon=True)
+            self.polling_thread.start()
+
+    def stop_polling(self) -> None:
+        # Waits for the reading in progress to finish. The polled modules are forgotten, so that a new run only polls
+        # the modules it uses.
+        self.should_stop_polling.set()
+        if self.polling_thread is not None:
+            self.polling_thread.join()
+            self.polling_thread = None
+        self.polled_modules = []
+
+    def is_polling(self) -> bool:
+        return self.polling_thread is not None and self.polling_thread.is_alive()
+
+    def poll_modules(self) -> None:
+        polling_interval = self.settings["PollingIntervalInSeconds"]
+        while not self.should_stop_polling.is_set():
+            time_started = time.monotonic()
+            for module_id in list(self.polled_modules):
+                if self.should_stop_polling.is_set():
+                    return
+                try:
+                    self.run_polled_reading(self.poll_module, module_id)
+                except Exception as e:  # The module is read again in the next round
+                    Logger.standardLogger.log(e)
+            self.should_stop_polling.wait(max(0.0, polling_interval - (time.monotonic() - time_started)))
+
+    def poll_module(self, module_id: str) -> None:
+        invalidations = self.invalidations_of_modules[module_id]
+        self.cache_reading_of_module(module_id, self.request_mv_values_of_module(module_id), invalidations)
+
+    def get_latest_mv_values_of_module(self, module_id: str) -> Optional[Tuple[float, np.ndarray]]:
+        # The time (like time.time()) and the mV values of the four probes of the latest reading of the module.
+        return self.reading_buffer.get_latest(module_id)
+
+    def get_latest_ph_values_of_module(self, module_id: str) -> Optional[Tuple[float, np.ndarray]]:
+        # The time and the pH of the four channels of the latest reading of the module, NaN for a channel without a
+        # calibrated probe.
+        latest_reading = self.reading_buffer.get_latest(module_id)
+        if latest_reading is None:
+            return None
+        time_of_reading, mv_values = latest_reading
+        try:
+            return time_of_reading, self.calibration_table.convert_mv_values_of_module_to_ph_values(mv_values, module_id)
+        except KeyError:
+            self.calibration_table = self.compile_calibration_data()
+            return time_of_reading, self.calibration_table.convert_mv_values_of_module_to_ph_values(mv_values, module_id)
+
+    def get_mv_readings_between(self, start_time: float, end_time: float,
+                                module_id: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # The times, module ids and mV values of the readings in the reading buffer between the times.
+        return self.reading_buffer.get_readings_between(start_time, end_time, module_id)
+
     def get_ph_value_of_probe_from_mv_response(self, mv_response: SerialReply, probe_id: str) -> float:
         selected_probe_mv_value = self.get_mv_values_of_probe(mv_response, probe_id)
         ph_value = self.convert_mv_value_to_ph_value(selected_probe_mv_value, probe_id)
         return ph_value
 
     def get_mv_values_of_probe(self, mv_response: SerialReply, probe_id: str) -> float:
-        mv_values = self.convert_raw_mv_bin_data_to_mv_values(mv_response.data)
-        selected_probe_mv_value = mv_values[int(probe_id.split("_")[1]) - 1]  # From 0 to 3
+        selected_probe_mv_value = mv_response.mv_values[int(probe_id.split("_")[1]) - 1]  # From 0 to 3
         return selected_probe_mv_value
 
     def convert_mv_value_to_ph_value(self, mv_value: float, probe_id: str) -> float:
-        probe_calibration = self.probe_calibration_data[probe_id]
-        ph_slope = (probe_calibration["LowPH"] - probe_calibration["HighPH"]) / \
-                   (probe_calibration["LowPHmV"] - probe_calibration["HighPHmV"])
-        ph_value = probe_calibration["LowPH"] + (mv_value - probe_calibration["LowPHmV"]) * ph_slope
-        return ph_value
+        try:
+            return self.calibration_table.convert_mv_value_to_ph_value(mv_value, probe_id)
+        except KeyError:
+            self.calibration_table = self.compile_calibration_data()
+            return self.calibration_table.convert_mv_value_to_ph_value(mv_value, probe_id)
+
+    def convert_mv_values_to_ph_values(self, mv_values: np.ndarray, probe_ids: List[str]) -> np.ndarray:
+        # All the probes in one numpy operation, see PhCalibrationTable.
+        try:
+            return self.calibration_table.convert_mv_values_to_ph_values(mv_values, probe_ids)
+        except KeyError:
+            self.calibration_table = self.compile_calibration_data()
+            return self.calibration_table.convert_mv_values_to_ph_values(mv_values, probe_ids)
+
+    def compile_calibration_data(self) -> PhCalibrationTable:
+        # Done when the calibration data is loaded or updated, and when a probe is not in the table, in case it has
+        # been added to the calibration data since. An unknown probe then gives a KeyError, like before compiling.
+        return PhCalibrationTable(self.probe_calibration_data if self.probe_calibration_data is not None else dict())
 
     # mv = milli_volts
     def send_request_mv_command(self, device_ID: str) -> None:
@@ -93,55 +263,134 @@ class PhMeter:
                                      command=mv_command_id,
                                      device_id=device_ID,
                                      information_bytes=list())
-        self.send_command(mv_command)
+        self.send_command(mv_command, MV_REPLY_FRAME_LENGTH)
 
     def read_mv_result(self) -> SerialReply:
+        # The whole reply is read into the reply buffer at once, instead of a byte at a time, and the header, the mV
+        # values and the checksum are then unpacked straight from the buffer, so that only the reply itself is copied
+        # from the serial connection. A reply of another length than a mV reply is broken.
         try:
             self.serial_connection.dtr = False
-            recipient = self.serial_connection.read()
-            number_of_bytes: bytes = self.serial_connection.read()
-            command_acted_upon = self.serial_connection.read()
-            reply_device_id = [self. serial_connection.read(), self.serial_connection.read(),
-                               self.serial_connection.read(), self.serial_connection.read()]
-            length = ord(number_of_bytes)
-            data = self.serial_connection.read((length - (1 + 4 + 1)))
-            checksum = self.serial_connection.read()
-            reply_end = self.serial_connection.read(2)
-            extra_reply = self.serial_connection.read_all()  # Sometimes it contains an extra \x00
+            reply_buffer = self.reply_buffer
+            number_of_bytes_read = self.number_of_reply_bytes_read
+            self.number_of_reply_bytes_read = 0
+            if number_of_bytes_read == 0:
+                number_of_bytes_read = self.read_into_reply_buffer(0, MV_REPLY_FRAME_LENGTH)
+            if number_of_bytes_read < 2 or self.get_frame_length(reply_buffer[1]) != MV_REPLY_FRAME_LENGTH:
+                raise PhReadException(f"Error when measuring ph. Got the start of a reply that is not a mV reply: {bytes(reply_buffer[:number_of_bytes_read])}")
+            if number_of_bytes_read < MV_REPLY_FRAME_LENGTH:
+                number_of_bytes_read += self.read_into_reply_buffer(number_of_bytes_read, MV_REPLY_FRAME_LENGTH - number_of_bytes_read)
+                if number_of_bytes_read < MV_REPLY_FRAME_LENGTH:
+                    raise PhReadException(f"Error when measuring ph. Got {number_of_bytes_read} of the {MV_REPLY_FRAME_LENGTH} bytes of the reply")
+            if reply_buffer[MV_REPLY_FRAME_LENGTH - 2] != LINE_END[0] or reply_buffer[MV_REPLY_FRAME_LENGTH - 1] != LINE_END[1]:
+                raise PhReadException(f"Error when measuring ph. The reply did not end with a line end: {bytes(reply_buffer[:MV_REPLY_FRAME_LENGTH])}")
+            if self.settings["ShouldVerifyReplyChecksums"] and not self.has_correct_checksum(MV_REPLY_FRAME_LENGTH):
+                raise PhReadException(f"Error when measuring ph. The reply has a wrong checksum: {bytes(reply_buffer[:MV_REPLY_FRAME_LENGTH])}")
+            # Sometimes the reply is followed by an extra \x00
+            extra_reply = self.serial_connection.read_all()
             if not(extra_reply == b'\x00' or extra_reply == b''):
                 raise PhReadException(f"Error when measuring ph. Got the following extra data as a reply: {extra_reply}")
-            reply = SerialReply(recipient, number_of_bytes, command_acted_upon, reply_device_id, data, checksum)
+            recipient, number_of_bytes, command_acted_upon, *reply_device_id = REPLY_HEADER.unpack_from(reply_buffer)
+            *channel_values, checksum = MV_VALUES_AND_CHECKSUM.unpack_from(reply_buffer, REPLY_HEADER.size)
+            mv_values = [channel_value/10 for channel_value in channel_values]  # The units are in 0.1 mV
+            reply = SerialReply(recipient, number_of_bytes, command_acted_upon, reply_device_id, None, checksum, mv_values)
         except Exception as e:
             Logger.standardLogger.log(e)
+            self.discard_unread_reply()
             raise PhReadException()
         return reply
 
+    def get_frame_length(self, length_of_reply: int) -> int:
+        # The length in a reply does not count the recipient, the length itself and the line end.
+        return length_of_reply + FRAME_LENGTH_WITHOUT_DATA - MINIMUM_REPLY_LENGTH
+
+    def has_correct_checksum(self, frame_length: int) -> bool:
+        # The checksum is the sum of the bytes before it, like in PhSerialCommand, in a single byte.
+        return sum(self.reply_view[:frame_length - 3]) % 256 == self.reply_buffer[frame_length - 3]
+
+    def read_into_reply_buffer(self, start: int, number_of_bytes: int) -> int:
+        # Returns the number of bytes read, which is less than asked for if the ph-meter did not send them in time.
+        reply_view = self.reply_view[start:start + number_of_bytes]
+        received_bytes = self.serial_connection.read(number_of_bytes)
+        reply_view[:len(received_bytes)] = received_bytes
+        return len(received_bytes)
+
+    def discard_unread_reply(self) -> None:
+        # What is left of a broken reply would otherwise be read as the start of the next reply.
+        try:
+            self.serial_connection.read_all()
+        except Exception as e:
+            Logger.standardLogger.log(e)
+
     def read_result(self) -> bytes:
         self.serial_connection.dtr = False
         result = self.serial_connection.readline()
         self.serial_connection.read()
         return result
 
-    def send_command(self, command: PhSerialCommand) -> None:
+    def send_command(self, command: PhSerialCommand, reply_length: int) -> None:
         self.serial_connection.dtr = True
         binary_command = command.to_binary_command_string()
         self.serial_connection.write(binary_command)
         if self.settings["ShouldPrintPhMeterMessages"]:
             print(f"Send ph command: {binary_command}")
-        self.timer.sleep(1)  # We need to wait for an answer
+        self.wait_for_reply(reply_length)  # We need to wait for an answer
+
+    def wait_for_reply(self, reply_length: int) -> None:
+        # Returns as soon as the whole reply has arrived, instead of always waiting a second, or when the reply timeout
+        # has passed, after which reading the reply fails if it is incomplete. The reply is checked when it is read.
+        # reply_length is only the expected length: as soon as the length byte has arrived, the start of the reply is
+        # read into the reply buffer and the length it gives is waited for instead, so that a shorter reply, e.g. an
+        # error, is not waited for until the timeout.
+        time_sent = self.timer.time()
+        timeout = self.settings["ReplyTimeoutInSeconds"]
+        seconds_waited = 0.0
+        self.number_of_reply_bytes_read = 0
+        while self.serial_connection.in_waiting < reply_length - self.number_of_reply_bytes_read:
+            if self.number_of_reply_bytes_read == 0 and 2 <= self.serial_connection.in_waiting:
+                self.number_of_reply_bytes_read = self.read_into_reply_buffer(0, 2)
+                reply_length = max(self.get_frame_length(self.reply_buffer[1]), self.number_of_reply_bytes_read)
+                continue
+            if timeout <= seconds_waited:
+                self.number_of_reply_timeouts += 1  # Reading the incomplete reply then fails, and is logged
+                return
+            self.timer.sleep(min(REPLY_POLL_INTERVAL_IN_SECONDS, timeout - seconds_waited))
+            seconds_waited = self.timer.time() - time_sent
+        self.add_response_time(seconds_waited)
+
+    def add_response_time(self, response_time: float) -> None:
+        self.response_times.append(response_time)
+        self.number_of_replies += 1
+        if self.settings["ShouldPrintPhMeterMessages"]:
+            print(f"The ph-meter replied after {response_time:.3f} seconds")
+        print_every_n_replies = self.settings["PrintResponseTimesEveryNReplies"]
+        if 0 < print_every_n_replies and self.number_of_replies % print_every_n_replies == 0:
+            print(f"Response times of the ph-meter after {self.number_of_replies} replies:")
+            print(self.format_response_time_summary())
+            if 0 < len(self.corrupt_replies_of_modules):
+                print(f"Broken replies per module: {dict(self.corrupt_replies_of_modules)}")
+            print()
+
+    def get_response_time_summary(self) -> dict[str, float]:
+        # The percentiles of the latest response times, used to choose the reply timeout.
+        summary = {"Replies": self.number_of_replies, "Timeouts": self.number_of_reply_timeouts}
+        if len(self.response_times) == 0:
+            return summary
+        response_times = np.array(self.response_times)
+        for percentile, value in zip(PERCENTILES, np.percentile(response_times, PERCENTILES)):
+            summary[f"ResponseSeconds p{percentile}"] = value
+        summary["ResponseSeconds max"] = response_times.max()
+        return summary
+
+    def format_response_time_summary(self) -> str:
+        return ", ".join(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}"
+                         for name, value in self.get_response_time_summary().items())
 
     def convert_raw_mv_bin_data_to_mv_values(self, raw_data: bytes) -> List[float]:
-        channel_mv_values = []
         if len(raw_data) != 8:
             raise PhReadException(f"The data given does not contain 8 bytes, but instead {len(raw_data)}, namely: {raw_data}")
-        for i in range(4):
-            # There are two bytes per channel
-            byte1 = raw_data[2 * i + 0]
-            byte2 = raw_data[2 * i + 1]
-
-            current_channel_mv_value = self.get_mv_value_from_bytes(byte1, byte2)
-            channel_mv_values.append(current_channel_mv_value)
-        return channel_mv_values
+        # There are two bytes per channel, like in get_mv_value_from_bytes
+        return [channel_value/10 for channel_value in MV_VALUES.unpack(raw_data)]
 
     def get_mv_value_from_bytes(self, byte1: int, byte2: int) -> float:
         current_channel_value = byte1 * 256 + byte2
@@ -154,16 +403,17 @@ class PhMeter:
 
     def update_calibration_data(self, ph_probe_calibration_data):
         self.probe_calibration_data = ph_probe_calibration_data
+        self.calibration_table = self.compile_calibration_data()
 
-    def get_ph_value_of_selected_probes(self, selected_probes: list[str]) -> dict[str, float]:
-        mv_values = self.get_mv_values_of_selected_probes(selected_probes)
-        ph_values = dict()
-        for probe in selected_probes:
-            mv_value = mv_values[probe]
-            ph_values[probe] = self.convert_mv_value_to_ph_value(mv_value, probe)
-        return ph_values
+    def get_ph_value_of_selected_probes(self, selected_probes: list[str],
+                                        should_use_cached_readings: bool = True) -> dict[str, float]:
+        mv_values = self.get_mv_values_of_selected_probes(selected_probes, should_use_cached_readings)
+        ph_values = self.convert_mv_values_to_ph_values(np.array([mv_values[probe] for probe in selected_probes]),
+                                                        selected_probes)
+        return dict(zip(selected_probes, ph_values.tolist()))
 
-    def get_mv_values_of_selected_probes(self, selected_probes: list[str]) -> dict[str, float]:
+    def get_mv_values_of_selected_probes(self, selected_probes: list[str],
+                                         should_use_cached_readings: bool = True) -> dict[str, float]:
         modules_used = (map(lambda probe: probe.split("_")[0], selected_probes))
         distinct_modules_used = list(dict.fromkeys(modules_used)) # used instead of set for testing purposes
 
@@ -172,19 +422,11 @@ class PhMeter:
         # This is done to speed things up.
 
         for module in distinct_modules_used:
-            try:
-                # This might fail due to an error with the signal etc.
-                module_mv_response = self.get_mv_values_of_module(module)
-            except PhReadException as e:
-                # wait a second and try to measure again
-                Logger.standardLogger.log(e)
-                time.sleep(1)
-                module_mv_response = self.get_mv_values_of_module(module)
-
-            all_probe_to_mv_values[module + "_1"] = self.get_mv_values_of_probe(module_mv_response, module + "_1")
-            all_probe_to_mv_values[module + "_2"] = self.get_mv_values_of_probe(module_mv_response, module + "_2")
-            all_probe_to_mv_values[module + "_3"] = self.get_mv_values_of_probe(module_mv_response, module + "_3")
-            all_probe_to_mv_values[module + "_4"] = self.get_mv_values_of_probe(module_mv_response, module + "_4")
+            # This might fail due to an error with the signal etc., after the retries of request_mv_values_of_module
+            module_mv_response = self.get_mv_values_of_module(module, should_use_cached_readings)
+            # The mV values of the module were decoded once, when its reply was read
+            for channel, mv_value in enumerate(module_mv_response.mv_values, start=1):
+                all_probe_to_mv_values[f"{module}_{channel}"] = mv_value
 
         probe_to_mv_value = {probe: all_probe_to_mv_values[probe] for probe in selected_probes}
 
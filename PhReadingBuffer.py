@@ -0,0 +1,62 @@
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+NUMBER_OF_PROBES_PER_MODULE = 4
+
+
+class PhReadingBuffer:
+    # The latest mV readings of the pH modules, each the mV values of the four probes of a module at a time point.
+    # They are stored in numpy arrays used as a ring buffer of a fixed size, so the oldest readings are overwritten
+    # when it is full. It is written to by the thread reading the ph-meter and read by any other thread.
+
+    def __init__(self, capacity: int) -> None:
+        self.times = np.zeros(capacity, dtype=np.float64)  # Seconds since the epoch, like time.time()
+        self.module_indices = np.zeros(capacity, dtype=np.int64)
+        self.mv_values = np.zeros((capacity, NUMBER_OF_PROBES_PER_MODULE), dtype=np.float64)
+        self.next_index = 0
+        self.number_of_readings = 0  # Also counts the readings that have been overwritten
+        self.module_ids: List[str] = []
+        self.index_of_module: dict[str, int] = dict()
+        # The latest reading of each module is also kept outside of the ring, so it is never overwritten.
+        self.latest_readings: dict[str, Tuple[float, np.ndarray]] = dict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.number_of_readings, len(self.times))
+
+    def add(self, time: float, module_id: str, mv_values: List[float]) -> None:
+        with self.lock:
+            if module_id not in self.index_of_module:
+                self.index_of_module[module_id] = len(self.module_ids)
+                self.module_ids.append(module_id)
+            self.times[self.next_index] = time
+            self.module_indices[self.next_index] = self.index_of_module[module_id]
+            self.mv_values[self.next_index] = mv_values
+            self.latest_readings[module_id] = (time, self.mv_values[self.next_index].copy())
+            self.next_index = (self.next_index + 1) % len(self.times)
+            self.number_of_readings += 1
+
+    def get_latest(self, module_id: str) -> Optional[Tuple[float, np.ndarray]]:
+        # The time and the mV values of the four probes of the latest reading of the module, if it has been read.
+        with self.lock:
+            return self.latest_readings.get(module_id)
+
+    def get_readings_between(self, start_time: float, end_time: float,
+                             module_id: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # The times, the module ids and the mV values of the readings from the start time up to and including the
+        # end time, oldest first, of all modules or of a single module.
+        with self.lock:
+            if len(self.times) <= self.number_of_readings:  # Full, so the oldest reading is the next to be overwritten
+                order = np.roll(np.arange(len(self.times)), -self.next_index)
+            else:
+                order = np.arange(self.number_of_readings)
+            times = self.times[order]
+            is_selected = (start_time <= times) & (times <= end_time)
+            if module_id is not None:
+                is_selected &= self.module_indices[order] == self.index_of_module.get(module_id, -1)
+            selected = order[is_selected]
+            module_ids = np.array(self.module_ids, dtype=object)[self.module_indices[selected]] \
+                if 0 < len(selected) else np.array([], dtype=object)
+            return self.times[selected], module_ids, self.mv_values[selected]
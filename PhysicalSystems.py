@@ -1,10 +1,11 @@
-import time
+from concurrent.futures import Future
 
 import pandas as pd
 import yaml
 
 import Logger
 import PumpTasks
+from DeviceWorker import DeviceWorker
 from PhMeter import PhMeter
 from PumpSystem import PumpSystem
 
@@ -17,6 +18,15 @@ class PhysicalSystems:
         ph_probe_calibration_data = self.get_ph_calibration_data()
         self.ph_meter = PhMeter(self.settings["phmeter"], ph_probe_calibration_data)
         self.pump_system = PumpSystem(self.settings["pumps"])
+        self.pump_to_probe: dict[str, str] = dict()
+        # The ph-meter and the pumps are on separate serial ports, so each is used by its own thread.
+        self.ph_meter_worker = DeviceWorker("ph-meter")
+        self.pump_worker = DeviceWorker("pumps")
+
+    def use_clock(self, clock) -> None:
+        # The ph-meter and the pumps then wait using the clock, e.g. a VirtualClock when simulating a run.
+        self.ph_meter.timer = clock
+        self.pump_system.timer = clock
 
     def initialize_systems(self) -> None:
         self.ph_meter.initialize_connection()
@@ -24,6 +34,28 @@ class PhysicalSystems:
 
     def initialize_pumps_used_in_protocol(self, protocol: pd.DataFrame):
         self.pump_system.setup_pumps_used_in_protocol(protocol)
+        # Used to know which cached ph readings are no longer valid after pumping.
+        for _, row in protocol.iterrows():
+            self.pump_to_probe[str(row["Pump"])] = row["pH probe"]
+        if self.settings["phmeter"]["ShouldPollInBackground"]:
+            self.start_ph_polling()
+
+    def start_ph_polling(self) -> None:
+        # The modules of all the protocols loaded so far are polled.
+        modules_used = list(dict.fromkeys(probe.split("_")[0] for probe in self.pump_to_probe.values()))
+        self.ph_meter.start_polling(modules_used, self.ph_meter_worker.run)
+
+    def disconnect(self, protocol: pd.DataFrame) -> None:
+        # Called when the run of the protocol has finished or was stopped. The poller is stopped before the threads of
+        # the devices, as its reading in progress is run by the thread of the ph-meter. The poller is then started
+        # again for the protocols still loaded, e.g. those of the other clients of the server.
+        for _, row in protocol.iterrows():
+            self.pump_to_probe.pop(str(row["Pump"]), None)
+        self.ph_meter.stop_polling()
+        self.ph_meter_worker.stop()
+        self.pump_worker.stop()
+        if self.settings["phmeter"]["ShouldPollInBackground"] and 0 < len(self.pump_to_probe):
+            self.start_ph_polling()
 
 # Pumping
 
@@ -35,20 +67,25 @@ class PhysicalSystems:
 
     def set_and_get_address_for_current_pump(self, address: int) -> bytes:
         self.pump_system.send_pump_command(f"*ADR {address}")
-        time.sleep(2)
+        self.pump_system.timer.sleep(2)
         self.pump_system.read_from_pumps()
         self.pump_system.send_pump_command(f"*ADR")
         actual_address = self.pump_system.read_from_pumps()  # hopefully the same as the input address
         return actual_address
 
     def pump(self, pump_id):
-        self.pump_system.pump(pump_id)
+        self.pump_worker.run(self.pump_system.pump, pump_id)
+        if str(pump_id) in self.pump_to_probe:
+            # Done by the ph-meter thread, so that a reading made while pumping is also discarded.
+            self.ph_meter_worker.submit(self.ph_meter.invalidate_cached_reading_of_probe, self.pump_to_probe[str(pump_id)])
 
 # Ph
 
-    def get_mv_values_of_selected_probes(self, selected_probes: list[str]) -> dict[str, float]:
+    def get_mv_values_of_selected_probes(self, selected_probes: list[str],
+                                         should_use_cached_readings: bool = True) -> dict[str, float]:
         try:
-            return self.ph_meter.get_mv_values_of_selected_probes(selected_probes)
+            return self.ph_meter_worker.run(self.ph_meter.get_mv_values_of_selected_probes, selected_probes,
+                                            should_use_cached_readings)
         except Exception as e:
             print("Error when trying to get the mv values of selected probes. "
                   "Are you sure that the ph-meter is connected and turned on?")
@@ -56,14 +93,14 @@ class PhysicalSystems:
             raise e
 
     def measure_ph_with_probe_associated_with_task(self, current_task: PumpTasks) -> float:
-        return self.ph_meter.measure_ph_with_probe_associated_with_task(current_task)
+        return self.ph_meter_worker.run(self.ph_meter.measure_ph_with_probe_associated_with_task, current_task)
 
-    def get_ph_values_of_selected_probes(self, ph_probes: list[str]) -> dict[str, float]:
-        return self.ph_meter.get_ph_value_of_selected_probes(ph_probes)
+    def get_ph_values_of_selected_probes(self, ph_probes: list[str], should_use_cached_readings: bool = True) -> dict[str, float]:
+        return self.ph_meter_worker.run(self.ph_meter.get_ph_value_of_selected_probes, ph_probes, should_use_cached_readings)
 
     def recalibrate_ph_meter(self) -> None:
         ph_probe_calibration_data = self.get_ph_calibration_data()
-        self.ph_meter.update_calibration_data(ph_probe_calibration_data)
+        self.ph_meter_worker.run(self.ph_meter.update_calibration_data, ph_probe_calibration_data)
 
     def get_ph_calibration_data(self) -> dict[str, dict[str, int]]:
         with open(self.settings["calibration_data_path"], "r") as file:
@@ -76,3 +113,13 @@ class PhysicalSystems:
     def pump_n_times(self, pump_id, pump_multiplier) -> None:
         for _ in range(pump_multiplier):
             self.pump(pump_id)
+
+    def pump_n_times_in_background(self, pump_id, pump_multiplier) -> Future:
+        # Returns at once, while the pumps are used by the pump thread. The future is done when it has pumped,
+        # and its result is the number of seconds pumping took, without waiting for the commands sent before it.
+        return self.pump_worker.submit(self.pump_n_times_and_time_it, pump_id, pump_multiplier)
+
+    def pump_n_times_and_time_it(self, pump_id, pump_multiplier) -> float:
+        time_started = self.pump_system.timer.time()
+        self.pump_n_times(pump_id, pump_multiplier)
+        return self.pump_system.timer.time() - time_started
@@ -1,4 +1,5 @@
 import abc
+from concurrent.futures import Future
 from abc import ABC, abstractmethod
 
 import pandas as pd
@@ -35,7 +36,8 @@ class PhysicalSystemsInterface(abc.ABC):
     # Ph
 
     @abstractmethod
-    def get_mv_values_of_selected_probes(self, selected_probes: list[str]) -> dict[str, float]:
+    def get_mv_values_of_selected_probes(self, selected_probes: list[str],
+                                         should_use_cached_readings: bool = True) -> dict[str, float]:
         pass
 
     @abstractmethod
@@ -43,7 +45,7 @@ class PhysicalSystemsInterface(abc.ABC):
         pass
 
     @abstractmethod
-    def get_ph_values_of_selected_probes(self, ph_probes: list[str]) -> dict[str, float]:
+    def get_ph_values_of_selected_probes(self, ph_probes: list[str], should_use_cached_readings: bool = True) -> dict[str, float]:
         pass
 
     @abstractmethod
@@ -61,6 +63,10 @@ class PhysicalSystemsInterface(abc.ABC):
     def pump_n_times(self, pump_id, pump_multiplier) -> None:
         pass
 
+    @abstractmethod
+    def pump_n_times_in_background(self, pump_id, pump_multiplier) -> Future:
+        pass
+
 
     @abstractmethod
     def disconnect(self, protocol: pd.DataFrame) -> None:
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+import numpy as np
+import pandas as pd
+
+NUMBER_OF_COLUMNS_PER_SEGMENT = 5  # Task time, pH at start, pH at end, dose volume and minimum delay
+FIRST_SEGMENT_COLUMN = 3  # After the pump, on/off and pH probe columns
+
+
+@dataclass(frozen=True)
+class ProtocolSegment:
+    # One task period of a row in the protocol.
+    task_time: float  # minutes
+    ph_at_start: float
+    ph_at_end: float
+    dose_volume: float  # ml
+    minimum_delay: float  # minutes
+
+
+@dataclass(frozen=True)
+class SegmentTable:
+    # The segments of all the rows of a protocol, where [row, i] is the i'th segment of the row.
+    # Segments after the last one of a row are NaN.
+    task_time: np.ndarray  # minutes
+    ph_at_start: np.ndarray
+    ph_at_end: np.ndarray
+    dose_volume: np.ndarray  # ml
+    minimum_delay: np.ndarray  # minutes
+    start_offset: np.ndarray  # minutes from the start of the run to the start of the segment
+    number_of_segments: np.ndarray  # per row
+
+
+@dataclass(frozen=True)
+class ProtocolTask:
+    # One row in the protocol.
+    pump_id: int
+    on_or_off: int
+    ph_probe: str
+    segments: tuple[ProtocolSegment, ...]
+
+
+@dataclass(frozen=True)
+class CompiledProtocol:
+    # Everything the program needs from a protocol, parsed once. It must not be changed, as it is shared by everyone
+    # loading the same protocol; get_dataframe gives a copy of the protocol that can be changed.
+    path: str
+    content_hash: str
+    dataframe: pd.DataFrame
+    tasks: tuple[ProtocolTask, ...]
+    ph_probes: tuple[str, ...]
+    pumps: tuple[int, ...]
+    probe_to_pump: Mapping[str, int]
+    pump_to_probe: Mapping[int, str]
+
+    def get_dataframe(self) -> pd.DataFrame:
+        return self.dataframe.copy()
+
+
+@dataclass
+class CachedProtocol:
+    modification_time: int  # ns
+    size: int
+    protocol: CompiledProtocol
+
+
+# The compiled protocols, by absolute path of the protocol file
+compiled_protocols: dict[str, CachedProtocol] = dict()
+compiled_protocols_lock = threading.Lock()
+
+
+def load_protocol(protocol_path: str) -> CompiledProtocol:
+    # The protocol is only parsed again if the file has changed. If only the modification time has changed,
+    # e.g. because the file was saved again without changes, the content hash shows that the old one can be reused.
+    path = os.path.abspath(protocol_path)
+    file_stats = os.stat(path)
+    with compiled_protocols_lock:
+        cached_protocol = compiled_protocols.get(path)
+        if cached_protocol is not None and cached_protocol.modification_time == file_stats.st_mtime_ns \
+                and cached_protocol.size == file_stats.st_size:
+            return cached_protocol.protocol
+
+        with open(path, "rb") as file:
+            content = file.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        if cached_protocol is not None and cached_protocol.protocol.content_hash == content_hash:
+            protocol = cached_protocol.protocol
+        else:
+            protocol = compile_protocol(path, content_hash, pd.read_excel(path))
+        compiled_protocols[path] = CachedProtocol(file_stats.st_mtime_ns, file_stats.st_size, protocol)
+        return protocol
+
+
+def compile_protocol(path: str, content_hash: str, dataframe: pd.DataFrame) -> CompiledProtocol:
+    tasks = []
+    probe_to_pump = dict()
+    pump_to_probe = dict()
+    segment_table = get_segment_table(dataframe)
+    for row, (pump_id, on_or_off, ph_probe) in enumerate(zip(dataframe["Pump"].to_list(), dataframe["On/off"].to_list(),
+                                                             dataframe["pH probe"].to_list())):
+        tasks.append(ProtocolTask(pump_id, on_or_off, ph_probe, get_segments_of_row(segment_table, row)))
+        probe_to_pump.setdefault(ph_probe, pump_id)  # Normally only one pump per probe
+        pump_to_probe[pump_id] = ph_probe
+    return CompiledProtocol(path=path,
+                            content_hash=content_hash,
+                            dataframe=dataframe,
+                            tasks=tuple(tasks),
+                            ph_probes=tuple(sorted(set(dataframe["pH probe"].to_list()))),
+                            pumps=tuple(sorted(set(dataframe["Pump"].to_list()))),
+                            probe_to_pump=MappingProxyType(probe_to_pump),
+                            pump_to_probe=MappingProxyType(pump_to_probe))
+
+
+def get_segment_table(dataframe: pd.DataFrame) -> SegmentTable:
+    # All the segment columns are reshaped at once into a (rows, segments, column) array.
+    values = dataframe.iloc[:, FIRST_SEGMENT_COLUMN:].to_numpy(dtype=np.float64, na_value=np.nan)
+    number_of_rows, number_of_columns = values.shape
+    max_number_of_segments = number_of_columns // NUMBER_OF_COLUMNS_PER_SEGMENT
+    values = values[:, :max_number_of_segments * NUMBER_OF_COLUMNS_PER_SEGMENT]
+    values = values.reshape(number_of_rows, max_number_of_segments, NUMBER_OF_COLUMNS_PER_SEGMENT)
+
+    # The segments of a row end at the first segment without a task time,
+    # as there are only some rows in the protocol with multiple segments.
+    is_segment = np.cumprod(~np.isnan(values[:, :, 0]), axis=1).astype(bool)
+    values = np.where(is_segment[:, :, np.newaxis], values, np.nan)
+    task_time = values[:, :, 0]
+    durations = np.where(is_segment, task_time, 0)
+    return SegmentTable(task_time=task_time,
+                        ph_at_start=values[:, :, 1],
+                        ph_at_end=values[:, :, 2],
+                        dose_volume=values[:, :, 3],
+                        minimum_delay=values[:, :, 4],
+                        start_offset=np.where(is_segment, np.cumsum(durations, axis=1) - durations, np.nan),
+                        number_of_segments=is_segment.sum(axis=1))
+
+
+def get_segments_of_row(segment_table: SegmentTable, row: int) -> tuple[ProtocolSegment, ...]:
+    number_of_segments = segment_table.number_of_segments[row]
+    return tuple(ProtocolSegment(*segment) for segment in zip(segment_table.task_time[row, :number_of_segments].tolist(),
+                                                              segment_table.ph_at_start[row, :number_of_segments].tolist(),
+                                                              segment_table.ph_at_end[row, :number_of_segments].tolist(),
+                                                              segment_table.dose_volume[row, :number_of_segments].tolist(),
+                                                              segment_table.minimum_delay[row, :number_of_segments].tolist()))
@@ -1,23 +1,20 @@
+import bisect
 import datetime
 import time
+from array import array
 from dataclasses import dataclass
 from typing import Optional
 
 import Controllers
 
-@dataclass
-class PumpTask:
-    pump_id: int
-    ph_meter_id: (str, str)
-    task_time: int  # minutes
-    ph_at_start: float
-    ph_at_end: float
-    dose_volume: float  # ml
-    minimum_delay: float  # minimum delay between dosations. In minutes.
-    start_time: datetime.datetime
-    time_next_operation: datetime.datetime
-    next_task: Optional['PumpTask']
-    controller: Controllers.DerivativeControllerWithMemory
+# Times stored as floats are seconds since this time. Unlike POSIX timestamps, they do not depend on the time zone.
+TIMESTAMP_EPOCH = datetime.datetime(2000, 1, 1)
+
+
+class ScheduledTask:
+    # What the scheduler needs from a task, no matter how its segments are stored.
+
+    __slots__ = ()
 
     timer = time  # can be accessed for testing
     datetimer = datetime.datetime  # can be accessed for testing
@@ -38,6 +35,24 @@ class PumpTask:
                 print(f"Waiting {time_difference_in_seconds} seconds until task is ready.")
             self.timer.sleep(time_difference_in_seconds)
 
+    def get_ph_probe_id(self) -> str:
+        return f"{self.ph_meter_id[0]}_{self.ph_meter_id[1]}"
+
+
+@dataclass
+class PumpTask(ScheduledTask):
+    pump_id: int
+    ph_meter_id: (str, str)
+    task_time: int  # minutes
+    ph_at_start: float
+    ph_at_end: float
+    dose_volume: float  # ml
+    minimum_delay: float  # minimum delay between dosations. In minutes.
+    start_time: datetime.datetime
+    time_next_operation: datetime.datetime
+    next_task: Optional['PumpTask']
+    controller: Controllers.DerivativeControllerWithMemory
+
     def get_expected_ph_at_current_time(self):
         current_time = self.datetimer.now()
         total_ph_interval = self.ph_at_end - self.ph_at_start
@@ -47,7 +62,158 @@ class PumpTask:
     def get_end_time(self):
         return self.start_time + datetime.timedelta(minutes=self.task_time)
 
+    def get_next_segment(self, current_time: datetime.datetime) -> Optional['PumpTask']:
+        # The segments of a task share its controller, see Scheduler.get_pump_task_from_segment_table
+        if self.next_task is not None:
+            self.next_task.controller.start_new_segment()
+        return self.next_task
+
+    def get_segment_starting_at(self, segment_start_time: datetime.datetime) -> 'PumpTask':
+        # Used when resuming a run, where the task should continue in the segment it was in.
+        task = self
+        while task.next_task is not None and task.next_task.start_time <= segment_start_time:
+            task = task.next_task
+        return task
+
     def calculate_pump_multiplier(self, expected_ph, measured_ph) -> int:
         if expected_ph < measured_ph:
             return 0
         return int((expected_ph - measured_ph) / self.dose_multiplier_pH_difference) + 1
+
+
+class SegmentTablePumpTask(ScheduledTask):
+    # A pump task where all the segments are stored in one table instead of as a linked list of PumpTasks.
+    # The expected pH of each segment is a line, ph = intercept + slope*(minutes since the segment started).
+    # Finding the segment of a point in time is a binary search in the end times of the segments, so a task
+    # can consist of thousands of segments.
+    # To keep the tasks small when there are many of them, the table is stored in arrays of floats, the times are
+    # stored as seconds since TIMESTAMP_EPOCH, and there are no per task dictionaries (see __slots__).
+
+    __slots__ = ("pump_id", "ph_meter_id", "task_start_timestamp", "next_operation_timestamp", "controller",
+                 "segment_end_offsets", "segment_intercepts", "segment_slopes", "segment_dose_volumes",
+                 "segment_minimum_delays", "segment", "timer", "datetimer", "shouldPrintWhenWaiting")
+
+    next_task = None  # All the segments are part of this task
+
+    def __init__(self, pump_id: int, ph_meter_id: (str, str), task_start_time: datetime.datetime,
+                 time_next_operation: datetime.datetime, controller: Controllers.DerivativeControllerWithMemory,
+                 segment_end_offsets: list[float], segment_intercepts: list[float], segment_slopes: list[float],
+                 segment_dose_volumes: list[float], segment_minimum_delays: list[float], segment: int = 0) -> None:
+        self.pump_id = pump_id
+        self.ph_meter_id = ph_meter_id
+        self.task_start_time = task_start_time
+        self.time_next_operation = time_next_operation
+        self.controller = controller
+        self.segment_end_offsets = array("d", segment_end_offsets)  # minutes since the task started
+        self.segment_intercepts = array("d", segment_intercepts)  # pH at the start of the segment
+        self.segment_slopes = array("d", segment_slopes)  # pH per minute
+        self.segment_dose_volumes = array("d", segment_dose_volumes)  # ml
+        self.segment_minimum_delays = array("d", segment_minimum_delays)  # minutes
+        self.segment = segment  # The current segment
+        self.timer = ScheduledTask.timer
+        self.datetimer = ScheduledTask.datetimer
+        self.shouldPrintWhenWaiting = ScheduledTask.shouldPrintWhenWaiting
+
+    def __lt__(self, nxt):
+        if isinstance(nxt, SegmentTablePumpTask):  # Avoids creating the datetimes
+            if self.next_operation_timestamp == nxt.next_operation_timestamp:
+                return self.pump_id < nxt.pump_id
+            return self.next_operation_timestamp < nxt.next_operation_timestamp
+        return super().__lt__(nxt)
+
+    def __repr__(self) -> str:
+        return f"SegmentTablePumpTask(pump_id={self.pump_id}, ph_meter_id={self.ph_meter_id}, " \
+               f"segment={self.segment}/{len(self.segment_end_offsets)}, time_next_operation={self.time_next_operation})"
+
+    @property
+    def task_start_time(self) -> datetime.datetime:
+        return to_datetime(self.task_start_timestamp)
+
+    @task_start_time.setter
+    def task_start_time(self, task_start_time: datetime.datetime) -> None:
+        self.task_start_timestamp = to_timestamp(task_start_time)
+
+    @property
+    def time_next_operation(self) -> datetime.datetime:
+        return to_datetime(self.next_operation_timestamp)
+
+    @time_next_operation.setter
+    def time_next_operation(self, time_next_operation: datetime.datetime) -> None:
+        self.next_operation_timestamp = to_timestamp(time_next_operation)
+
+    @property
+    def segment_start_offset(self) -> float:
+        return 0.0 if self.segment == 0 else self.segment_end_offsets[self.segment - 1]
+
+    @property
+    def start_time(self) -> datetime.datetime:
+        return to_datetime(self.task_start_timestamp + self.segment_start_offset*60)
+
+    @start_time.setter
+    def start_time(self, start_time: datetime.datetime) -> None:
+        self.task_start_timestamp = to_timestamp(start_time) - self.segment_start_offset*60
+
+    @property
+    def task_time(self) -> float:
+        return self.segment_end_offsets[self.segment] - self.segment_start_offset
+
+    @property
+    def ph_at_start(self) -> float:
+        return self.segment_intercepts[self.segment]
+
+    @property
+    def ph_at_end(self) -> float:
+        return self.segment_intercepts[self.segment] + self.segment_slopes[self.segment]*self.task_time
+
+    @property
+    def dose_volume(self) -> float:
+        return self.segment_dose_volumes[self.segment]
+
+    @property
+    def minimum_delay(self) -> float:
+        return self.segment_minimum_delays[self.segment]
+
+    def get_minutes_since_task_start(self, time_point: datetime.datetime) -> float:
+        return (to_timestamp(time_point) - self.task_start_timestamp)/60
+
+    def get_expected_ph_at_current_time(self):
+        # Like PumpTask, it uses the current segment, even if it is handled a bit after the segment has ended.
+        minutes_into_segment = self.get_minutes_since_task_start(self.datetimer.now()) - self.segment_start_offset
+        return self.segment_intercepts[self.segment] + self.segment_slopes[self.segment]*minutes_into_segment
+
+    def get_expected_ph_at_time(self, time_point: datetime.datetime) -> float:
+        minutes_since_start = self.get_minutes_since_task_start(time_point)
+        segment = min(bisect.bisect_right(self.segment_end_offsets, minutes_since_start), len(self.segment_end_offsets) - 1)
+        segment_start_offset = 0.0 if segment == 0 else self.segment_end_offsets[segment - 1]
+        return self.segment_intercepts[segment] + self.segment_slopes[segment]*(minutes_since_start - segment_start_offset)
+
+    def get_end_time(self):
+        return to_datetime(self.task_start_timestamp + self.segment_end_offsets[self.segment]*60)
+
+    def get_task_end_time(self) -> datetime.datetime:
+        return to_datetime(self.task_start_timestamp + self.segment_end_offsets[-1]*60)
+
+    def get_next_segment(self, current_time: datetime.datetime) -> Optional['SegmentTablePumpTask']:
+        # The segments that have already ended are skipped at once,
+        # as the scheduler would otherwise have moved past them one at a time.
+        next_segment = max(self.segment + 1,
+                           bisect.bisect_right(self.segment_end_offsets, self.get_minutes_since_task_start(current_time)))
+        if len(self.segment_end_offsets) <= next_segment:
+            return None
+        self.segment = next_segment
+        self.controller.start_new_segment()
+        return self
+
+    def get_segment_starting_at(self, segment_start_time: datetime.datetime) -> 'SegmentTablePumpTask':
+        minutes_since_start = self.get_minutes_since_task_start(segment_start_time)
+        self.segment = min(bisect.bisect_right(self.segment_end_offsets, minutes_since_start),
+                           len(self.segment_end_offsets) - 1)
+        return self
+
+
+def to_timestamp(time_point: datetime.datetime) -> float:
+    return (time_point - TIMESTAMP_EPOCH).total_seconds()
+
+
+def to_datetime(timestamp: float) -> datetime.datetime:
+    return TIMESTAMP_EPOCH + datetime.timedelta(seconds=timestamp)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from ResultsJournal import RESULTS_COLUMNS
+
+# The time points are stored as nanoseconds since the epoch, like pandas does internally.
+COLUMN_TYPES = {"PumpTask": np.int64,
+                "TimePoint": np.int64,
+                "ExpectedPH": np.float64,
+                "ActualPH": np.float64,
+                "DidPump": np.bool_,
+                "PumpMultiplier": np.int64}
+
+
+class RecordStore:
+    # Stores the recorded steps of a run column by column in typed arrays.
+    # The arrays are allocated in fixed size chunks, so adding a step never copies the steps already recorded,
+    # unlike adding a row to a DataFrame. A DataFrame is only created when it is actually needed,
+    # e.g. when saving the results, and it is then reused until another step is recorded.
+
+    CHUNK_SIZE = 1024
+
+    def __init__(self) -> None:
+        self.chunks: list[dict[str, np.ndarray]] = []
+        self.size = 0
+        self.dataframe = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, record: dict) -> None:
+        index_in_chunk = self.size % self.CHUNK_SIZE
+        if index_in_chunk == 0:
+            self.chunks.append({column: np.empty(self.CHUNK_SIZE, dtype=column_type)
+                                for column, column_type in COLUMN_TYPES.items()})
+        chunk = self.chunks[-1]
+        for column in RESULTS_COLUMNS:
+            chunk[column][index_in_chunk] = self.to_stored_value(column, record[column])
+        self.size += 1
+        self.dataframe = None
+
+    def to_stored_value(self, column: str, value):
+        if column == "TimePoint":
+            return pd.Timestamp(value).value
+        return value
+
+    def get_column(self, column: str) -> np.ndarray:
+        if len(self.chunks) == 0:
+            return np.empty(0, dtype=COLUMN_TYPES[column])
+        return np.concatenate([chunk[column] for chunk in self.chunks])[:self.size]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        if self.dataframe is None:
+            columns = {column: self.get_column(column) for column in RESULTS_COLUMNS}
+            columns["TimePoint"] = pd.to_datetime(columns["TimePoint"], unit="ns")
+            self.dataframe = pd.DataFrame(columns, columns=RESULTS_COLUMNS)
+        return self.dataframe
+
+    @staticmethod
+    def from_dataframe(records: pd.DataFrame) -> 'RecordStore':
+        # Used when restarting a run, where the steps already recorded are loaded from a file.
+        # The columns are copied into the chunks as a whole, instead of one step at a time.
+        record_store = RecordStore()
+        columns = {column: records[column].to_numpy(dtype=column_type) for column, column_type in COLUMN_TYPES.items()
+                   if column != "TimePoint"}
+        columns["TimePoint"] = records["TimePoint"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        for chunk_start in range(0, len(records.index), RecordStore.CHUNK_SIZE):
+            chunk_end = min(chunk_start + RecordStore.CHUNK_SIZE, len(records.index))
+            chunk = {column: np.empty(RecordStore.CHUNK_SIZE, dtype=column_type)
+                     for column, column_type in COLUMN_TYPES.items()}
+            for column in RESULTS_COLUMNS:
+                chunk[column][:chunk_end - chunk_start] = columns[column][chunk_start:chunk_end]
+            record_store.chunks.append(chunk)
+            record_store.size = chunk_end
+        return record_store
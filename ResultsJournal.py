@@ -0,0 +1,74 @@
+import csv
+import os
+
+import pandas as pd
+
+RESULTS_COLUMNS = ['PumpTask', 'TimePoint', 'ExpectedPH', 'ActualPH', 'DidPump', 'PumpMultiplier']
+TIME_POINT_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # Always includes the microseconds, so all rows can be parsed the same way
+
+
+def get_journal_path(results_file_path: str) -> str:
+    return f"{os.path.splitext(results_file_path)[0]}.csv"
+
+
+def load_journal(journal_path: str) -> pd.DataFrame:
+    records = pd.read_csv(journal_path, float_precision="round_trip")
+    records["TimePoint"] = pd.to_datetime(records["TimePoint"], format=TIME_POINT_FORMAT)
+    return records
+
+
+class ResultsJournal:
+    # Append-only record of the steps of a run, with one csv row per step.
+    # Unlike the excel results file, adding a step does not require rewriting the steps already recorded,
+    # so the cost of recording does not grow with the length of the run.
+    # The excel file is then only written at the end of the run, or on demand using export_to_excel,
+    # e.g. when the run is paused.
+
+    def __init__(self, journal_path: str, fsync_every_n_steps: int = 1) -> None:
+        self.journal_path = journal_path
+        # 0 means that it is left to the operating system when the steps are written to the disk.
+        self.fsync_every_n_steps = fsync_every_n_steps
+        self.steps_since_fsync = 0
+        self.is_new_journal = not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0
+        self.file = open(journal_path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if self.is_new_journal:
+            self.writer.writerow(RESULTS_COLUMNS)
+            self.flush(should_fsync=True)
+
+    def append(self, record: dict) -> None:
+        self.writer.writerow([self.format_value(column, record[column]) for column in RESULTS_COLUMNS])
+        self.steps_since_fsync += 1
+        should_fsync = 0 < self.fsync_every_n_steps <= self.steps_since_fsync
+        self.flush(should_fsync)
+
+    def append_all(self, records: pd.DataFrame) -> None:
+        # Used when a journal needs to contain the steps of an earlier run, e.g. when restarting it.
+        for record in records.to_dict("records"):
+            self.writer.writerow([self.format_value(column, record[column]) for column in RESULTS_COLUMNS])
+        self.flush(should_fsync=True)
+
+    def format_value(self, column: str, value):
+        if column == "TimePoint":
+            return value.strftime(TIME_POINT_FORMAT)
+        return value
+
+    def flush(self, should_fsync: bool) -> None:
+        # Flushing means that the step survives the program crashing,
+        # while fsync'ing means that it also survives the computer losing power.
+        self.file.flush()
+        if should_fsync:
+            os.fsync(self.file.fileno())
+            self.steps_since_fsync = 0
+
+    def read_records(self) -> pd.DataFrame:
+        self.file.flush()
+        return load_journal(self.journal_path)
+
+    def export_to_excel(self, results_file_path: str) -> None:
+        self.read_records().to_excel(results_file_path, index=False)
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.flush(should_fsync=True)
+            self.file.close()
@@ -7,103 +7,322 @@ import pandas as pd
 import datetime
 from typing import *
 import heapq
+from concurrent.futures import Future
 
 import Logger
-from Controllers import DerivativeControllerWithMemory
+from Controllers import BankedController, CompactDerivativeControllerWithMemory, ControllerBank, DerivativeControllerWithMemory, \
+    ModelBasedController
+from InitialPhCorrection import InitialPhCorrection
 from KeypressDetector import KeypressDetector
 from Networking.PhysicalSystemsClient import PhysicalSystemsClient
 from PhysicalSystems import PhysicalSystems
 from PhMeter import PhReadException
 from PhysicalSystemsInterface import PhysicalSystemsInterface
 
-from PumpTasks import PumpTask
+from ProtocolLoader import SegmentTable, get_segment_table, load_protocol
+from PumpTasks import PumpTask, SegmentTablePumpTask
+from RecordStore import RecordStore
+from ResultsJournal import ResultsJournal, get_journal_path, load_journal
+from SchedulerCheckpoint import SchedulerCheckpoint, TaskState, get_checkpoint_path, load_checkpoint, save_checkpoint
+from StepTimings import StepTiming, StepTimings
 
 
 def select_instruction_sheet(protocol_path) -> pd.DataFrame:
-    return pandas.read_excel(protocol_path)
+    return load_protocol(protocol_path).get_dataframe()
 
 class Scheduler:
 
     timer = datetime.datetime
+    sleeper = time  # can be accessed for testing
+    task_clock = None  # Used by the tasks instead of the time and datetime modules, when set by use_clock
     start_time = None
 
     def __init__(self, scheduler_settings: dict, physical_systems: PhysicalSystemsInterface) -> None:
         self.settings: dict = scheduler_settings
         self.physical_systems = physical_systems
         self.start_time = self.timer.now() 
-
-    def start(self, selected_protocol_path: str) -> None:
-        selected_protocol = select_instruction_sheet(selected_protocol_path)
-        self.physical_systems.initialize_pumps_used_in_protocol(selected_protocol)
-        results_file_path = self.create_results_file(selected_protocol_path)
-        task_queue = self.initialize_task_priority_queue(selected_protocol)
-        if (self.settings["scheduler"]["ShouldInitiallyEnsureCorrectPHBeforeStarting"]):
-            self.run_ensure_correct_start_pH_value(selected_protocol, task_queue)
-            task_queue = self.initialize_task_priority_queue(selected_protocol)
-        self.start_time = self.timer.now()
-        recorded_data = self.run_tasks(results_file_path, task_queue)
-        self.save_recorded_data(results_file_path, recorded_data)
-        self.physical_systems.disconnect(selected_protocol)
+        self.results_journals: dict[str, ResultsJournal] = dict()
+        self.pending_pumping: dict[int, Future] = dict()  # The pumping still going on in the background, per pump
+        self.pending_pump_timings: dict[int, StepTiming] = dict()  # The steps of that pumping, timed once it is done
+        self.protocol_hash: Optional[str] = None  # Of the protocol being run
+        self.tasks_start_time = self.start_time  # The time the tasks were scheduled to start
+        self.number_of_records_at_last_checkpoint = 0
+        self.step_timings = StepTimings()  # When each step started compared to when it should, and how long it took
+        self.results_file_paths_of_pumps: dict[int, str] = dict()  # When running several protocols at the same time
+        self.controller_bank = ControllerBank()  # Holds the controllers of the tasks, if ShouldUseControllerBank
+
+    def use_clock(self, clock) -> None:
+        # Makes the scheduler and the tasks it creates use the clock instead of the real time,
+        # e.g. a VirtualClock when simulating a run.
+        self.timer = clock
+        self.sleeper = clock
+        self.task_clock = clock
+
+    def start(self, selected_protocol_path: str) -> pd.DataFrame:
+        return self.start_protocols([selected_protocol_path])[0]
+
+    def start_protocols(self, selected_protocol_paths: List[str],
+                        start_delays_in_minutes: Optional[List[float]] = None) -> List[pd.DataFrame]:
+        # Runs the protocols at the same time, using the same ph-meter and pumps. The tasks of all the protocols are
+        # handled from one queue, so tasks of different protocols using the same pH module share its readings.
+        # Each protocol gets its own results file, and can start some minutes after the others.
+        selected_protocols = [select_instruction_sheet(protocol_path) for protocol_path in selected_protocol_paths]
+        if start_delays_in_minutes is None:
+            start_delays_in_minutes = [0.0]*len(selected_protocols)
+        pumps_of_protocols = self.get_pumps_of_protocols(selected_protocol_paths)
+        # Checkpoints are made for a single protocol, which can then be resumed by restart_run
+        self.protocol_hash = load_protocol(selected_protocol_paths[0]).content_hash if len(selected_protocol_paths) == 1 else None
+        all_protocols = pd.concat(selected_protocols, ignore_index=True)
+        self.physical_systems.initialize_pumps_used_in_protocol(all_protocols)
+        try:
+            results_file_paths = [self.create_results_file(protocol_path) for protocol_path in selected_protocol_paths]
+            self.results_file_paths_of_pumps = {pump: results_file_path
+                                                for pumps, results_file_path in zip(pumps_of_protocols, results_file_paths)
+                                                for pump in pumps}
+            task_queue = self.initialize_task_priority_queues(selected_protocols, start_delays_in_minutes)
+            if (self.settings["scheduler"]["ShouldInitiallyEnsureCorrectPHBeforeStarting"]):
+                self.run_ensure_correct_start_pH_value(all_protocols, task_queue)
+                task_queue = self.initialize_task_priority_queues(selected_protocols, start_delays_in_minutes)
+            self.start_time = self.timer.now()
+            recorded_data = self.run_tasks(results_file_paths[0], task_queue)
+            recorded_data_of_protocols = []
+            for pumps, results_file_path in zip(pumps_of_protocols, results_file_paths):
+                recorded_data_of_protocol = recorded_data.loc[recorded_data["PumpTask"].isin(pumps)].reset_index(drop=True)
+                self.save_recorded_data(results_file_path, recorded_data_of_protocol)
+                recorded_data_of_protocols.append(recorded_data_of_protocol)
+            self.finish_step_timings(results_file_paths, pumps_of_protocols)
+            self.close_results_journals()
+        finally:  # Also when the run is stopped, so that the poller and the threads of the devices are stopped
+            self.physical_systems.disconnect(all_protocols)
+        return recorded_data_of_protocols
+
+    def get_pumps_of_protocols(self, protocol_paths: List[str]) -> List[set[int]]:
+        # The protocols share the hardware, so a pump can only be used by one of them.
+        pumps_of_protocols = []
+        used_pumps = dict()
+        for protocol_path in protocol_paths:
+            pumps = {task.pump_id for task in load_protocol(protocol_path).tasks if task.on_or_off != 0}
+            for pump in pumps:
+                if pump in used_pumps:
+                    raise ValueError(f"Pump {pump} is used by both \"{used_pumps[pump]}\" and \"{protocol_path}\"")
+                used_pumps[pump] = protocol_path
+            pumps_of_protocols.append(pumps)
+        return pumps_of_protocols
+
+    def initialize_task_priority_queues(self, protocols: List[pd.DataFrame],
+                                        start_delays_in_minutes: List[float]) -> List[PumpTask]:
+        start_time = self.timer.now()
+        task_queue = []
+        for protocol, start_delay in zip(protocols, start_delays_in_minutes):
+            task_queue += self.initialize_task_priority_queue(protocol, start_time + datetime.timedelta(minutes=start_delay))
+        heapq.heapify(task_queue)
+        self.tasks_start_time = start_time
+        return task_queue
 
     def create_results_file(self, selected_protocol_path: str) -> str:
         protocol_file_name = os.path.splitext(selected_protocol_path)[0]
         timer_string: str = str(self.timer.now()).replace(":", "_")  # Windows do not allow ':' in filenames
         results_file_name = f"{protocol_file_name}_results_{timer_string}.xlsx"
         if self.settings["scheduler"]["ShouldRecordStepsWhileRunning"]:
-            file = open(results_file_name, "w+")
-            file.close()
+            self.get_results_journal(results_file_name)  # Creates the journal, so that it exists from the start
         return results_file_name
 
+    def get_results_journal(self, results_file_path: str) -> ResultsJournal:
+        # The steps are recorded in a journal next to the results file, e.g. "run_results.csv" for "run_results.xlsx".
+        if results_file_path not in self.results_journals:
+            journal_path = get_journal_path(results_file_path)
+            fsync_every_n_steps = self.settings["scheduler"]["ResultsJournalFsyncEveryNSteps"]
+            self.results_journals[results_file_path] = ResultsJournal(journal_path, fsync_every_n_steps)
+        return self.results_journals[results_file_path]
+
+    def export_recorded_results_to_excel(self) -> None:
+        # Writes the steps recorded so far to the excel results files while the run is paused,
+        # so that they can be looked at without waiting for the run to finish.
+        for results_file_path, journal in self.results_journals.items():
+            journal.export_to_excel(results_file_path)
+            print(f"The results recorded so far have been saved to \"{results_file_path}\"")
+        if 0 < len(self.results_journals):
+            print()
+
+    def close_results_journals(self) -> None:
+        for journal in self.results_journals.values():
+            journal.close()
+        self.results_journals = dict()
+
     def run_tasks(self, results_file_path: str, task_queue: List[PumpTask]) -> pd.DataFrame:
-        records = pd.DataFrame(columns=['PumpTask', 'TimePoint', 'ExpectedPH', 'ActualPH', 'DidPump', 'PumpMultiplier'])
+        records = RecordStore()
         print("\n\nStart running")
         self.handle_tasks_until_done(records, results_file_path, task_queue)
-        return records
+        return records.to_dataframe()
 
-    def handle_tasks_until_done(self, records: pd.DataFrame, results_file_path: str, task_queue: list[PumpTask]) -> None:
+    def handle_tasks_until_done(self, records: RecordStore, results_file_path: str, task_queue: list[PumpTask]) -> None:
 
         detector = KeypressDetector()
 
         # task_queue is sorted by time for next operation
         while 0 < len(task_queue):
             self.pause_on_keypress(detector)
-            current_task = self.get_next_ready_task(task_queue)
-            self.handle_task(current_task, records, task_queue, results_file_path)
+            tasks = self.get_next_tasks(task_queue)
+            if len(tasks) == 1:
+                self.handle_task(tasks[0], records, task_queue, results_file_path)
+            else:
+                self.handle_tasks_sharing_module(tasks, records, task_queue, results_file_path)
+            if self.is_checkpoint_due(records):
+                self.save_checkpoint(len(records), results_file_path, task_queue)
+        self.wait_for_pending_pumping(list(self.pending_pumping.keys()))
+
+    def get_next_tasks(self, task_queue: List[PumpTask]) -> List[PumpTask]:
+        # Waits for the next task, which is handled together with the tasks that can share its reading of the ph-meter.
+        current_task = self.get_next_ready_task(task_queue)
+        return [current_task] + self.get_tasks_sharing_module_read(current_task, task_queue)
 
     def pause_on_keypress(self, detector):
         if detector.get_has_key_been_pressed():
             print("Pausing until enter is pressed... ")
             print()
+            self.export_recorded_results_to_excel()
             input()
             print("Starting again")
             print()
             detector.reset_has_key_been_pressed()
 
-    def handle_task(self, current_task: PumpTask, records: pd.DataFrame, task_queue: List[PumpTask], results_file_path: str) -> None:
-        expected_ph = current_task.get_expected_ph_at_current_time()
-        measured_ph = self.measure_associated_task_ph(current_task)
-        number_of_pumps = self.calculate_number_of_pumps(current_task.controller, expected_ph, measured_ph)
+    def handle_task(self, current_task: PumpTask, records: RecordStore, task_queue: List[PumpTask], results_file_path: str,
+                    measured_ph: Optional[float] = None, step_timing: Optional[StepTiming] = None,
+                    expected_ph: Optional[float] = None, number_of_pumps: Optional[int] = None) -> None:
+        if step_timing is None:
+            step_timing = self.start_step_timing(current_task)
+        if expected_ph is None:
+            expected_ph = current_task.get_expected_ph_at_current_time()
+        if measured_ph is None:  # Otherwise it has already been measured together with other tasks
+            self.wait_for_pending_pumping([current_task.pump_id])
+            time_measuring_started = self.timer.now()
+            measured_ph = self.measure_associated_task_ph(current_task)
+            step_timing.measure_seconds = self.get_seconds_since(time_measuring_started)
+        if number_of_pumps is None:  # Otherwise it has already been calculated together with other tasks
+            number_of_pumps = self.calculate_number_of_pumps(current_task.controller, expected_ph, measured_ph)
+        if self.should_pump_in_step(measured_ph, number_of_pumps):
+            self.pump_n_times(current_task, number_of_pumps, step_timing)
+        self.finish_step(current_task, expected_ph, measured_ph, number_of_pumps, records, task_queue, results_file_path,
+                         step_timing)
+
+    def pump_n_times(self, current_task: PumpTask, number_of_pumps: int, step_timing: Optional[StepTiming] = None) -> None:
+        if self.settings["scheduler"]["ShouldPumpInBackground"]:
+            # The next tasks can then be measured while this task is pumping.
+            self.pending_pumping[current_task.pump_id] = \
+                self.physical_systems.pump_n_times_in_background(current_task.pump_id, number_of_pumps)
+            if step_timing is not None:
+                self.pending_pump_timings[current_task.pump_id] = step_timing
+        else:
+            time_pumping_started = self.timer.now()
+            self.physical_systems.pump_n_times(current_task.pump_id, number_of_pumps)
+            if step_timing is not None:
+                step_timing.pump_seconds = self.get_seconds_since(time_pumping_started)
+
+    def wait_for_pending_pumping(self, pump_ids: List[int]) -> None:
+        # The pH of a task must not be measured before it is done pumping, as it would not show the effect of pumping.
+        for pump_id in pump_ids:
+            pending_pumping = self.pending_pumping.pop(pump_id, None)
+            if pending_pumping is not None:
+                pump_seconds = pending_pumping.result()  # Raises any error from pumping
+                step_timing = self.pending_pump_timings.pop(pump_id, None)
+                if step_timing is not None:
+                    step_timing.pump_seconds = pump_seconds
+                    self.step_timings.update_pump_seconds(step_timing)
+
+    def should_pump_in_step(self, measured_ph: float, number_of_pumps: int) -> bool:
+        # A NaN pH corresponds to not getting a connection to the ph probe, in which case nothing is pumped.
+        return not math.isnan(measured_ph) and 0 < number_of_pumps
+
+    def finish_step(self, current_task: PumpTask, expected_ph: float, measured_ph: float, number_of_pumps: int,
+                    records: RecordStore, task_queue: List[PumpTask], results_file_path: str,
+                    step_timing: StepTiming) -> None:
         delay = current_task.minimum_delay
         if math.isnan(measured_ph):  # Corresponds to not getting a connection to the ph probe
             delay = 1/10  # Wait 10 seconds to try again
-        elif 0 < number_of_pumps:
-            self.physical_systems.pump_n_times(current_task.pump_id, number_of_pumps)
+        time_recording_started = self.timer.now()
         self.record_result_of_step(current_task, expected_ph, measured_ph, 0 < number_of_pumps,
                                    number_of_pumps, records, results_file_path)
+        step_timing.persistence_seconds = self.get_seconds_since(time_recording_started)
+        self.add_step_timing(step_timing)
         self.reschedule_task(current_task, delay, task_queue)
 
+    # Step timings
+
+    def start_step_timing(self, current_task: PumpTask) -> StepTiming:
+        return StepTiming(pump_id=current_task.pump_id, scheduled_time=current_task.time_next_operation,
+                          start_time=self.timer.now(), minimum_delay=current_task.minimum_delay)
 
+    def get_seconds_since(self, time_point: datetime.datetime) -> float:
+        return (self.timer.now() - time_point).total_seconds()
+
+    def add_step_timing(self, step_timing: StepTiming) -> None:
+        self.step_timings.add(step_timing)
+        print_every_n_steps = self.settings["scheduler"]["PrintStepTimingsEveryNSteps"]
+        if 0 < print_every_n_steps and len(self.step_timings) % print_every_n_steps == 0:
+            print(f"Step timings after {len(self.step_timings)} steps:")
+            print(self.step_timings.format_summary())
+            print()
+
+    def finish_step_timings(self, results_file_paths: List[str], pumps_of_protocols: Optional[List[set[int]]] = None) -> None:
+        print("Step timings of the run:")
+        print(self.step_timings.format_summary())
+        print()
+        if self.settings["scheduler"]["ShouldSaveStepTimings"]:
+            if pumps_of_protocols is None:
+                pumps_of_protocols = [None]*len(results_file_paths)
+            for results_file_path, pumps in zip(results_file_paths, pumps_of_protocols):
+                # E.g. "run_results_timings.csv" for "run_results.xlsx"
+                self.step_timings.save(f"{os.path.splitext(results_file_path)[0]}_timings.csv", pumps)
+
+    # The ph-meter always returns the values of all four probes of a module, so when multiple tasks using the same
+    # module are ready at around the same time, they can all be handled using a single reading.
+    def get_tasks_sharing_module_read(self, current_task: PumpTask, task_queue: List[PumpTask]) -> List[PumpTask]:
+        window_in_seconds = self.settings["scheduler"]["ModuleBatchingWindowInSeconds"]
+        if window_in_seconds <= 0:
+            return []
+        latest_time = self.timer.now() + datetime.timedelta(seconds=window_in_seconds)
+        module_id = current_task.ph_meter_id[0]
+        tasks_sharing_module = [task for task in task_queue
+                                if task.ph_meter_id[0] == module_id and task.time_next_operation <= latest_time]
+        if 0 < len(tasks_sharing_module):
+            # By identity, as comparing the tasks would compare all their fields, including the chain of next tasks
+            ids_of_tasks_sharing_module = {id(task) for task in tasks_sharing_module}
+            task_queue[:] = [task for task in task_queue if id(task) not in ids_of_tasks_sharing_module]
+            heapq.heapify(task_queue)
+            tasks_sharing_module.sort()
+        return tasks_sharing_module
+
+    def handle_tasks_sharing_module(self, tasks: List[PumpTask], records: RecordStore, task_queue: List[PumpTask],
+                                    results_file_path: str) -> None:
+        if self.settings["scheduler"]['ShouldPrintSchedulingMessages']:
+            print(f"Handling tasks {[task.pump_id for task in tasks]} using a single reading of module {tasks[0].ph_meter_id[0]}")
+        self.wait_for_pending_pumping([task.pump_id for task in tasks])
+        step_timings = [self.start_step_timing(task) for task in tasks]
+        time_measuring_started = self.timer.now()
+        measured_ph_values = self.measure_associated_tasks_ph(tasks)
+        measure_seconds = self.get_seconds_since(time_measuring_started)
+        expected_ph_values = [task.get_expected_ph_at_current_time() for task in tasks]
+        numbers_of_pumps = self.calculate_numbers_of_pumps(tasks, expected_ph_values, measured_ph_values)
+        for task, measured_ph, step_timing, expected_ph, number_of_pumps in zip(tasks, measured_ph_values, step_timings,
+                                                                                expected_ph_values, numbers_of_pumps):
+            step_timing.measure_seconds = measure_seconds  # The reading is shared by the tasks
+            self.handle_task(task, records, task_queue, results_file_path, measured_ph, step_timing, expected_ph,
+                             number_of_pumps)
 
     def reschedule_task(self, current_task: PumpTask, delay: float, task_queue: List[PumpTask]) -> None:
-        current_task.time_next_operation = self.timer.now() + datetime.timedelta(minutes=delay)
-        if current_task.time_next_operation < current_task.get_end_time():
-            heapq.heappush(task_queue, current_task)
-        elif current_task.next_task is not None:  # It is time to start on the next task
-            self.reschedule_task(current_task.next_task, current_task.next_task.minimum_delay, task_queue)
-        # Else the task is done.
+        current_time = self.timer.now()
+        while current_task is not None:
+            current_task.time_next_operation = current_time + datetime.timedelta(minutes=delay)
+            if current_task.time_next_operation < current_task.get_end_time():
+                heapq.heappush(task_queue, current_task)
+                return
+            # It is time to start on the next segment of the task, if there is one. Otherwise the task is done.
+            current_task = current_task.get_next_segment(current_time)
+            if current_task is not None:
+                delay = current_task.minimum_delay
 
     def record_result_of_step(self, current_task: PumpTask, expected_ph: float, measured_ph: float
-                              , did_pump: bool, number_of_pumps: int, records: pd.DataFrame, results_file_path: str) -> None:
+                              , did_pump: bool, number_of_pumps: int, records: RecordStore, results_file_path: str) -> None:
         record = {"PumpTask": current_task.pump_id, "TimePoint": self.timer.now(), "ExpectedPH": expected_ph,
                   "ActualPH": measured_ph, "DidPump": did_pump, "PumpMultiplier": number_of_pumps}
         if self.settings["scheduler"]['ShouldPrintSchedulingMessages']:
@@ -112,11 +331,12 @@ class Scheduler:
                               "DidPump": record["DidPump"]}
             print(f"Did the following: {display_record}")
             print()
-        records.loc[len(records.index)] = record
+        records.append(record)
         if self.settings["scheduler"]["ShouldRecordStepsWhileRunning"]:
-            # Since it is an excel file, we can not just append the new record to the file.
-            # So we just write everything
-            self.save_recorded_data(results_file_path, records)
+            # When several protocols are run, each has its own results
+            results_file_path = self.results_file_paths_of_pumps.get(current_task.pump_id, results_file_path)
+            # Only the new step is appended to the journal. The excel file is written when the run is done.
+            self.get_results_journal(results_file_path).append(record)
 
     def measure_associated_task_ph(self, current_task: PumpTask) -> float:
         try:
@@ -127,6 +347,17 @@ class Scheduler:
             measured_ph = float("NaN")
         return measured_ph
 
+    def measure_associated_tasks_ph(self, tasks: List[PumpTask]) -> List[float]:
+        probe_ids = [task.get_ph_probe_id() for task in tasks]
+        try:
+            ph_values = self.physical_systems.get_ph_values_of_selected_probes(probe_ids)
+            measured_ph_values = [ph_values[probe_id] for probe_id in probe_ids]
+        except Exception as e:
+            # Just like when measuring a single task, the tasks will then be rescheduled for 10 seconds later.
+            Logger.standardLogger.log(e)
+            measured_ph_values = [float("NaN")]*len(tasks)
+        return measured_ph_values
+
     def get_next_ready_task(self, task_queue: List[PumpTask]) -> PumpTask:
         current_task = heapq.heappop(task_queue)
         if self.settings["scheduler"]['ShouldPrintSchedulingMessages']:
@@ -137,95 +368,245 @@ class Scheduler:
     def should_pump(self, expected_ph: float, measured_ph: float) -> bool:
         return not math.isnan(measured_ph) and measured_ph < expected_ph
 
-    def initialize_task_priority_queue(self, protocol: pd.DataFrame) -> List[PumpTask]:
+    def initialize_task_priority_queue(self, protocol: pd.DataFrame,
+                                       start_time: Optional[datetime.datetime] = None) -> List[PumpTask]:
         task_queue = []
-        start_time = self.timer.now()  # We want the same start time for all the tasks
-        for index, row in protocol.iterrows():
-            pump_id = row["Pump"]
-            on_or_off = row["On/off"]
+        if start_time is None:
+            start_time = self.timer.now()  # We want the same start time for all the tasks
+        self.tasks_start_time = start_time
+        segment_table = get_segment_table(protocol)
+        for row, (pump_id, on_or_off, ph_probe) in enumerate(zip(protocol["Pump"].to_list(), protocol["On/off"].to_list(),
+                                                                 protocol["pH probe"].to_list())):
             if on_or_off == 0:
                 continue
-            ph_meter_id: (str, str) = tuple(row["pH probe"].split("_"))
-            remaining_information = row.to_list()[3:]
-            current_pump_task = self.get_pump_task_from_information_list(pump_id, on_or_off, ph_meter_id,
-                                                                         start_time, remaining_information)
-            heapq.heappush(task_queue, current_pump_task)
+            ph_meter_id: (str, str) = tuple(ph_probe.split("_"))
+            if self.settings["scheduler"]["ShouldUseSegmentTableTasks"]:
+                current_pump_task = self.get_segment_table_pump_task(pump_id, ph_meter_id, start_time, segment_table, row)
+            else:
+                current_pump_task = self.get_pump_task_from_segment_table(pump_id, ph_meter_id, start_time, segment_table, row)
+            if current_pump_task is not None:
+                if self.task_clock is not None:
+                    self.set_clock_of_task(current_pump_task)
+                heapq.heappush(task_queue, current_pump_task)
         return task_queue
 
-    # Recursive parsing of pump tasks
-    def get_pump_task_from_information_list(self, pump_id: int, on_or_off: str, ph_meter_id: (str, str),
-                                            start_time: datetime, information: list) -> Optional[PumpTask]:
-        # The information is nan if there are only some rows in the protocol with multiple tasks.
-        if len(information) == 0 or math.isnan(information[0]):
+    def set_clock_of_task(self, task: PumpTask) -> None:
+        # The waiting messages of the tasks are only printed together with the other scheduling messages,
+        # as a simulated run would otherwise print them thousands of times a second.
+        while task is not None:
+            task.timer = self.task_clock
+            task.datetimer = self.task_clock
+            task.shouldPrintWhenWaiting = self.settings["scheduler"]["ShouldPrintSchedulingMessages"]
+            task = task.next_task
+
+    def get_pump_task_from_segment_table(self, pump_id: int, ph_meter_id: (str, str), start_time: datetime,
+                                         segment_table: SegmentTable, row: int) -> Optional[PumpTask]:
+        # The segments of the row are linked from the last one, so that each task knows the task after it.
+        # They share a controller, so that what it has learned about the sample is not lost, see start_new_segment.
+        controller = self.create_controller()
+        next_task = None
+        for segment in reversed(range(segment_table.number_of_segments[row])):
+            segment_start_time = start_time + datetime.timedelta(minutes=segment_table.start_offset[row, segment].item())
+            next_task = PumpTask(pump_id=pump_id,
+                                 ph_meter_id=ph_meter_id,
+                                 task_time=segment_table.task_time[row, segment].item(),
+                                 ph_at_start=segment_table.ph_at_start[row, segment].item(),
+                                 ph_at_end=segment_table.ph_at_end[row, segment].item(),
+                                 dose_volume=segment_table.dose_volume[row, segment].item(),
+                                 minimum_delay=segment_table.minimum_delay[row, segment].item(),
+                                 start_time=segment_start_time,
+                                 time_next_operation=segment_start_time,
+                                 next_task=next_task,
+                                 controller=controller)
+        return next_task
+
+    def get_segment_table_pump_task(self, pump_id: int, ph_meter_id: (str, str), start_time: datetime,
+                                    segment_table: SegmentTable, row: int) -> Optional[SegmentTablePumpTask]:
+        number_of_segments = segment_table.number_of_segments[row]
+        if number_of_segments == 0:
             return None
-        else:
-            task_time, ph_at_start, ph_at_end, dose_volume, minimum_delay = tuple(information[0:5])
-            next_task = self.get_pump_task_from_information_list(pump_id, on_or_off, ph_meter_id,
-                                                                 start_time + datetime.timedelta(minutes=task_time), information[5:])
-            return PumpTask(pump_id=pump_id,
-                            ph_meter_id=ph_meter_id,
-                            task_time=task_time,
-                            ph_at_start=ph_at_start,
-                            ph_at_end=ph_at_end,
-                            dose_volume=dose_volume,
-                            minimum_delay=minimum_delay,
-                            start_time=start_time,
-                            time_next_operation=start_time,
-                            next_task=next_task,
-                            controller=DerivativeControllerWithMemory())
+        task_time = segment_table.task_time[row, :number_of_segments]
+        ph_at_start = segment_table.ph_at_start[row, :number_of_segments]
+        ph_at_end = segment_table.ph_at_end[row, :number_of_segments]
+        return SegmentTablePumpTask(pump_id=pump_id,
+                                    ph_meter_id=ph_meter_id,
+                                    task_start_time=start_time,
+                                    time_next_operation=start_time,
+                                    controller=self.create_controller(),
+                                    segment_end_offsets=(segment_table.start_offset[row, :number_of_segments] + task_time).tolist(),
+                                    segment_intercepts=ph_at_start.tolist(),
+                                    segment_slopes=((ph_at_end - ph_at_start)/task_time).tolist(),
+                                    segment_dose_volumes=segment_table.dose_volume[row, :number_of_segments].tolist(),
+                                    segment_minimum_delays=segment_table.minimum_delay[row, :number_of_segments].tolist())
+
+    def create_controller(self) -> DerivativeControllerWithMemory:
+        dosing_controller = self.settings["scheduler"]["DosingController"]
+        if dosing_controller == "ModelBased":
+            return ModelBasedController()
+        if dosing_controller != "Derivative":
+            raise ValueError(f"Unknown dosing controller: {dosing_controller}")
+        if self.settings["scheduler"]["ShouldUseControllerBank"]:
+            return self.controller_bank.create_controller()
+        if self.settings["scheduler"]["ShouldUseCompactControllers"]:
+            return CompactDerivativeControllerWithMemory()
+        return DerivativeControllerWithMemory()
 
     def save_recorded_data(self, results_file_path: str, recorded_data: pd.DataFrame) -> None:
         recorded_data.to_excel(results_file_path, index=False)
 
     def restart_run(self, selected_protocol_path: str, filename_of_old_run_data: str) -> pd.DataFrame:
         selected_protocol = select_instruction_sheet(selected_protocol_path)
-        task_queue = self.initialize_task_priority_queue(selected_protocol)
-        # The tasks will have the wrong start-time. We will get the original start time from the records:
-        old_records = pd.read_excel(filename_of_old_run_data)
-        start_time = old_records["TimePoint"][0]
-        self.offset_tasks_to_new_start_time(old_records, start_time, task_queue)
-        # Then we can simply start running the tasks, and the internal logic will handle the rest.
-        self.handle_tasks_until_done(old_records, filename_of_old_run_data, task_queue)
-        return old_records
+        self.protocol_hash = load_protocol(selected_protocol_path).content_hash
+        # The old run data is either the journal of the run, or an excel file with the results.
+        results_file_path, old_records = self.load_old_run_data(filename_of_old_run_data)
+        checkpoint = load_checkpoint(get_checkpoint_path(results_file_path))
+        if checkpoint is not None and checkpoint.protocol_hash == self.protocol_hash:
+            task_queue = self.resume_tasks_from_checkpoint(selected_protocol, checkpoint, old_records)
+        else:
+            task_queue = self.initialize_task_priority_queue(selected_protocol)
+            # The tasks will have the wrong start-time. We will get the original start time from the records:
+            start_time = old_records["TimePoint"][0]
+            self.offset_tasks_to_new_start_time(old_records, start_time, task_queue)
+        if self.settings["scheduler"]["ShouldRecordStepsWhileRunning"]:
+            journal = self.get_results_journal(results_file_path)
+            if journal.is_new_journal:  # Otherwise the journal already contains the old steps
+                journal.append_all(old_records)
+        try:
+            # Then we can simply start running the tasks, and the internal logic will handle the rest.
+            records = RecordStore.from_dataframe(old_records)
+            self.number_of_records_at_last_checkpoint = len(records)
+            self.handle_tasks_until_done(records, results_file_path, task_queue)
+            recorded_data = records.to_dataframe()
+            self.save_recorded_data(results_file_path, recorded_data)
+            self.finish_step_timings([results_file_path])
+            self.close_results_journals()
+        finally:
+            self.physical_systems.disconnect(selected_protocol)
+        return recorded_data
+
+    def load_old_run_data(self, filename_of_old_run_data: str) -> (str, pd.DataFrame):
+        if filename_of_old_run_data.endswith(".csv"):
+            results_file_path = f"{os.path.splitext(filename_of_old_run_data)[0]}.xlsx"
+            old_records = load_journal(filename_of_old_run_data)
+        elif os.path.exists(get_journal_path(filename_of_old_run_data)):
+            # The journal contains the same steps as the excel file, and it is much faster to read.
+            results_file_path = filename_of_old_run_data
+            old_records = load_journal(get_journal_path(filename_of_old_run_data))
+        else:
+            results_file_path = filename_of_old_run_data
+            old_records = pd.read_excel(filename_of_old_run_data)
+        return results_file_path, old_records
 
     def offset_tasks_to_new_start_time(self, old_records: pd.DataFrame, start_time: datetime, tasks: list[PumpTask]):
+        last_times_tasks_were_handled = old_records.groupby("PumpTask")["TimePoint"].last()
         for task in tasks:
             task.start_time = start_time
-            task_records = old_records.loc[old_records['PumpTask'] == task.pump_id]
-            last_time_task_was_handled = task_records["TimePoint"][task_records.index[len(task_records.index) - 1]]
+            last_time_task_was_handled = last_times_tasks_were_handled[task.pump_id]
             task.time_next_operation = last_time_task_was_handled + datetime.timedelta(minutes=task.minimum_delay)
 
+    # Checkpoints
+
+    def is_checkpoint_due(self, records: RecordStore) -> bool:
+        # The checkpoint is only useful together with the journal, which contains the steps that have been recorded.
+        checkpoint_every_n_steps = self.settings["scheduler"]["CheckpointEveryNSteps"]
+        if checkpoint_every_n_steps <= 0 or not self.settings["scheduler"]["ShouldRecordStepsWhileRunning"] \
+                or self.protocol_hash is None:  # Several protocols are being run
+            return False
+        return checkpoint_every_n_steps <= len(records) - self.number_of_records_at_last_checkpoint
+
+    def save_checkpoint(self, number_of_records: int, results_file_path: str, tasks: List[PumpTask]) -> None:
+        task_states = [TaskState(pump_id=task.pump_id,
+                                 segment_start_time=task.start_time,
+                                 time_next_operation=task.time_next_operation,
+                                 controller_state=task.controller.get_state())
+                       for task in tasks]
+        checkpoint = SchedulerCheckpoint(protocol_hash=self.protocol_hash,
+                                         start_time=self.start_time,
+                                         tasks_start_time=self.tasks_start_time,
+                                         time_point=self.timer.now(),
+                                         number_of_records=number_of_records,
+                                         task_states=task_states)
+        save_checkpoint(get_checkpoint_path(results_file_path), checkpoint)
+        self.number_of_records_at_last_checkpoint = number_of_records
+
+    def resume_tasks_from_checkpoint(self, protocol: pd.DataFrame, checkpoint: SchedulerCheckpoint,
+                                     old_records: pd.DataFrame) -> List[PumpTask]:
+        # The tasks continue in the segment they were in, with the controllers remembering what they did.
+        # Tasks that are not in the checkpoint were done.
+        self.start_time = checkpoint.start_time
+        task_states = {task_state.pump_id: task_state for task_state in checkpoint.task_states}
+        task_queue = []
+        for task in self.initialize_task_priority_queue(protocol, checkpoint.tasks_start_time):
+            task_state = task_states.get(task.pump_id)
+            if task_state is None:
+                continue
+            task = task.get_segment_starting_at(task_state.segment_start_time)
+            task.time_next_operation = task_state.time_next_operation
+            task.controller.set_state(task_state.controller_state)
+            task_queue.append(task)
+
+        # Steps can have been recorded after the checkpoint was made, in which case those tasks continue after them.
+        records_after_checkpoint = old_records.iloc[checkpoint.number_of_records:]
+        last_times_tasks_were_handled = records_after_checkpoint.groupby("PumpTask")["TimePoint"].last()
+        for task in task_queue:
+            if task.pump_id in last_times_tasks_were_handled.index:
+                last_time_task_was_handled = last_times_tasks_were_handled[task.pump_id]
+                task.time_next_operation = last_time_task_was_handled + datetime.timedelta(minutes=task.minimum_delay)
+        heapq.heapify(task_queue)
+        return task_queue
+
     def run_ensure_correct_start_pH_value(self, protocol: pd.DataFrame, task_queue: list[PumpTask]) -> None:
-        wait_time_in_minutes = 1.0
-        any_ph_below_start_ph_value = True
-        dose_multiplication_factor = self.settings["scheduler"]["IncreasedPumpFactorWhenPerformingInitialCorrection"]
+        maximum_number_of_pumps = math.floor(self.settings["scheduler"]["IncreasedPumpFactorWhenPerformingInitialCorrection"])
+        minimum_wait = self.settings["scheduler"]["InitialCorrectionMinimumWaitInSeconds"]
+        maximum_wait = self.settings["scheduler"]["InitialCorrectionMaximumWaitInSeconds"]
         # Will continue running until all pumptasks have a pH above the ph_at_start value.
         print("The program will now ensure that the pH values of all the solutions are above the target start values.")
-        print("It will continue pumping every minute until this is the case.")
-
-        target_ph_values = dict()
-        for task in task_queue:
-            target_ph_values[task.pump_id] = task.ph_at_start
-
-        while any_ph_below_start_ph_value:
-            any_ph_below_start_ph_value = False
-            measured_ph_values = dict()
-            for current_task in task_queue:
-                measured_ph = self.measure_associated_task_ph(current_task)
-                measured_ph_values[current_task.pump_id] = round(measured_ph, 2)
-                if self.should_pump(current_task.ph_at_start, measured_ph):
-                    any_ph_below_start_ph_value = True
-                    for i in range(math.floor(dose_multiplication_factor)):
-                        self.physical_systems.pump(current_task.pump_id)
-            print(f"Measured pH: {measured_ph_values}")
-            print(f"Target pH:   {target_ph_values}")
+        print(f"It will continue pumping every {minimum_wait} to {maximum_wait} seconds until this is the case.")
+
+        # The samples are corrected concurrently: the samples due to be checked are read together, one reading per
+        # pH module, and all of them below their target are then pumped. Each sample waits as long as its measured
+        # response to the base allows, and is done as soon as it has reached its target.
+        corrections = [InitialPhCorrection(task, task.ph_at_start, self.timer.now()) for task in task_queue]
+        while 0 < len(corrections):
+            time_next_check = min(correction.time_next_check for correction in corrections)
+            seconds_to_wait = (time_next_check - self.timer.now()).total_seconds()
+            if 0 < seconds_to_wait:
+                self.sleeper.sleep(seconds_to_wait)
+            due_corrections = self.get_due_initial_corrections(corrections, time_next_check)
+            self.wait_for_pending_pumping([correction.task.pump_id for correction in due_corrections])
+            measured_ph_values = self.measure_associated_tasks_ph([correction.task for correction in due_corrections])
+            # If the sleep returned early, the checks are still scheduled from the time they were due
+            current_time = max(self.timer.now(), time_next_check)
+
+            for correction, measured_ph in zip(due_corrections, measured_ph_values):
+                correction.update_ph_increase_per_pump(measured_ph)
+                if correction.is_done(measured_ph):
+                    corrections.remove(correction)
+                    continue
+                if self.should_pump(correction.target_ph, measured_ph):
+                    correction.number_of_pumps_last_time = correction.get_number_of_pumps(measured_ph, maximum_number_of_pumps)
+                    self.pump_n_times(correction.task, correction.number_of_pumps_last_time)
+                    wait = correction.get_wait_in_seconds(measured_ph, minimum_wait, maximum_wait)
+                else:  # The pH could not be measured
+                    correction.number_of_pumps_last_time = 0
+                    wait = minimum_wait
+                correction.time_next_check = current_time + datetime.timedelta(seconds=wait)
+
+            print(f"Measured pH: {dict((correction.task.pump_id, round(ph, 2)) for correction, ph in zip(due_corrections, measured_ph_values))}")
+            print(f"Target pH:   {dict((correction.task.pump_id, correction.target_ph) for correction in due_corrections)}")
             print()
-            time.sleep(wait_time_in_minutes*60)
 
+        self.wait_for_pending_pumping(list(self.pending_pumping.keys()))
         print("All pH's are now above the desired starting values.")
 
-        # Removing the multiplication factor
-        #PhysicalSystems.set_pump_dose_multiplication_factor(protocol, 1)
+    def get_due_initial_corrections(self, corrections: List[InitialPhCorrection],
+                                    time_next_check: datetime.datetime) -> List[InitialPhCorrection]:
+        # The samples sharing a pH module with a due sample are read along with it if they are due within the window.
+        window = datetime.timedelta(seconds=self.settings["scheduler"]["ModuleBatchingWindowInSeconds"])
+        due_modules = {correction.task.ph_meter_id[0] for correction in corrections
+                       if correction.time_next_check <= time_next_check}
+        return [correction for correction in corrections if correction.time_next_check <= time_next_check or
+                (correction.task.ph_meter_id[0] in due_modules and correction.time_next_check <= time_next_check + window)]
 
     def calculate_number_of_pumps(self, controller: DerivativeControllerWithMemory, expected_ph: float, measured_ph: float):
         if self.adaptive_pumping_currently_enabled():
@@ -233,6 +614,17 @@ class Scheduler:
         else:
             return 1 if measured_ph < expected_ph else 0
 
+    def calculate_numbers_of_pumps(self, tasks: List[PumpTask], expected_ph_values: List[float],
+                                   measured_ph_values: List[float]) -> List[int]:
+        # The controllers of tasks sharing a reading are run in one call when they are all in the controller bank.
+        if self.adaptive_pumping_currently_enabled() and \
+                all(isinstance(task.controller, BankedController) and task.controller.bank is self.controller_bank
+                    for task in tasks):
+            indices = [task.controller.index for task in tasks]
+            return self.controller_bank.calculate_outputs(indices, expected_ph_values, measured_ph_values).tolist()
+        return [self.calculate_number_of_pumps(task.controller, expected_ph, measured_ph)
+                for task, expected_ph, measured_ph in zip(tasks, expected_ph_values, measured_ph_values)]
+
     def adaptive_pumping_currently_enabled(self) -> bool:
         adaptive_start_time = self.settings["scheduler"]["AdaptivePumpingActivateAfterNHours"]
         return adaptive_start_time <= 0 or self.start_time + datetime.timedelta(hours=adaptive_start_time) < self.timer.now()
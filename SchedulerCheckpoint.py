@@ -0,0 +1,53 @@
+import datetime
+import os
+import pickle
+from dataclasses import dataclass
+from typing import Optional
+
+CHECKPOINT_VERSION = 1
+
+
+@dataclass
+class TaskState:
+    # What is needed to continue a task where it was: which segment it is on, when it should be handled next,
+    # and what its controller remembers.
+    pump_id: int
+    segment_start_time: datetime.datetime
+    time_next_operation: datetime.datetime
+    controller_state: dict
+
+
+@dataclass
+class SchedulerCheckpoint:
+    protocol_hash: str  # The checkpoint can only be used with the protocol it was made from
+    start_time: datetime.datetime  # Start of the run
+    tasks_start_time: datetime.datetime  # The time the first segment of the tasks started
+    time_point: datetime.datetime  # When the checkpoint was made
+    number_of_records: int  # The number of steps recorded when the checkpoint was made
+    task_states: list[TaskState]  # The tasks that are not done yet
+    version: int = CHECKPOINT_VERSION
+
+
+def get_checkpoint_path(results_file_path: str) -> str:
+    return f"{os.path.splitext(results_file_path)[0]}.checkpoint"
+
+
+def save_checkpoint(checkpoint_path: str, checkpoint: SchedulerCheckpoint) -> None:
+    # The checkpoint is written to a temporary file first, which then replaces the old checkpoint.
+    # This way there is always a complete checkpoint, even if the program crashes while writing it.
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "wb") as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path: str) -> Optional[SchedulerCheckpoint]:
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "rb") as file:
+        checkpoint = pickle.load(file)
+    if checkpoint.version != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
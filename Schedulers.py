@@ -0,0 +1,19 @@
+from AsyncScheduler import AsyncScheduler
+from DeadlineScheduler import DeadlineScheduler
+from PhysicalSystemsInterface import PhysicalSystemsInterface
+from Scheduler import Scheduler
+
+# The scheduling policies that can be selected using the SchedulingPolicy setting
+SCHEDULING_POLICIES = {"EarliestStart": Scheduler, "EarliestDeadline": DeadlineScheduler}
+
+
+def create_scheduler(settings: dict, physical_systems: PhysicalSystemsInterface) -> Scheduler:
+    scheduling_policy = settings["scheduler"]["SchedulingPolicy"]
+    if scheduling_policy not in SCHEDULING_POLICIES:
+        raise ValueError(f"Unknown scheduling policy \"{scheduling_policy}\", "
+                         f"it should be one of {list(SCHEDULING_POLICIES)}")
+    if settings["scheduler"]["ShouldUseAsyncScheduler"]:
+        if scheduling_policy != "EarliestStart":
+            raise ValueError("The async scheduler can only be used with the EarliestStart scheduling policy")
+        return AsyncScheduler(settings, physical_systems)
+    return SCHEDULING_POLICIES[scheduling_policy](settings, physical_systems)
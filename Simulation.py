@@ -0,0 +1,196 @@
+import abc
+import datetime
+import random
+import threading
+from typing import List, Optional
+
+import pandas as pd
+
+from PhMeter import PhMeter
+from PhysicalSystems import PhysicalSystems
+from PhysicalSystemsInterface import PhysicalSystemsInterface
+from Schedulers import create_scheduler
+from VirtualClock import VirtualClock
+
+NERNST_SLOPE_IN_MV_PER_PH = -59.16  # At 25 degrees celsius. Used for the probes without calibration data
+NEUTRAL_PH = 7.0
+
+
+class SimulatedPlant:
+    # The samples measured by the probes. They get more acidic with time, like samples with acid producing bacteria,
+    # and the base pumped into a sample raises its pH. The pH is updated when it is used, using the time passed since.
+
+    def __init__(self, simulation_settings: dict, clock: VirtualClock) -> None:
+        self.settings = simulation_settings
+        self.clock = clock
+        self.ph_of_probes: dict[str, float] = dict()
+        self.ph_of_unused_samples = simulation_settings["InitialPH"]  # The samples without a pH of their own yet
+        self.time_of_last_update = clock.now()
+        self.random = random.Random(simulation_settings["RandomSeed"])
+        self.lock = threading.Lock()  # The ph-meter and the pumps are used by different threads
+
+    def get_measured_ph(self, probe_id: str) -> float:
+        with self.lock:
+            self.update_to_current_time()
+            return self.get_ph(probe_id) + self.random.gauss(0, self.settings["MeasurementNoiseInPH"])
+
+    def add_base(self, probe_id: str, volume: float) -> None:
+        # The volume is in micro liters, like the volumes of the pumps.
+        with self.lock:
+            self.update_to_current_time()
+            self.ph_of_probes[probe_id] = self.get_ph(probe_id) + volume*self.settings["PHIncreasePerMicroLiterOfBase"]
+
+    def get_ph(self, probe_id: str) -> float:
+        return self.ph_of_probes.get(probe_id, self.ph_of_unused_samples)
+
+    def update_to_current_time(self) -> None:
+        current_time = self.clock.now()
+        hours_passed = (current_time - self.time_of_last_update).total_seconds()/3600
+        self.time_of_last_update = current_time
+        ph_decrease = hours_passed*self.settings["AcidProductionInPHPerHour"]
+        for probe_id in self.ph_of_probes:
+            self.ph_of_probes[probe_id] -= ph_decrease
+        self.ph_of_unused_samples -= ph_decrease
+
+
+class SimulatedSerialConnection(abc.ABC):
+    # Used instead of a serial.Serial. The replies to the commands written to it can then be read, like from a device.
+
+    def __init__(self) -> None:
+        self.dtr = False
+        self.read_buffer = b''
+
+    def write(self, command: bytes) -> None:
+        self.read_buffer += self.get_reply(command)
+
+    @abc.abstractmethod
+    def get_reply(self, command: bytes) -> bytes:
+        pass
+
+    def read(self, number_of_bytes: int = 1) -> bytes:
+        reply = self.read_buffer[:number_of_bytes]
+        self.read_buffer = self.read_buffer[number_of_bytes:]
+        return reply
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.read_buffer)
+
+    def read_all(self) -> bytes:
+        return self.read(len(self.read_buffer))
+
+    def readline(self) -> bytes:
+        end_of_line = self.read_buffer.find(b'\n')
+        return self.read(len(self.read_buffer) if end_of_line < 0 else end_of_line + 1)
+
+    def close(self) -> None:
+        pass
+
+
+class SimulatedPhMeterConnection(SimulatedSerialConnection):
+    # Replies to the mv commands like the ph-meter, with the mv values of the four probes of the module.
+
+    def __init__(self, plant: SimulatedPlant, ph_meter: PhMeter) -> None:
+        super().__init__()
+        self.plant = plant
+        self.ph_meter = ph_meter  # For the calibration data, which is used to convert the pH values to mv values
+        self.time_of_reply = plant.clock.time()
+        self.random = random.Random(plant.settings["RandomSeed"])  # Separate from the noise of the plant
+
+    def write(self, command: bytes) -> None:
+        super().write(command)
+        self.time_of_reply = self.plant.clock.time() + self.plant.settings["PhMeterResponseTimeInSeconds"]
+
+    @property
+    def in_waiting(self) -> int:
+        # The reply arrives after the response time of the ph-meter
+        if self.plant.clock.time() < self.time_of_reply:
+            return 0
+        return len(self.read_buffer)
+
+    def get_reply(self, command: bytes) -> bytes:
+        device_id_bytes = command[3:7]
+        module_id = ".".join(f"{byte:X}" for byte in device_id_bytes)
+        mv_bytes = b''
+        for probe in range(1, 5):
+            mv_value = self.get_mv_value(f"{module_id}_{probe}")
+            # The ph-meter uses units of 0.1 mv, in two's complement
+            mv_bytes += max(-32768, min(32767, round(mv_value*10))).to_bytes(2, "big", signed=True)
+        reply = b'P' + bytes([14, command[2]]) + device_id_bytes + mv_bytes
+        reply += bytes([sum(reply) % 256])
+        if self.random.random() < self.plant.settings["CorruptReplyProbability"]:
+            # Like noise on the line, which changes a byte of the reply but keeps its length
+            position = self.random.randrange(len(reply))
+            reply = reply[:position] + bytes([reply[position] ^ 0x10]) + reply[position + 1:]
+        return reply + b'\r\n'
+
+    def get_mv_value(self, probe_id: str) -> float:
+        ph_value = self.plant.get_measured_ph(probe_id)
+        if probe_id not in self.ph_meter.probe_calibration_data:
+            return (ph_value - NEUTRAL_PH)*NERNST_SLOPE_IN_MV_PER_PH
+        # The inverse of PhMeter.convert_mv_value_to_ph_value
+        probe_calibration = self.ph_meter.probe_calibration_data[probe_id]
+        ph_slope = (probe_calibration["LowPH"] - probe_calibration["HighPH"]) / \
+                   (probe_calibration["LowPHmV"] - probe_calibration["HighPHmV"])
+        return probe_calibration["LowPHmV"] + (ph_value - probe_calibration["LowPH"])/ph_slope
+
+
+class SimulatedPumpConnection(SimulatedSerialConnection):
+    # Pumps the volume set for a pump into the sample of the probe associated with the pump.
+
+    def __init__(self, plant: SimulatedPlant, pump_to_probe: dict[str, str]) -> None:
+        super().__init__()
+        self.plant = plant
+        self.pump_to_probe = pump_to_probe  # Filled in when the pumps of the protocol are initialized
+        self.pump_volumes: dict[str, float] = dict()
+
+    def get_reply(self, command: bytes) -> bytes:
+        pump_id, *arguments = command.decode("charmap").strip().split(" ")
+        if arguments == ["RUN"]:
+            if pump_id in self.pump_to_probe:
+                self.plant.add_base(self.pump_to_probe[pump_id], self.pump_volumes.get(pump_id, 0))
+        elif arguments[:1] == ["VOL"] and len(arguments) == 2 and arguments[1] != "UL":
+            self.pump_volumes[pump_id] = float(arguments[1])
+        elif "ADR" in arguments or pump_id == "*ADR":
+            address = int(pump_id) if pump_id.isdigit() else 0
+            return f"\x02{address:02d}S\x03".encode("charmap")
+        return b''
+
+
+class SimulatedPhysicalSystems(PhysicalSystems, PhysicalSystemsInterface):
+    # The ph-meter and the pumps, with a simulated plant (see the simulation settings) instead of the real devices.
+    # Everything else is the same as in a real run, except that the waiting is done using the virtual clock.
+
+    def __init__(self, settings, clock: VirtualClock) -> None:
+        super().__init__(settings)
+        self.plant = SimulatedPlant(self.settings["simulation"], clock)
+        self.use_clock(clock)
+
+    def initialize_systems(self) -> None:
+        self.ph_meter.serial_connection = SimulatedPhMeterConnection(self.plant, self.ph_meter)
+        self.pump_system.serial_connection = SimulatedPumpConnection(self.plant, self.pump_to_probe)
+
+    def start_ph_polling(self) -> None:
+        # Not used when simulating, as the poller waits in real time, while its readings would move the virtual clock.
+        pass
+
+    def disconnect(self, protocol: pd.DataFrame) -> None:
+        self.ph_meter_worker.stop()
+        self.pump_worker.stop()
+
+
+def simulate_protocol(settings: dict, protocol_path: str, start_time: Optional[datetime.datetime] = None) -> pd.DataFrame:
+    # Runs the protocol like a real run, but with the simulated physical systems and a virtual clock, so that a run of
+    # several days is done in seconds. The results are saved next to the protocol, like the results of a real run.
+    return simulate_protocols(settings, [protocol_path], start_time=start_time)[0]
+
+
+def simulate_protocols(settings: dict, protocol_paths: List[str], start_delays_in_minutes: Optional[List[float]] = None,
+                       start_time: Optional[datetime.datetime] = None) -> List[pd.DataFrame]:
+    # Like simulate_protocol, with the protocols run at the same time by one scheduler, see Scheduler.start_protocols
+    clock = VirtualClock(start_time)
+    physical_systems = SimulatedPhysicalSystems(settings, clock)
+    physical_systems.initialize_systems()
+    scheduler = create_scheduler(settings, physical_systems)
+    scheduler.use_clock(clock)
+    return scheduler.start_protocols(protocol_paths, start_delays_in_minutes)
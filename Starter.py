@@ -1,8 +1,12 @@
+import datetime
+import time
+
 import yaml
 
 from ClientCLI import ClientCLI
 import Logger
 from Networking.PhysicalSystemServer import PhysicalSystemServer
+from Simulation import simulate_protocol
 
 
 class Starter:
@@ -27,6 +31,8 @@ class Starter:
             elif inputCommand == "3":
                 cli = ClientCLI(communicate_via_network=True)
                 cli.start()
+            elif inputCommand == "4":
+                self.simulate_run()
             else:
                 print("Invalid input, try again.")
             pass
@@ -40,9 +46,21 @@ class Starter:
         print(f"1 - Start the program the normal way. Use this if only one instance of a protocol needs to be run at the same time.")
         print(f"2 - Start a pH-meter physical systems server, that manages the pH-meter and the pump system. Only instantiate one server.")
         print(f"3 - Start at pH-meter client. Multiple clients can be started at the same time. The server needs to be started first.")
+        print(f"4 - Simulate a run of the protocol in the config file, without the pH-meter and the pumps. Takes seconds instead of days.")
         print()
         print("Input: ")
 
+    def simulate_run(self):
+        protocol_path = self.settings["protocol_path"]
+        print(f"Simulating a run of {protocol_path}")
+        time_started = time.time()
+        recorded_data = simulate_protocol(self.settings, protocol_path)
+        ph_differences = (recorded_data["ActualPH"] - recorded_data["ExpectedPH"]).abs()
+        print(f"Simulated {recorded_data['TimePoint'].iloc[-1] - recorded_data['TimePoint'].iloc[0]} "
+              f"in {datetime.timedelta(seconds=round(time.time() - time_started))}")
+        print(f"Steps: {len(recorded_data)}, pumps: {recorded_data['PumpMultiplier'].sum()}, "
+              f"largest difference between the expected and measured pH: {round(ph_differences.max(), 2)}")
+
     def load_settings(self, settings_path: str) -> dict:
         with open(settings_path, 'r') as file:
             return yaml.safe_load(file)
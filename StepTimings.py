@@ -0,0 +1,115 @@
+import datetime
+from array import array
+from dataclasses import dataclass
+from typing import Collection, Optional
+
+import numpy as np
+import pandas as pd
+
+from PumpTasks import to_datetime, to_timestamp
+
+TIMING_COLUMNS = ["PumpTask", "ScheduledTime", "StartTime", "LatenessSeconds", "MeasureSeconds", "PumpSeconds",
+                  "PersistenceSeconds", "MinimumDelaySeconds"]
+DURATION_COLUMNS = ["LatenessSeconds", "MeasureSeconds", "PumpSeconds", "PersistenceSeconds"]
+PERCENTILES = [50, 90, 95, 99]
+# In seconds. A step being more than a minimum delay late means that a dosing window was missed.
+LATENESS_BIN_EDGES = [-np.inf, 0, 1, 5, 10, 30, 60, 120, 300, np.inf]
+
+
+@dataclass
+class StepTiming:
+    # When a step of a task was supposed to start and when it did, and how long each part of the step took.
+    pump_id: int
+    scheduled_time: datetime.datetime  # The time_next_operation of the task
+    start_time: datetime.datetime
+    minimum_delay: float  # minutes
+    measure_seconds: float = 0.0
+    pump_seconds: float = 0.0  # When pumping in the background, it is updated once the pumping is done
+    persistence_seconds: float = 0.0  # Recording the step, including the journal
+    row: Optional[int] = None  # Of the step in the StepTimings, once it has been added
+
+    @property
+    def lateness_seconds(self) -> float:
+        # Negative when the step is handled early, e.g. together with other tasks using the same pH module.
+        return (self.start_time - self.scheduled_time).total_seconds()
+
+
+class StepTimings:
+    # The timings of all the steps of a run, stored column by column like the RecordStore.
+    # Percentiles and histograms per task can be made at any time, also while running.
+
+    def __init__(self) -> None:
+        self.pump_ids = array("q")
+        self.columns = {column: array("d") for column in TIMING_COLUMNS if column != "PumpTask"}
+
+    def __len__(self) -> int:
+        return len(self.pump_ids)
+
+    def add(self, step_timing: StepTiming) -> None:
+        step_timing.row = len(self.pump_ids)
+        self.pump_ids.append(step_timing.pump_id)
+        self.columns["ScheduledTime"].append(to_timestamp(step_timing.scheduled_time))
+        self.columns["StartTime"].append(to_timestamp(step_timing.start_time))
+        self.columns["LatenessSeconds"].append(step_timing.lateness_seconds)
+        self.columns["MeasureSeconds"].append(step_timing.measure_seconds)
+        self.columns["PumpSeconds"].append(step_timing.pump_seconds)
+        self.columns["PersistenceSeconds"].append(step_timing.persistence_seconds)
+        self.columns["MinimumDelaySeconds"].append(step_timing.minimum_delay*60)
+
+    def update_pump_seconds(self, step_timing: StepTiming) -> None:
+        # The pumping of a step done in the background is first timed after the step has been added.
+        if step_timing.row is not None:
+            self.columns["PumpSeconds"][step_timing.row] = step_timing.pump_seconds
+
+    def get_pump_ids(self) -> np.ndarray:
+        return np.array(self.pump_ids, dtype=np.int64)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        columns = {"PumpTask": self.get_pump_ids()}
+        for column, values in self.columns.items():
+            columns[column] = np.array(values, dtype=np.float64)
+        for column in ["ScheduledTime", "StartTime"]:
+            columns[column] = [to_datetime(timestamp) for timestamp in columns[column]]
+        return pd.DataFrame(columns, columns=TIMING_COLUMNS)
+
+    def get_summary(self) -> pd.DataFrame:
+        # One row per task, with the percentiles of the lateness and of the duration of each part of the steps,
+        # and the number of steps that were more than a minimum delay late.
+        pump_ids = self.get_pump_ids()
+        summary = dict()
+        for pump_id in np.unique(pump_ids):
+            is_task = pump_ids == pump_id
+            lateness = np.array(self.columns["LatenessSeconds"])[is_task]
+            task_summary = {"Steps": int(is_task.sum()),
+                            "MissedDelays": int((np.array(self.columns["MinimumDelaySeconds"])[is_task] < lateness).sum())}
+            for column in DURATION_COLUMNS:
+                values = np.array(self.columns[column])[is_task]
+                for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                    task_summary[f"{column} p{percentile}"] = value
+                task_summary[f"{column} max"] = values.max()
+            summary[int(pump_id)] = task_summary
+        return pd.DataFrame.from_dict(summary, orient="index").rename_axis("PumpTask")
+
+    def get_histogram(self, column: str = "LatenessSeconds", bin_edges: list[float] = LATENESS_BIN_EDGES) -> pd.DataFrame:
+        # The number of steps of each task in each bin, with one row per task.
+        pump_ids = self.get_pump_ids()
+        values = np.array(self.columns[column])
+        bin_names = [f"{start}..{end}" for start, end in zip(bin_edges, bin_edges[1:])]
+        histogram = {int(pump_id): np.histogram(values[pump_ids == pump_id], bins=bin_edges)[0]
+                     for pump_id in np.unique(pump_ids)}
+        return pd.DataFrame.from_dict(histogram, orient="index", columns=bin_names).rename_axis("PumpTask")
+
+    def save(self, timings_file_path: str, pump_ids: Optional[Collection[int]] = None) -> None:
+        # Only the steps of the given tasks, if any are given
+        timings = self.to_dataframe()
+        if pump_ids is not None:
+            timings = timings.loc[timings["PumpTask"].isin(pump_ids)]
+        timings.to_csv(timings_file_path, index=False)
+
+    def format_summary(self) -> str:
+        summary = self.get_summary()
+        if len(summary.index) == 0:
+            return "No steps have been timed yet"
+        shown_columns = ["Steps", "MissedDelays", "LatenessSeconds p50", "LatenessSeconds p95", "LatenessSeconds p99",
+                         "LatenessSeconds max", "MeasureSeconds p95", "PumpSeconds p95", "PersistenceSeconds p95"]
+        return summary[shown_columns].round(3).to_string()
@@ -0,0 +1,40 @@
+import asyncio
+import datetime
+import threading
+from typing import Optional
+
+
+class VirtualClock:
+    # A clock that only moves when something sleeps, so a run of several days can be simulated in seconds.
+    # It can be used instead of both the time module and datetime.datetime, e.g. as the timer of the scheduler,
+    # the tasks, the ph-meter and the pumps.
+    # Sleeps made at the same time by different threads (like the ph-meter and the pump threads) add up,
+    # so a simulated run can take a bit longer than the real run would.
+
+    def __init__(self, start_time: Optional[datetime.datetime] = None) -> None:
+        self.current_time = start_time if start_time is not None else datetime.datetime.now()
+        self.lock = threading.Lock()
+
+    def now(self) -> datetime.datetime:
+        with self.lock:
+            return self.current_time
+
+    def time(self) -> float:
+        return self.now().timestamp()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.current_time += datetime.timedelta(seconds=seconds)
+
+
+class AsyncVirtualClock:
+    # Used by the AsyncScheduler instead of asyncio when the clock is virtual.
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+
+    async def sleep(self, seconds: float) -> None:
+        self.clock.sleep(seconds)
+        await asyncio.sleep(0)  # Lets the other coroutines run, like a real sleep would
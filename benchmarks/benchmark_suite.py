@@ -0,0 +1,398 @@
+# Benchmarks of the scheduler loop, the serial codec of the ph-meter and the saving of the results, using the simulated
+# ph-meter and pumps, so that it can be run without the devices. The results are printed and saved as json, so they
+# can be compared over time. Run from the root of the repository: python benchmarks/benchmark_suite.py
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_per_task import create_protocol  # noqa: E402
+from Controllers import CompactDerivativeControllerWithMemory, ControllerBank, DerivativeControllerWithMemory  # noqa: E402
+from Networking.SerialCommands import PhSerialCommand, SerialReply  # noqa: E402
+from PhCalibrationTable import PhCalibrationTable  # noqa: E402
+from RecordStore import RecordStore  # noqa: E402
+import Scheduler as scheduler_module  # noqa: E402
+from Scheduler import Scheduler  # noqa: E402
+from Simulation import SimulatedPhMeterConnection, SimulatedPhysicalSystems  # noqa: E402
+from VirtualClock import VirtualClock  # noqa: E402
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_SUITE_VERSION = 1
+
+# The sizes used by each benchmark, with --quick using the smaller ones
+SIZES = {"full": {"scheduler_tasks": [12, 96], "scheduler_hours": 24, "codec_iterations": 20000,
+                  "record_rows": 100000, "save_rows": [1000, 10000, 50000], "save_tasks": [12, 96],
+                  "checkpoint_tasks": [12, 96, 1000], "controller_tasks": [12, 96, 1000], "controller_steps": 200},
+         "quick": {"scheduler_tasks": [12], "scheduler_hours": 2, "codec_iterations": 2000,
+                   "record_rows": 10000, "save_rows": [1000], "save_tasks": [12],
+                   "checkpoint_tasks": [12, 96], "controller_tasks": [12, 96], "controller_steps": 50}}
+
+
+class NoKeypressDetector:
+    # Used instead of the KeypressDetector, as no one presses a key during the benchmarks,
+    # and its thread waiting for input would otherwise keep reading from stdin.
+
+    def get_has_key_been_pressed(self) -> bool:
+        return False
+
+
+class TimedRecordStore(RecordStore):
+    # Remembers when each step was recorded, so that the time used per step can be found.
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.append_times: list[float] = []
+
+    def append(self, record: dict) -> None:
+        super().append(record)
+        self.append_times.append(time.perf_counter())
+
+
+def load_settings(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        settings = yaml.safe_load(file)
+    settings["calibration_data_path"] = os.path.join(REPOSITORY_PATH, "calibration_data.yml")
+    settings["scheduler"]["ShouldPrintSchedulingMessages"] = False
+    return settings
+
+
+def get_ideal_calibration_data(ph_probes: list[str]) -> dict:
+    # The probes of the generated protocols are not in the calibration data, so they get the ideal calibration
+    return {probe: {"HighPH": 7.0, "HighPHmV": 0.0, "LowPH": 4.0, "LowPHmV": 177.48} for probe in ph_probes}
+
+
+def get_percentiles_in_microseconds(durations: list[float]) -> dict:
+    if len(durations) < 2:
+        return {}
+    percentiles = statistics.quantiles(durations, n=100, method="inclusive")
+    return {"mean_us": statistics.fmean(durations)*1e6,
+            "p50_us": percentiles[49]*1e6,
+            "p95_us": percentiles[94]*1e6,
+            "p99_us": percentiles[98]*1e6,
+            "max_us": max(durations)*1e6}
+
+
+def measure_seconds_per_call(function, iterations: int) -> float:
+    time_started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - time_started)/iterations
+
+
+def benchmark_scheduler_loop(settings: dict, number_of_tasks: int, hours: float, results_directory: str) -> dict:
+    # Runs the tasks using the simulated physical systems, where all the waiting is done by the virtual clock.
+    # The time between two recorded steps is then the time the program uses per step.
+    protocol = create_protocol(number_of_tasks, 1)
+    protocol.iloc[:, 3] = hours*60  # The task time of the only segment
+    clock = VirtualClock(datetime.datetime(2000, 1, 1))
+    physical_systems = SimulatedPhysicalSystems(settings, clock)
+    physical_systems.ph_meter.update_calibration_data(get_ideal_calibration_data(protocol["pH probe"].to_list()))
+    physical_systems.initialize_systems()
+    physical_systems.initialize_pumps_used_in_protocol(protocol)
+    scheduler = Scheduler(settings, physical_systems)
+    scheduler.use_clock(clock)
+    task_queue = scheduler.initialize_task_priority_queue(protocol)
+    records = TimedRecordStore()
+    results_file_path = os.path.join(results_directory, f"scheduler_{number_of_tasks}.xlsx")
+
+    time_started = time.perf_counter()
+    scheduler.handle_tasks_until_done(records, results_file_path, task_queue)
+    seconds_used = time.perf_counter() - time_started
+    scheduler.close_results_journals()
+    physical_systems.disconnect(protocol)
+
+    step_durations = [end - start for start, end in zip(records.append_times, records.append_times[1:])]
+    return {"steps": len(records),
+            "seconds": seconds_used,
+            "steps_per_second": len(records)/seconds_used,
+            "simulated_seconds_per_second": hours*60*60/seconds_used,
+            **get_percentiles_in_microseconds(step_durations)}
+
+
+class CountingSerialConnection:
+    # Counts the calls reading from a serial connection, each of which is a system call on a real serial port.
+
+    def __init__(self, serial_connection) -> None:
+        self.serial_connection = serial_connection
+        self.number_of_reads = 0
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.serial_connection, name)
+        if name.startswith("read"):
+            self.number_of_reads += 1
+        return attribute
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in ("serial_connection", "number_of_reads"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self.serial_connection, name, value)
+
+
+def read_mv_result_byte_by_byte(serial_connection) -> SerialReply:
+    # How PhMeter.read_mv_result read a reply before it read the whole reply at once, to compare them with
+    serial_connection.dtr = False
+    recipient = serial_connection.read()
+    number_of_bytes = serial_connection.read()
+    command_acted_upon = serial_connection.read()
+    reply_device_id = [serial_connection.read(), serial_connection.read(), serial_connection.read(), serial_connection.read()]
+    data = serial_connection.read(ord(number_of_bytes) - (1 + 4 + 1))
+    checksum = serial_connection.read()
+    serial_connection.read(2)
+    serial_connection.read_all()
+    # The mV values were then decoded from the data two bytes at a time, which read_mv_result now does when reading
+    mv_values = []
+    for channel in range(4):
+        channel_value = data[2*channel]*256 + data[2*channel + 1]
+        if 32767 < channel_value:
+            channel_value -= 65536
+        mv_values.append(channel_value/10)
+    return SerialReply(recipient, number_of_bytes, command_acted_upon, reply_device_id, data, checksum, mv_values)
+
+
+def benchmark_serial_codec(settings: dict, iterations: int) -> dict:
+    physical_systems = SimulatedPhysicalSystems(settings, VirtualClock())
+    physical_systems.initialize_systems()
+    ph_meter = physical_systems.ph_meter
+    serial_connection: SimulatedPhMeterConnection = ph_meter.serial_connection
+
+    command = PhSerialCommand(recipient="M", length_of_command=6, command=10, device_id="F.0.1.22", information_bytes=[])
+    reply = serial_connection.get_reply(command.to_binary_command_string())
+
+    def read_reply():
+        serial_connection.read_buffer = reply
+        ph_meter.read_mv_result()
+
+    def read_reply_byte_by_byte():
+        serial_connection.read_buffer = reply
+        read_mv_result_byte_by_byte(serial_connection)
+
+    def measure_ph():
+        ph_meter.cached_module_readings.clear()
+        ph_meter.measure_ph_with_probe("F.0.1.22_1")
+
+    metrics = dict()
+    counting_connection = CountingSerialConnection(serial_connection)
+    ph_meter.serial_connection = counting_connection
+    read_reply()
+    metrics["read_mv_result_serial_reads"] = counting_connection.number_of_reads
+    counting_connection.number_of_reads = 0
+    counting_connection.read_buffer = reply
+    read_mv_result_byte_by_byte(counting_connection)
+    metrics["read_mv_result_byte_by_byte_serial_reads"] = counting_connection.number_of_reads
+    ph_meter.serial_connection = serial_connection
+
+    for name, function in [("to_binary_command_string", command.to_binary_command_string),
+                           ("read_mv_result", read_reply),
+                           ("read_mv_result_byte_by_byte", read_reply_byte_by_byte),
+                           ("measure_ph_with_probe", measure_ph)]:
+        seconds_per_call = measure_seconds_per_call(function, iterations)
+        metrics[f"{name}_us"] = seconds_per_call*1e6
+        metrics[f"{name}_per_second"] = 1/seconds_per_call
+    return metrics
+
+
+def benchmark_record_result_of_step(settings: dict, number_of_rows: int, number_of_tasks: int,
+                                    should_record_steps_while_running: bool, results_directory: str) -> dict:
+    # Whether recording a step gets slower as the run gets longer. The journal is not fsync'ed,
+    # as that depends on the disk, and would hide the time used by the program.
+    settings = dict(settings, scheduler=dict(settings["scheduler"], ShouldRecordStepsWhileRunning=should_record_steps_while_running,
+                                             ResultsJournalFsyncEveryNSteps=0))
+    scheduler = Scheduler(settings, None)
+    tasks = [SimpleNamespace(pump_id=pump_id) for pump_id in range(1, number_of_tasks + 1)]
+    records = RecordStore()
+    results_file_path = os.path.join(results_directory, f"record_{should_record_steps_while_running}.xlsx")
+    clock = VirtualClock(datetime.datetime(2000, 1, 1))
+    scheduler.use_clock(clock)
+    window_size = max(1, number_of_rows//10)
+    window_durations = []
+    for window_start in range(0, number_of_rows, window_size):
+        time_started = time.perf_counter()
+        for row in range(window_start, min(window_start + window_size, number_of_rows)):
+            clock.sleep(1)
+            scheduler.record_result_of_step(tasks[row % number_of_tasks], 6.0, 5.9, True, 1, records, results_file_path)
+        window_durations.append((time.perf_counter() - time_started)/window_size)
+    scheduler.close_results_journals()
+    return {"first_tenth_us_per_step": window_durations[0]*1e6,
+            "last_tenth_us_per_step": window_durations[-1]*1e6,
+            "last_to_first_ratio": window_durations[-1]/window_durations[0]}
+
+
+def benchmark_save_results(settings: dict, number_of_rows: int, number_of_tasks: int, results_directory: str) -> dict:
+    scheduler = Scheduler(settings, None)
+    records = RecordStore()
+    time_point = datetime.datetime(2000, 1, 1)
+    for row in range(number_of_rows):
+        records.append({"PumpTask": row % number_of_tasks + 1, "TimePoint": time_point + datetime.timedelta(seconds=row),
+                        "ExpectedPH": 6.0, "ActualPH": 5.9, "DidPump": True, "PumpMultiplier": 1})
+
+    time_started = time.perf_counter()
+    recorded_data = records.to_dataframe()
+    to_dataframe_seconds = time.perf_counter() - time_started
+    time_started = time.perf_counter()
+    scheduler.save_recorded_data(os.path.join(results_directory, "save.xlsx"), recorded_data)
+    save_seconds = time.perf_counter() - time_started
+    return {"to_dataframe_seconds": to_dataframe_seconds,
+            "save_recorded_data_seconds": save_seconds,
+            "save_recorded_data_us_per_row": save_seconds/number_of_rows*1e6}
+
+
+def benchmark_save_checkpoint(settings: dict, number_of_tasks: int, results_directory: str) -> dict:
+    scheduler = Scheduler(settings, None)
+    task_queue = scheduler.initialize_task_priority_queue(create_protocol(number_of_tasks, 1))
+    for task in task_queue:
+        task.controller.calculate_output(5.5, 5.4)
+    results_file_path = os.path.join(results_directory, "checkpoint.xlsx")
+    seconds_per_checkpoint = measure_seconds_per_call(lambda: scheduler.save_checkpoint(0, results_file_path, task_queue), 20)
+    return {"save_checkpoint_ms": seconds_per_checkpoint*1e3}
+
+
+def benchmark_controllers(number_of_tasks: int, number_of_steps: int) -> dict:
+    # The time used to calculate the number of pumps of all the tasks, one controller at a time,
+    # and for all of them in one call to a ControllerBank.
+    setpoints = [5.5 + task/(10*number_of_tasks) for task in range(number_of_tasks)]
+    measured_values = [5.45 + task/(10*number_of_tasks) for task in range(number_of_tasks)]
+    metrics = dict()
+    for name, controller_type in [("queue", DerivativeControllerWithMemory), ("compact", CompactDerivativeControllerWithMemory)]:
+        controllers = [controller_type() for _ in range(number_of_tasks)]
+
+        def calculate_outputs():
+            for controller, setpoint, measured_value in zip(controllers, setpoints, measured_values):
+                controller.calculate_output(setpoint, measured_value)
+
+        metrics[f"{name}_us_per_task"] = measure_seconds_per_call(calculate_outputs, number_of_steps)/number_of_tasks*1e6
+    bank = ControllerBank()
+    indices = [bank.add_controller() for _ in range(number_of_tasks)]
+    seconds_per_call = measure_seconds_per_call(lambda: bank.calculate_outputs(indices, setpoints, measured_values), number_of_steps)
+    metrics["bank_us_per_task"] = seconds_per_call/number_of_tasks*1e6
+    metrics["bank_us_per_call"] = seconds_per_call*1e6
+    return metrics
+
+
+def convert_mv_value_to_ph_value_from_calibration_data(probe_calibration_data: dict, mv_value: float, probe_id: str) -> float:
+    # How the PhMeter converted a mV value before the calibration data was compiled, used for comparison.
+    probe_calibration = probe_calibration_data[probe_id]
+    ph_slope = (probe_calibration["LowPH"] - probe_calibration["HighPH"]) / \
+               (probe_calibration["LowPHmV"] - probe_calibration["HighPHmV"])
+    return probe_calibration["LowPH"] + (mv_value - probe_calibration["LowPHmV"]) * ph_slope
+
+
+def benchmark_ph_conversion(number_of_probes: int, iterations: int) -> dict:
+    # The time used to convert the mV values of all the probes to pH, one probe at a time from the calibration data,
+    # one probe at a time from the compiled table, and all of them in one call.
+    ph_probes = [f"F.0.1.{probe // 4}_{probe % 4 + 1}" for probe in range(number_of_probes)]
+    probe_calibration_data = get_ideal_calibration_data(ph_probes)
+    table = PhCalibrationTable(probe_calibration_data)
+    mv_values = [(probe % 100) - 50.0 for probe in range(number_of_probes)]
+    mv_array = np.array(mv_values)
+
+    def convert_from_calibration_data():
+        for probe_id, mv_value in zip(ph_probes, mv_values):
+            convert_mv_value_to_ph_value_from_calibration_data(probe_calibration_data, mv_value, probe_id)
+
+    def convert_from_table():
+        for probe_id, mv_value in zip(ph_probes, mv_values):
+            table.convert_mv_value_to_ph_value(mv_value, probe_id)
+
+    metrics = dict()
+    for name, function in [("calibration_data", convert_from_calibration_data), ("table", convert_from_table),
+                           ("table_all_probes", lambda: table.convert_mv_values_to_ph_values(mv_array, ph_probes))]:
+        seconds_per_call = measure_seconds_per_call(function, iterations)
+        metrics[f"{name}_us_per_probe"] = seconds_per_call/number_of_probes*1e6
+        metrics[f"{name}_us_per_call"] = seconds_per_call*1e6
+    return metrics
+
+
+def run_benchmarks(settings: dict, sizes: dict, results_directory: str) -> list[dict]:
+    results = []
+
+    def add_result(benchmark: str, parameters: dict, metrics: dict) -> None:
+        results.append({"benchmark": benchmark, "parameters": parameters, "metrics": metrics})
+        formatted_metrics = ", ".join(f"{name}={value:,.3f}" if isinstance(value, float) else f"{name}={value}"
+                                      for name, value in metrics.items())
+        print(f"{benchmark} {parameters}: {formatted_metrics}")
+
+    for number_of_tasks in sizes["scheduler_tasks"]:
+        add_result("scheduler_loop", {"tasks": number_of_tasks, "simulated_hours": sizes["scheduler_hours"]},
+                   benchmark_scheduler_loop(settings, number_of_tasks, sizes["scheduler_hours"], results_directory))
+    add_result("serial_codec", {"iterations": sizes["codec_iterations"]},
+               benchmark_serial_codec(settings, sizes["codec_iterations"]))
+    for should_record_steps_while_running in [False, True]:
+        parameters = {"rows": sizes["record_rows"], "tasks": sizes["save_tasks"][0],
+                      "record_steps_while_running": should_record_steps_while_running}
+        add_result("record_result_of_step", parameters,
+                   benchmark_record_result_of_step(settings, sizes["record_rows"], sizes["save_tasks"][0],
+                                                   should_record_steps_while_running, results_directory))
+    for number_of_rows in sizes["save_rows"]:
+        for number_of_tasks in sizes["save_tasks"]:
+            add_result("save_results", {"rows": number_of_rows, "tasks": number_of_tasks},
+                       benchmark_save_results(settings, number_of_rows, number_of_tasks, results_directory))
+    for number_of_tasks in sizes["checkpoint_tasks"]:
+        add_result("save_checkpoint", {"tasks": number_of_tasks},
+                   benchmark_save_checkpoint(settings, number_of_tasks, results_directory))
+    for number_of_tasks in sizes["controller_tasks"]:
+        add_result("controllers", {"tasks": number_of_tasks, "steps": sizes["controller_steps"]},
+                   benchmark_controllers(number_of_tasks, sizes["controller_steps"]))
+    for number_of_probes in sizes["controller_tasks"]:
+        add_result("ph_conversion", {"probes": number_of_probes, "iterations": sizes["controller_steps"]},
+                   benchmark_ph_conversion(number_of_probes, sizes["controller_steps"]))
+    return results
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default=os.path.join(REPOSITORY_PATH, "config.yml"))
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, e.g. to check that the benchmarks work")
+    parser.add_argument("--output", help="The json file the results are saved to. "
+                                         "By default a new file in benchmarks/results")
+    arguments = parser.parse_args()
+
+    scheduler_module.KeypressDetector = NoKeypressDetector
+    settings = load_settings(arguments.config)
+    sizes = SIZES["quick" if arguments.quick else "full"]
+    results_directory = tempfile.mkdtemp()
+    started = datetime.datetime.now()
+    try:
+        results = run_benchmarks(settings, sizes, results_directory)
+    finally:
+        shutil.rmtree(results_directory)
+
+    output_path = arguments.output
+    if output_path is None:
+        output_path = os.path.join(REPOSITORY_PATH, "benchmarks", "results",
+                                   f"benchmark_{started.strftime('%Y-%m-%d_%H-%M-%S')}.json")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump({"version": BENCHMARK_SUITE_VERSION,
+                   "started": started.isoformat(),
+                   "git_commit": get_git_commit(),
+                   "python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "sizes": "quick" if arguments.quick else "full",
+                   "results": results}, file, indent=2)
+    print(f"Saved the results to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Measures the memory used per task by the different representations of the tasks, for a protocol with many
+# pumps and segments. Run from the root of the repository: python benchmarks/memory_per_task.py
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Scheduler import Scheduler  # noqa: E402
+
+REPRESENTATIONS = {"PumpTask (linked list) + DerivativeControllerWithMemory": (False, False),
+                   "PumpTask (linked list) + CompactDerivativeControllerWithMemory": (False, True),
+                   "SegmentTablePumpTask + CompactDerivativeControllerWithMemory": (True, True)}
+
+SEGMENT_COLUMNS = ["Step", "pH start", "pH end", "Dose vol.", "Force delay"]
+
+
+def create_protocol(number_of_tasks: int, number_of_segments: int) -> pd.DataFrame:
+    columns = {"Pump": list(range(1, number_of_tasks + 1)),
+               "On/off": [1]*number_of_tasks,
+               "pH probe": [f"F.0.1.{task // 4}_{task % 4 + 1}" for task in range(number_of_tasks)]}
+    for segment in range(number_of_segments):
+        for column, value in enumerate([60, 5 + segment/100, 5 + (segment + 1)/100, 10, 2]):
+            # The columns of the first segment are named like in the protocols
+            column_name = SEGMENT_COLUMNS[column] if segment == 0 else f"Segment{segment}_{column}"
+            columns[column_name] = [value]*number_of_tasks
+    return pd.DataFrame(columns)
+
+
+def measure_bytes_per_task(settings: dict, protocol: pd.DataFrame) -> float:
+    scheduler = Scheduler(settings, None)
+    gc.collect()
+    tracemalloc.start()
+    task_queue = scheduler.initialize_task_priority_queue(protocol)
+    for task in task_queue:
+        # Every task has used its controller, so that the measurement history exists
+        task.controller.calculate_output(5.5, 5.4)
+    used_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del task_queue
+    return used_bytes/len(protocol.index)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--segments", type=int, default=20)
+    arguments = parser.parse_args()
+
+    with open(os.path.join(os.path.dirname(__file__), "..", "config.yml"), "r") as file:
+        settings = yaml.safe_load(file)
+    protocol = create_protocol(arguments.tasks, arguments.segments)
+
+    print(f"Memory per task, for {arguments.tasks} tasks with {arguments.segments} segments each:")
+    for name, (should_use_segment_table_tasks, should_use_compact_controllers) in REPRESENTATIONS.items():
+        settings["scheduler"]["ShouldUseSegmentTableTasks"] = should_use_segment_table_tasks
+        settings["scheduler"]["ShouldUseCompactControllers"] = should_use_compact_controllers
+        print(f"  {name}: {measure_bytes_per_task(settings, protocol):,.0f} bytes")
+
+
+if __name__ == "__main__":
+    main()
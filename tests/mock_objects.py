@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import math
 from typing import List, Tuple
@@ -49,6 +50,10 @@ class MockSerialConnection:
         bytesReply = bytes(byteString, "charmap")
         return bytesReply
 
+    @property
+    def in_waiting(self):
+        return len(self.read_buffer)
+
     def read_all(self):
         temp_storage = self.read_buffer
         self.read_buffer = b''
@@ -75,6 +80,9 @@ class MockTimer:
     def now(self) -> datetime.datetime:
         return self.current_time
 
+    def time(self) -> float:
+        return self.current_time.timestamp()
+
     def set_time(self, new_time: datetime.datetime) -> None:
         self.current_time = new_time
 
@@ -82,6 +90,17 @@ class MockTimer:
         self.time_dependent_actions.append(action)
 
 
+class MockAsyncTimer:
+    # mocks asyncio's sleep, using a MockTimer
+
+    def __init__(self, mock_timer: MockTimer) -> None:
+        self.mock_timer = mock_timer
+
+    async def sleep(self, seconds: float) -> None:
+        self.mock_timer.sleep(seconds)
+        await asyncio.sleep(0)
+
+
 class MockPhSolution:
 
     sensitivity = 1
@@ -109,3 +109,13 @@ class TestBase(unittest.TestCase):
         # It should retry when no input is given
         probes_to_calibrate = self.cli.choose_probes(probes_used)
         self.assertCountEqual(["F.0.1.13_3", "F.0.1.22_1"], probes_to_calibrate)
+
+    @patch("time.sleep", return_value=None)
+    @patch("time.monotonic", return_value=100.25)
+    def test_wait_for_new_readings_waits_rest_of_interval(self, _, mock_sleep: MagicMock):
+        self.cli.wait_for_new_readings(100.0)
+        mock_sleep.assert_called_once_with(0.75)
+        # Reading the probes took longer than the interval, so they are read again at once
+        mock_sleep.reset_mock()
+        self.cli.wait_for_new_readings(99.0)
+        mock_sleep.assert_not_called()
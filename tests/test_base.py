@@ -83,11 +83,39 @@ class TestBase(unittest.TestCase):
         self.assertEqual(3, third_task.minimum_delay)
         self.assertIsNone(third_task.next_task)
 
+    def test_multiOperationTasksStartWhenPreviousTaskEnds(self) -> None:
+        protocol = Scheduler.select_instruction_sheet("test_protocol_multi_task.xlsx")
+        task = min(self.scheduler.initialize_task_priority_queue(protocol), key=lambda x: x.pump_id)
+        while task.next_task is not None:
+            self.assertEqual(task.get_end_time(), task.next_task.start_time)
+            self.assertEqual(task.next_task.start_time, task.next_task.time_next_operation)
+            task = task.next_task
+
+    def test_canHandleTasksWithManySegments(self) -> None:
+        # A linked list of segments longer than the recursion limit
+        number_of_segments = 2000
+        segment_columns = {f"Segment{i}_{column}": [value] for i in range(number_of_segments)
+                           for column, value in enumerate([10, 5 + i/1000, 5 + (i + 1)/1000, 10, 2])}
+        protocol = pd.DataFrame({"Pump": [1], "On/off": [1], "pH probe": ["F.0.1.22_1"], **segment_columns})
+        task_priority_queue = self.scheduler.initialize_task_priority_queue(protocol)
+        self.assertEqual(1, len(task_priority_queue))
+        task = task_priority_queue[0]
+        segments = []
+        while task is not None:
+            segments.append(task)
+            task = task.next_task
+        self.assertEqual(number_of_segments, len(segments))
+        self.assertAlmostEqual(5 + (number_of_segments - 1)/1000, segments[-1].ph_at_start)
+        self.assertEqual(segments[0].start_time + datetime.timedelta(minutes=10*(number_of_segments - 1)),
+                         segments[-1].start_time)
+
     @patch("time.sleep", return_value=None)
     def test_measureAssociatedTaskPH_noCrashWithBlankResponse(self, _):
         # It should not crash even if there is no data to fetch
         mock_serial_connection = mock_objects.MockSerialConnection(None)
         self.physical_systems.ph_meter.serial_connection = mock_serial_connection
+        # Waiting for the rest of the reply would keep checking the time, as time.sleep does not wait
+        self.physical_systems.ph_meter.settings["ReplyTimeoutInSeconds"] = 0
         start_time = datetime.datetime.now()
         task = PumpTask(pump_id=1,
                         ph_meter_id=("F.0.1.22", "1"),
@@ -112,6 +140,8 @@ class TestBase(unittest.TestCase):
         # It should not crash even if there is no data to fetch
         mock_serial_connection = mock_objects.MockSerialConnection(None)
         self.physical_systems.ph_meter.serial_connection = mock_serial_connection
+        # Waiting for the rest of the reply would keep checking the time, as time.sleep does not wait
+        self.physical_systems.ph_meter.settings["ReplyTimeoutInSeconds"] = 0
         start_time = datetime.datetime.now()
         task = PumpTask(pump_id=1,
                         ph_meter_id=("F.0.1.22", "1"),
@@ -138,6 +168,8 @@ class TestBase(unittest.TestCase):
         # Even if it gives a valid response that is somehow to short, it should not crash
         mock_serial_connection = mock_objects.MockSerialConnection(None)
         self.physical_systems.ph_meter.serial_connection = mock_serial_connection
+        # Waiting for the rest of the reply would keep checking the time, as time.sleep does not wait
+        self.physical_systems.ph_meter.settings["ReplyTimeoutInSeconds"] = 0
         start_time = datetime.datetime.now()
         task = PumpTask(pump_id=1,
                         ph_meter_id=("F.0.1.22", "1"),
@@ -1,4 +1,5 @@
 import datetime
+import math
 import os
 import unittest
 from unittest.mock import patch, MagicMock
@@ -8,6 +9,11 @@ import matplotlib.pyplot as plt
 import yaml
 
 import Controllers
+import PumpTasks
+import ResultsJournal
+import SchedulerCheckpoint
+from ProtocolLoader import load_protocol
+from RecordStore import RecordStore
 import main
 from PhMeter import PhMeter
 import mock_objects
@@ -17,6 +23,7 @@ from PumpTasks import PumpTask
 import matplotlib.pyplot as plt
 
 import Scheduler
+from AsyncScheduler import AsyncScheduler
 
 
 class Test_complete_system(unittest.TestCase):
@@ -143,6 +150,93 @@ class Test_complete_system(unittest.TestCase):
 
         # self.scheduler.save_recorded_data("testrun.xlsx", records)
 
+    def test_tasks_sharing_module_use_single_reading(self):
+        self.create_mock_ph_solution_setup()
+        ph_meter_connection = self.ph_meter.serial_connection
+        # Task 2 and 4 both use module F.0.1.22, and they have the same step time and delay.
+        self.task_priority_queue = [task for task in self.task_priority_queue if task.pump_id in [2, 4]]
+        records = self.scheduler.run_tasks("None", self.task_priority_queue)
+
+        number_of_module_readings = len([command for command in ph_meter_connection.written_commands
+                                         if command == b'M\x06\n\x0f\x00\x01"\x8f\r\n'])
+        number_of_module_steps = len(records.index)
+        self.assertAlmostEqual(number_of_module_steps/2, number_of_module_readings, delta=2)
+
+    def test_tasks_sharing_module_not_batched_when_disabled(self):
+        self.settings["scheduler"]["ModuleBatchingWindowInSeconds"] = 0
+        self.create_mock_ph_solution_setup()
+        ph_meter_connection = self.ph_meter.serial_connection
+        records = self.scheduler.run_tasks("None", self.task_priority_queue)
+
+        number_of_module_readings = len([command for command in ph_meter_connection.written_commands
+                                         if command == b'M\x06\n\x0f\x00\x01"\x8f\r\n'])
+        number_of_module_steps = len(records.loc[records['PumpTask'] != 5].index)
+        self.assertEqual(number_of_module_readings, number_of_module_steps)
+
+    def test_async_scheduler_follows_protocol(self):
+        self.create_mock_ph_solution_setup()
+        scheduler = AsyncScheduler(self.settings, self.physical_system)
+        scheduler.timer = self.mock_timer
+        scheduler.async_timer = mock_objects.MockAsyncTimer(self.mock_timer)
+        old_task_priority_queue = sorted(self.task_priority_queue, key=lambda x: x.pump_id)
+        records = scheduler.run_tasks("None", self.task_priority_queue)
+
+        for current_task in old_task_priority_queue:
+            rows = records.loc[records['PumpTask'] == current_task.pump_id]
+            self.assertLess(abs((current_task.start_time - rows["TimePoint"].iloc[0]).total_seconds() / 60), 1)
+            last_task = current_task
+            while last_task.next_task is not None:
+                last_task = last_task.next_task
+            actual_end_time = rows["TimePoint"].iloc[-1]
+            self.assertLessEqual(abs(last_task.get_end_time() - actual_end_time).total_seconds() / 60,
+                                 last_task.minimum_delay)
+            self.assertTrue(rows["TimePoint"].is_monotonic_increasing)
+            self.assertLess((rows["ActualPH"] - rows["ExpectedPH"]).abs().max(), 0.2)
+
+    def test_pumping_in_background_follows_protocol(self):
+        self.settings["scheduler"]["ShouldPumpInBackground"] = True
+        self.create_mock_ph_solution_setup()
+        old_task_priority_queue = sorted(self.task_priority_queue, key=lambda x: x.pump_id)
+        records = self.scheduler.run_tasks("None", self.task_priority_queue)
+
+        self.assertEqual(0, len(self.scheduler.pending_pumping))
+        self.assertLess(0, records["DidPump"].sum())
+        for current_task in old_task_priority_queue:
+            rows = records.loc[records['PumpTask'] == current_task.pump_id]
+            self.assertLess(abs((current_task.start_time - rows["TimePoint"].iloc[0]).total_seconds() / 60), 1)
+            self.assertTrue(rows["TimePoint"].is_monotonic_increasing)
+            # The pumping is always done before the task is measured again
+            self.assertTrue(rows["ActualPH"].is_monotonic_increasing)
+            self.assertLess((rows["ActualPH"] - rows["ExpectedPH"]).abs().max(), 0.2)
+
+    def test_pumping_in_background_is_timed_when_done(self):
+        self.settings["scheduler"]["ShouldPumpInBackground"] = True
+        self.create_mock_ph_solution_setup()
+        records = self.scheduler.run_tasks("None", self.task_priority_queue)
+
+        timings = self.scheduler.step_timings.to_dataframe()
+        self.assertEqual(0, len(self.scheduler.pending_pump_timings))
+        # Each pump waits half a second, like when it is not pumping in the background
+        pumped = records["DidPump"]
+        self.assertLess(0, pumped.sum())
+        self.assertTrue((timings.loc[pumped, "PumpSeconds"] == 0.5*records.loc[pumped, "PumpMultiplier"]).all())
+        self.assertTrue((timings.loc[~pumped, "PumpSeconds"] == 0).all())
+
+    def test_steps_are_timed(self):
+        self.create_mock_ph_solution_setup()
+        records = self.scheduler.run_tasks("None", self.task_priority_queue)
+
+        timings = self.scheduler.step_timings.to_dataframe()
+        self.assertEqual(len(records.index), len(timings.index))
+        self.assertEqual(records["PumpTask"].to_list(), timings["PumpTask"].to_list())
+        # The mock ph-meter replies at once, so reading it does not wait
+        self.assertTrue((timings["MeasureSeconds"] == 0).all())
+        self.assertTrue((timings.loc[records["DidPump"], "PumpSeconds"] == 0.5).all())
+        self.assertTrue((timings.loc[~records["DidPump"], "PumpSeconds"] == 0).all())
+        summary = self.scheduler.step_timings.get_summary()
+        self.assertEqual(0, summary["MissedDelays"].sum())
+        self.assertLess(summary["LatenessSeconds max"].max(), 10)
+
     def test_multi_task_changes_task(self):
         print("TODO")
         self.protocol = Scheduler.select_instruction_sheet("test_protocol_multi_task.xlsx")
@@ -167,6 +261,65 @@ class Test_complete_system(unittest.TestCase):
         self.assertAlmostEqual(expected_total_task_time, actual_total_task_time.seconds/60, -1)
 
 
+    def run_multi_task_protocol(self, should_use_segment_table_tasks: bool, should_use_compact_controllers: bool = False,
+                                should_use_controller_bank: bool = False) -> pd.DataFrame:
+        self.setUp()
+        self.settings["scheduler"]["ShouldUseSegmentTableTasks"] = should_use_segment_table_tasks
+        self.settings["scheduler"]["ShouldUseCompactControllers"] = should_use_compact_controllers
+        self.settings["scheduler"]["ShouldUseControllerBank"] = should_use_controller_bank
+        self.protocol = Scheduler.select_instruction_sheet("test_protocol_multi_task.xlsx")
+        self.task_priority_queue = self.scheduler.initialize_task_priority_queue(self.protocol)
+        for task in self.task_priority_queue:
+            while task is not None:
+                task.timer = self.mock_timer
+                task.datetimer = self.mock_timer
+                task.shouldPrintWhenWaiting = False
+                task = task.next_task
+        self.create_mock_ph_solution_setup()
+        records = self.scheduler.run_tasks("None", self.task_priority_queue)
+        records["TimePoint"] = records["TimePoint"] - records["TimePoint"].iloc[0]
+        return records
+
+    def test_segment_table_tasks_follow_protocol_like_linked_tasks(self):
+        linked_task_records = self.run_multi_task_protocol(False)
+        segment_table_task_records = self.run_multi_task_protocol(True)
+        pd.testing.assert_frame_equal(linked_task_records, segment_table_task_records, check_exact=False, rtol=1e-9)
+
+    def test_compact_task_state_follows_protocol_like_linked_tasks(self):
+        linked_task_records = self.run_multi_task_protocol(False)
+        compact_task_records = self.run_multi_task_protocol(True, should_use_compact_controllers=True)
+        pd.testing.assert_frame_equal(linked_task_records, compact_task_records, check_exact=False, rtol=1e-9)
+
+    def test_controller_bank_follows_protocol_like_controllers(self):
+        linked_task_records = self.run_multi_task_protocol(False)
+        for should_use_segment_table_tasks in [False, True]:
+            bank_records = self.run_multi_task_protocol(should_use_segment_table_tasks, should_use_controller_bank=True)
+            pd.testing.assert_frame_equal(linked_task_records, bank_records, check_exact=False, rtol=1e-9)
+
+    def test_controller_bank_handles_tasks_sharing_reading_in_one_call(self):
+        calculate_outputs = Controllers.ControllerBank.calculate_outputs
+        numbers_of_controllers_per_call = []
+        def record_call(bank, indices, setpoints, measured_values):
+            numbers_of_controllers_per_call.append(len(indices))
+            return calculate_outputs(bank, indices, setpoints, measured_values)
+        with patch.object(Controllers.ControllerBank, "calculate_outputs", record_call):
+            records = self.run_multi_task_protocol(True, should_use_controller_bank=True)
+        self.assertLess(1, max(numbers_of_controllers_per_call))
+        self.assertLess(len(numbers_of_controllers_per_call), len(records.index))
+
+    def test_model_based_controller_keeps_model_in_next_segment(self):
+        self.settings["scheduler"]["DosingController"] = "ModelBased"
+        protocol = Scheduler.select_instruction_sheet("test_protocol_multi_task.xlsx")
+        for should_use_segment_table_tasks in [False, True]:
+            self.settings["scheduler"]["ShouldUseSegmentTableTasks"] = should_use_segment_table_tasks
+            task = self.scheduler.initialize_task_priority_queue(protocol)[0]
+            task.controller.ph_increase_per_pump = 0.02
+            task.controller.calculate_output(5.6, 5.5)
+            next_segment = task.get_next_segment(task.get_end_time())
+            self.assertIsNotNone(next_segment)
+            self.assertEqual(0.02, next_segment.controller.ph_increase_per_pump)
+            self.assertTrue(math.isnan(next_segment.controller.last_measured_value))
+
     def test_modelDipInPH(self):
 
         ##### Setup
@@ -313,17 +466,20 @@ class Test_complete_system(unittest.TestCase):
         self.settings["scheduler"]["ShouldRecordStepsWhileRunning"] = True
         testfilename = "testrun.xlsx"
         results_file_path = self.scheduler.create_results_file(testfilename)
-        if os.path.exists(results_file_path):
-            os.remove(results_file_path)
         self.create_mock_ph_solution_setup()
         testTask = PumpTask(1, ("F.0.1.22", "1"), 1000, 0, 100, 1000, 10, datetime.datetime.now(),
                             datetime.datetime.now(), None, Controllers.DerivativeControllerWithMemory())
-        records = pd.DataFrame(columns=['PumpTask', 'TimePoint', 'ExpectedPH', 'ActualPH', 'DidPump', 'PumpMultiplier'])
-        self.scheduler.handle_task(testTask, records, [], results_file_path)
-        self.assertEqual(1, len(records.index))
-
-        savedRecords = pd.read_excel(results_file_path)
-        os.remove(results_file_path)
+        record_store = RecordStore()
+        self.scheduler.handle_task(testTask, record_store, [], results_file_path)
+        self.assertEqual(1, len(record_store))
+        records = record_store.to_dataframe()
+
+        # The step is appended to the journal, and the excel file is first written when the run is done.
+        self.assertFalse(os.path.exists(results_file_path))
+        journal_path = ResultsJournal.get_journal_path(results_file_path)
+        savedRecords = ResultsJournal.load_journal(journal_path)
+        self.scheduler.close_results_journals()
+        os.remove(journal_path)
         self.assertEqual(1, len(savedRecords.index))
         self.assertCountEqual(records["PumpTask"], savedRecords["PumpTask"])
         self.assertAlmostEqual(records["ExpectedPH"][0], savedRecords["ExpectedPH"][0], delta=0.000001)
@@ -333,6 +489,49 @@ class Test_complete_system(unittest.TestCase):
                                delta=datetime.timedelta(seconds=0.01))
         self.assertCountEqual(records["PumpMultiplier"], savedRecords["PumpMultiplier"])
 
+    def test_journal_contains_every_step_of_run(self):
+        self.settings["scheduler"]["ShouldRecordStepsWhileRunning"] = True
+        results_file_path = self.scheduler.create_results_file("testrun.xlsx")
+        journal_path = ResultsJournal.get_journal_path(results_file_path)
+        self.create_mock_ph_solution_setup()
+        self.task_priority_queue = [self.task_priority_queue[1]]
+        records = self.scheduler.run_tasks(results_file_path, self.task_priority_queue)
+
+        # The journal can be used to restart the run, in which case the results are saved as an excel file.
+        restart_results_file_path, journal_records = self.scheduler.load_old_run_data(journal_path)
+        self.assertEqual(results_file_path, restart_results_file_path)
+        self.assertEqual(len(records.index), len(journal_records.index))
+        self.assertEqual(records["ActualPH"].tolist(), journal_records["ActualPH"].tolist())
+        self.assertEqual(records["PumpMultiplier"].tolist(), journal_records["PumpMultiplier"].tolist())
+
+        # It can also be converted to an excel file on demand
+        self.scheduler.get_results_journal(results_file_path).export_to_excel(results_file_path)
+        self.scheduler.close_results_journals()
+        excel_records = pd.read_excel(results_file_path)
+        os.remove(journal_path)
+        os.remove(results_file_path)
+        self.assertEqual(records["DidPump"].tolist(), excel_records["DidPump"].tolist())
+
+    @patch("builtins.input", return_value="")
+    def test_pausing_run_saves_results_recorded_so_far(self, mock_input: MagicMock):
+        self.settings["scheduler"]["ShouldRecordStepsWhileRunning"] = True
+        results_file_path = self.scheduler.create_results_file("testrun.xlsx")
+        journal_path = ResultsJournal.get_journal_path(results_file_path)
+        self.create_mock_ph_solution_setup()
+        self.task_priority_queue = [self.task_priority_queue[1]]
+        records = self.scheduler.run_tasks(results_file_path, self.task_priority_queue)
+
+        detector = MagicMock()
+        detector.get_has_key_been_pressed.return_value = True
+        self.scheduler.pause_on_keypress(detector)
+        excel_records = pd.read_excel(results_file_path)
+        self.scheduler.close_results_journals()
+        os.remove(journal_path)
+        os.remove(results_file_path)
+        detector.reset_has_key_been_pressed.assert_called_once()
+        self.assertEqual(records["DidPump"].tolist(), excel_records["DidPump"].tolist())
+        self.assertEqual(records["PumpMultiplier"].tolist(), excel_records["PumpMultiplier"].tolist())
+
     @patch("Scheduler.Scheduler.initialize_task_priority_queue")
     def test_restart_half_finished_run(self, mock2: MagicMock):
         oldTaskQueue = list(self.task_priority_queue)
@@ -408,6 +607,58 @@ class Test_complete_system(unittest.TestCase):
             actual_end_time = newTaskRecords.iloc[len(newTaskRecords.index) - 1]["TimePoint"]
             self.assertTrue(abs(expected_end_time - actual_end_time).total_seconds() / 60 < last_task.minimum_delay)
 
+    def test_resume_run_from_checkpoint(self):
+        self.settings["scheduler"]["ShouldRecordStepsWhileRunning"] = True
+        self.settings["scheduler"]["CheckpointEveryNSteps"] = 1
+        self.scheduler.protocol_hash = load_protocol("test_protocol.xlsx").content_hash
+        results_file_path = self.scheduler.create_results_file("testrun.xlsx")
+        journal_path = ResultsJournal.get_journal_path(results_file_path)
+        checkpoint_path = SchedulerCheckpoint.get_checkpoint_path(results_file_path)
+        self.create_mock_ph_solution_setup()
+
+        # The run crashes after some steps
+        number_of_steps_before_crash = 60
+        handle_task = self.scheduler.handle_task
+        def handle_task_until_crash(*args):
+            if number_of_steps_before_crash <= len(args[1]):
+                raise RuntimeError("Crash")
+            handle_task(*args)
+        with patch.object(self.scheduler, "handle_task", handle_task_until_crash):
+            self.assertRaises(RuntimeError, self.scheduler.run_tasks, results_file_path, self.task_priority_queue)
+        self.scheduler.close_results_journals()
+        checkpoint = SchedulerCheckpoint.load_checkpoint(checkpoint_path)
+        self.assertEqual(number_of_steps_before_crash, checkpoint.number_of_records)
+        self.assertEqual(5, len(checkpoint.task_states))
+        self.assertFalse(os.path.exists(f"{checkpoint_path}.tmp"))
+
+        # It is resumed a bit later by a new scheduler
+        self.mock_timer.sleep(60 * 5)
+        scheduler = Scheduler.Scheduler(self.settings, self.physical_system)
+        scheduler.timer = self.mock_timer
+        with patch.object(PumpTasks.ScheduledTask, "timer", self.mock_timer), \
+                patch.object(PumpTasks.ScheduledTask, "datetimer", self.mock_timer), \
+                patch.object(PumpTasks.ScheduledTask, "shouldPrintWhenWaiting", False), \
+                patch.object(scheduler, "handle_tasks_until_done") as handle_tasks_until_done:
+            scheduler.restart_run("test_protocol.xlsx", journal_path)
+            resumed_task_queue = handle_tasks_until_done.call_args[0][2]
+            self.assertEqual(checkpoint.start_time, scheduler.start_time)
+            for task in resumed_task_queue:
+                task_state = next(state for state in checkpoint.task_states if state.pump_id == task.pump_id)
+                self.assertEqual(task_state.time_next_operation, task.time_next_operation)
+                self.assertEqual(task_state.controller_state, task.controller.get_state())
+                self.assertEqual(task_state.segment_start_time, task.start_time)
+
+            scheduler.results_journals = dict()
+            handle_tasks_until_done.side_effect = Scheduler.Scheduler.handle_tasks_until_done.__get__(scheduler)
+            records = scheduler.restart_run("test_protocol.xlsx", journal_path)
+        for pumpTask in [1, 2, 3, 4, 5]:
+            task_records = records.loc[records['PumpTask'] == pumpTask]
+            self.assertTrue(task_records["TimePoint"].is_monotonic_increasing)
+            self.assertLess((task_records["ActualPH"] - task_records["ExpectedPH"]).abs().max(), 0.2)
+        self.assertEqual(len(records.index), len(ResultsJournal.load_journal(journal_path).index))
+        for path in [journal_path, checkpoint_path, results_file_path]:
+            os.remove(path)
+
     @patch("time.sleep", return_value=None)
     def test_runEnsureCorrectStartPHValue(self, _):
         self.create_mock_ph_solution_setup()
@@ -0,0 +1,75 @@
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from ControllerSweep import (ControllerParameters, ReplayTrace, SampleModel, fit_sample_model, get_parameter_grid,
+                             get_traces_from_protocol, replay, sweep)
+from Controllers import ControllerBank, DerivativeControllerWithMemory
+
+
+class Test_ControllerSweep(unittest.TestCase):
+
+    def setUp(self):
+        with open('test_config.yml', 'r') as file:
+            self.settings = yaml.safe_load(file)
+        self.settings["simulation"]["MeasurementNoiseInPH"] = 0
+        self.traces = get_traces_from_protocol("test_protocol.xlsx", self.settings["simulation"])
+
+    def test_controllerBankCanUseOtherParameters(self):
+        class LongerController(DerivativeControllerWithMemory):
+            QUEUE_LENGTH = 8
+            MAX_ALLOWED_DELTA = 0.02
+
+        controller = LongerController()
+        bank = ControllerBank(queue_length=8, max_allowed_delta=0.02)
+        banked_controller = bank.create_controller()
+        for step in range(100):
+            expected_ph, measured_ph = 5.6 + step/100, 5.5 + step/110 + (step % 7)/100
+            self.assertEqual(controller.calculate_output(expected_ph, measured_ph),
+                             banked_controller.calculate_output(expected_ph, measured_ph))
+
+    def test_replayUsesTheController(self):
+        sample = SampleModel(initial_ph=5.4, ph_increase_per_pump=0.02, acid_production_in_ph_per_hour=0.1)
+        trace = ReplayTrace("trace", np.arange(0, 240, 2.0), np.linspace(5.6, 6.8, 120), sample)
+        result = replay([trace], ControllerParameters())
+
+        controller = DerivativeControllerWithMemory()
+        ph, pumps, errors = 5.4, 0, []
+        for step, (minutes, expected_ph) in enumerate(zip(trace.minutes, trace.expected_ph)):
+            if 0 < step:
+                ph -= 2/60*0.1
+            number_of_pumps = controller.calculate_output(expected_ph, ph)
+            errors.append(ph - expected_ph)
+            ph += number_of_pumps*0.02
+            pumps += number_of_pumps
+        self.assertEqual(pumps, result["Pumps"])
+        self.assertAlmostEqual(np.abs(errors).mean(), result["MeanAbsoluteError"])
+
+    def test_tasksAreReplayedFromTheProtocol(self):
+        self.assertEqual(5, len(self.traces))
+        self.assertEqual(940/2, len(self.traces[0].minutes))  # Two segments with a minimum delay of 2 minutes
+        self.assertAlmostEqual(0.1, self.traces[0].sample.ph_increase_per_pump)  # 50 micro liters
+        result = replay(self.traces, ControllerParameters(), adaptive_pumping_after_hours=1)
+        self.assertLess(result["MeanAbsoluteError"], 0.1)
+
+    def test_sampleModelIsFittedToRecordedResults(self):
+        start_time = datetime.datetime(2023, 1, 1)
+        pumps = [step % 3 for step in range(60)]
+        ph = 5.5 + 0.03*np.cumsum([0] + pumps[:-1]) - 0.2*np.arange(60)/30  # A step every 2 minutes
+        records = pd.DataFrame({"PumpTask": 1, "TimePoint": [start_time + datetime.timedelta(minutes=2*step) for step in range(60)],
+                                "ExpectedPH": 5.6, "ActualPH": ph, "DidPump": [0 < n for n in pumps], "PumpMultiplier": pumps})
+        sample = fit_sample_model(records)
+        self.assertAlmostEqual(5.5, sample.initial_ph)
+        self.assertAlmostEqual(0.03, sample.ph_increase_per_pump)
+        self.assertAlmostEqual(0.2, sample.acid_production_in_ph_per_hour)
+        self.assertAlmostEqual(0, sample.measurement_noise_in_ph)
+
+    def test_sweepInWorkerProcessesGivesSameResults(self):
+        parameter_grid = get_parameter_grid([3, 5], [0.01, 0.02])
+        results = sweep(self.traces, parameter_grid, max_workers=2)
+        self.assertEqual(4, len(results.index))
+        self.assertTrue(results["MeanAbsoluteError"].is_monotonic_increasing)
+        pd.testing.assert_frame_equal(results, sweep(self.traces, parameter_grid, max_workers=1))
@@ -0,0 +1,118 @@
+import math
+import random
+import unittest
+
+from Controllers import CompactDerivativeControllerWithMemory, ControllerBank, DerivativeControllerWithMemory, ModelBasedController
+
+
+class Test_Controllers(unittest.TestCase):
+
+    def test_compactControllerGivesSameOutputs(self):
+        random_generator = random.Random(42)
+        for _ in range(20):
+            controller = DerivativeControllerWithMemory()
+            compact_controller = CompactDerivativeControllerWithMemory()
+            measured_ph = random_generator.uniform(5, 6)
+            for step in range(500):
+                expected_ph = 5 + step/250
+                measured_ph += random_generator.uniform(-0.02, 0.03)
+                self.assertEqual(controller.calculate_output(expected_ph, measured_ph),
+                                 compact_controller.calculate_output(expected_ph, measured_ph))
+
+    def test_compactControllerHasNoDictionary(self):
+        compact_controller = CompactDerivativeControllerWithMemory()
+        compact_controller.calculate_output(5.5, 5.4)
+        self.assertFalse(hasattr(compact_controller, "__dict__"))
+        self.assertEqual(CompactDerivativeControllerWithMemory.QUEUE_LENGTH, len(compact_controller.measured_values))
+
+    def test_restoredStateGivesSameOutputs(self):
+        for controller_type in [DerivativeControllerWithMemory, CompactDerivativeControllerWithMemory,
+                                ControllerBank().create_controller, ModelBasedController]:
+            controller = controller_type()
+            for step in range(7):
+                controller.calculate_output(5.6 + step/100, 5.5 + step/200)
+            restored_controller = controller_type()
+            restored_controller.set_state(controller.get_state())
+            self.assertEqual(controller.get_state(), restored_controller.get_state())
+            for step in range(7, 20):
+                self.assertEqual(controller.calculate_output(5.6 + step/100, 5.5 + step/200),
+                                 restored_controller.calculate_output(5.6 + step/100, 5.5 + step/200))
+
+    def test_stateIsTheSameForBothControllers(self):
+        controller = DerivativeControllerWithMemory()
+        compact_controller = CompactDerivativeControllerWithMemory()
+        for step in range(8):
+            controller.calculate_output(5.6, 5.5 + step/100)
+            compact_controller.calculate_output(5.6, 5.5 + step/100)
+        self.assertEqual(controller.get_state(), compact_controller.get_state())
+
+    def test_controllerBankGivesSameOutputs(self):
+        # Some of the tasks are handled in each call, sometimes with a failed measurement
+        random_generator = random.Random(42)
+        bank = ControllerBank(capacity=2)
+        indices = [bank.add_controller() for _ in range(30)]
+        controllers = [DerivativeControllerWithMemory() for _ in indices]
+        measured_ph_values = [random_generator.uniform(5, 6) for _ in indices]
+        for step in range(300):
+            expected_ph = 5 + step/150
+            handled = [index for index in indices if random_generator.random() < 0.6]
+            for index in handled:
+                measured_ph_values[index] += random_generator.uniform(-0.02, 0.03)
+            measured = [measured_ph_values[index] if random_generator.random() < 0.95 else math.nan for index in handled]
+            outputs = bank.calculate_outputs(handled, [expected_ph]*len(handled), measured)
+            expected_outputs = [controllers[index].calculate_output(expected_ph, measured_ph)
+                                for index, measured_ph in zip(handled, measured)]
+            self.assertEqual(expected_outputs, outputs.tolist())
+        for index in indices:
+            self.assertEqual(str(controllers[index].get_state()), str(bank.get_state(index)))  # NaN is not equal to NaN
+
+    def test_resetControllerIsLikeANewController(self):
+        for controller in [DerivativeControllerWithMemory(), CompactDerivativeControllerWithMemory(),
+                           ControllerBank().create_controller()]:
+            for step in range(7):
+                controller.calculate_output(5.6, 5.5 + step/100)
+            controller.reset()
+            self.assertEqual({"measured_values": [], "last_pump_amount": 0}, controller.get_state())
+
+    def run_on_acidifying_sample(self, controller, steps: int = 600) -> (list[float], int):
+        # A sample where the acid production goes up six times halfway, returning the differences to the expected pH
+        # and the number of times it pumped.
+        ph, differences, pump_commands = 5.4, [], 0
+        for step in range(steps):
+            expected_ph = 5.6 + step/1000
+            ph -= 0.004 if step < steps/2 else 0.024
+            number_of_pumps = controller.calculate_output(expected_ph, ph)
+            differences.append(ph - expected_ph)
+            pump_commands += 0 < number_of_pumps
+            ph += 0.02*number_of_pumps
+        return differences, pump_commands
+
+    def test_modelBasedControllerLearnsTheSample(self):
+        controller = ModelBasedController()
+        self.run_on_acidifying_sample(controller)
+        self.assertAlmostEqual(0.02, controller.ph_increase_per_pump, 3)
+        self.assertAlmostEqual(0.024, controller.acid_per_step, 3)
+
+    def test_modelBasedControllerPumpsLessOftenThanDerivativeController(self):
+        differences, pump_commands = self.run_on_acidifying_sample(ModelBasedController())
+        derivative_differences, derivative_pump_commands = self.run_on_acidifying_sample(DerivativeControllerWithMemory())
+        self.assertLess(pump_commands, derivative_pump_commands)
+        after_acid_increase = slice(310, None)
+        self.assertLess(max(map(abs, differences[after_acid_increase])),
+                        max(map(abs, derivative_differences[after_acid_increase])))
+
+    def test_modelBasedControllerKeepsModelInNewSegment(self):
+        controller = ModelBasedController()
+        self.run_on_acidifying_sample(controller)
+        learned_model = (controller.ph_increase_per_pump, controller.acid_per_step, controller.covariance)
+        controller.start_new_segment()
+        self.assertEqual(learned_model, (controller.ph_increase_per_pump, controller.acid_per_step, controller.covariance))
+        self.assertTrue(math.isnan(controller.last_measured_value))
+        # It doses using the model at once, instead of pumping once like a new controller
+        self.assertLess(1, controller.calculate_output(5.6, 5.5))
+
+    def test_modelBasedControllerDoesNotPumpWithoutMeasurement(self):
+        controller = ModelBasedController()
+        self.assertEqual(1, controller.calculate_output(5.6, 5.4))
+        self.assertEqual(0, controller.calculate_output(5.6, math.nan))
+        self.assertEqual(5.4, controller.get_state()["last_measured_value"])
@@ -0,0 +1,124 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+import yaml
+
+import Scheduler
+from DeadlineScheduler import DeadlineScheduler
+from PumpTasks import PumpTask
+from Schedulers import create_scheduler
+from Simulation import SimulatedPhysicalSystems
+from VirtualClock import VirtualClock
+
+
+class NoKeypressDetector:
+
+    def get_has_key_been_pressed(self) -> bool:
+        return False
+
+
+class Test_DeadlineScheduler(unittest.TestCase):
+
+    def setUp(self):
+        with open('test_config.yml', 'r') as file:
+            self.settings = yaml.safe_load(file)
+        self.settings["scheduler"]["SchedulingPolicy"] = "EarliestDeadline"
+        self.settings["scheduler"]["ModuleBatchingWindowInSeconds"] = 0
+        self.clock = VirtualClock(datetime.datetime(2023, 1, 1, 12))
+        self.scheduler = DeadlineScheduler(self.settings, None)
+        self.scheduler.use_clock(self.clock)
+
+    def create_task(self, pump_id: int, ph_probe: str, seconds_until_ready: float, minimum_delay: float) -> PumpTask:
+        time_next_operation = self.clock.now() + datetime.timedelta(seconds=seconds_until_ready)
+        task = PumpTask(pump_id, tuple(ph_probe.split("_")), 60, 5.0, 6.0, 10, minimum_delay, self.clock.now(),
+                        time_next_operation, None, None)
+        self.scheduler.set_clock_of_task(task)
+        return task
+
+    def test_schedulerIsSelectedBySettings(self):
+        self.assertIsInstance(create_scheduler(self.settings, None), DeadlineScheduler)
+        self.settings["scheduler"]["SchedulingPolicy"] = "EarliestStart"
+        self.assertIs(Scheduler.Scheduler, type(create_scheduler(self.settings, None)))
+        self.settings["scheduler"]["SchedulingPolicy"] = "Unknown"
+        self.assertRaises(ValueError, create_scheduler, self.settings, None)
+
+    def test_readyTaskWithEarliestDeadlineIsHandledFirst(self):
+        waiting_long = self.create_task(1, "F.0.1.21_1", -10, minimum_delay=5)
+        short_delay = self.create_task(2, "F.0.1.22_1", -5, minimum_delay=0.1)
+        task_queue = [waiting_long, short_delay]
+        self.assertEqual([short_delay], self.scheduler.get_next_tasks(task_queue))
+        self.assertEqual([waiting_long], self.scheduler.get_next_tasks(task_queue))
+        self.assertEqual(0, len(task_queue))
+
+    def test_waitsUntilFirstTaskIsReady(self):
+        task = self.create_task(1, "F.0.1.21_1", 30, minimum_delay=1)
+        time_ready = task.time_next_operation
+        self.assertEqual([task], self.scheduler.get_next_tasks([task]))
+        self.assertEqual(time_ready, self.clock.now())
+
+    def test_tasksOfModuleReadyWhileOtherTasksAreHandledShareReading(self):
+        # Three modules are ready, so reading them takes about three seconds, which is longer than the window.
+        self.settings["scheduler"]["ModuleBatchingWindowInSeconds"] = 1
+        task_queue = [self.create_task(1, "F.0.1.21_1", 0, minimum_delay=0.1),
+                      self.create_task(2, "F.0.1.22_1", 0, minimum_delay=1),
+                      self.create_task(3, "F.0.1.23_1", 0, minimum_delay=1),
+                      self.create_task(4, "F.0.1.21_2", 2, minimum_delay=1),  # Ready before then
+                      self.create_task(5, "F.0.1.21_3", 60, minimum_delay=1)]
+        tasks = self.scheduler.get_next_tasks(task_queue)
+        self.assertEqual([1, 4], [task.pump_id for task in tasks])
+        self.assertEqual([2, 3, 5], sorted(task.pump_id for task in task_queue))
+
+    def test_tasksNotDueAreNotMeasuredWhenBatchingIsDisabled(self):
+        task_queue = [self.create_task(1, "F.0.1.21_1", 0, minimum_delay=0.1),
+                      self.create_task(2, "F.0.1.22_1", 0, minimum_delay=1),
+                      self.create_task(3, "F.0.1.23_1", 0, minimum_delay=1),
+                      self.create_task(4, "F.0.1.21_2", 2, minimum_delay=1)]
+        time_due = task_queue[3].time_next_operation
+        self.assertEqual([1], [task.pump_id for task in self.scheduler.get_next_tasks(task_queue)])
+        self.assertEqual([2], [task.pump_id for task in self.scheduler.get_next_tasks(task_queue)])
+        self.assertEqual([3], [task.pump_id for task in self.scheduler.get_next_tasks(task_queue)])
+        self.assertEqual([4], [task.pump_id for task in self.scheduler.get_next_tasks(task_queue)])
+        self.assertEqual(time_due, self.clock.now())
+
+    def test_predictionsFollowTimedSteps(self):
+        self.settings["scheduler"]["ShouldPumpInBackground"] = False
+        task = self.create_task(1, "F.0.1.21_1", 0, minimum_delay=1)
+        self.assertEqual(1 + 0.5, self.scheduler.predict_seconds_to_handle([task]))
+        for _ in range(100):
+            step_timing = self.scheduler.start_step_timing(task)
+            step_timing.measure_seconds = 2
+            step_timing.pump_seconds = 3
+            with patch.object(Scheduler.Scheduler, "finish_step"):
+                self.scheduler.finish_step(task, 6, 5, 3, None, [], "None", step_timing)
+        self.assertAlmostEqual(2 + 3, self.scheduler.predict_seconds_to_handle([task]), 3)
+
+    def run_simulation(self, scheduling_policy: str) -> pd.DataFrame:
+        # Many tasks with short minimum delays, so that the ph-meter cannot keep up
+        number_of_tasks = 24
+        ph_probes = [f"F.0.1.{task // 4}_{task % 4 + 1}" for task in range(number_of_tasks)]
+        protocol = pd.DataFrame({"Pump": range(1, number_of_tasks + 1), "On/off": 1, "pH probe": ph_probes,
+                                 "Step": 30, "pH start": 5.4, "pH end": 5.6, "Dose vol.": 10,
+                                 "Force delay": [0.1 if task % 3 == 0 else 2 for task in range(number_of_tasks)]})
+        self.settings["scheduler"]["SchedulingPolicy"] = scheduling_policy
+        self.settings["simulation"]["PhMeterResponseTimeInSeconds"] = 1
+        clock = VirtualClock(datetime.datetime(2023, 1, 1, 12))
+        physical_systems = SimulatedPhysicalSystems(self.settings, clock)
+        physical_systems.ph_meter.update_calibration_data(
+            {probe: {"HighPH": 7.0, "HighPHmV": 0.0, "LowPH": 4.0, "LowPHmV": 177.48} for probe in ph_probes})
+        physical_systems.initialize_systems()
+        physical_systems.initialize_pumps_used_in_protocol(protocol)
+        scheduler = create_scheduler(self.settings, physical_systems)
+        scheduler.use_clock(clock)
+        with patch.object(Scheduler, "KeypressDetector", NoKeypressDetector):
+            scheduler.run_tasks("None", scheduler.initialize_task_priority_queue(protocol))
+        return scheduler.step_timings.to_dataframe()
+
+    def test_fewerMissedDelaysWhenPhMeterCannotKeepUp(self):
+        earliest_start_timings = self.run_simulation("EarliestStart")
+        earliest_deadline_timings = self.run_simulation("EarliestDeadline")
+        missed_delays = lambda timings: (timings["MinimumDelaySeconds"] < timings["LatenessSeconds"]).sum()
+        self.assertLess(missed_delays(earliest_deadline_timings), missed_delays(earliest_start_timings)/2)
+        self.assertLess(earliest_deadline_timings["LatenessSeconds"].clip(lower=0).sum(),
+                        earliest_start_timings["LatenessSeconds"].clip(lower=0).sum())
@@ -0,0 +1,44 @@
+import threading
+import unittest
+
+from DeviceWorker import DeviceWorker
+
+
+class Test_DeviceWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = DeviceWorker("test")
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def test_commandsRunInOrderOnWorkerThread(self):
+        handled_commands = []
+        futures = [self.worker.submit(lambda i: handled_commands.append((i, threading.current_thread().name)) or i, i)
+                   for i in range(10)]
+        self.assertEqual(list(range(10)), [future.result(timeout=5) for future in futures])
+        self.assertEqual([(i, "test") for i in range(10)], handled_commands)
+
+    def test_runReturnsResult(self):
+        self.assertEqual(5, self.worker.run(lambda a, b: a + b, 2, 3))
+
+    def test_errorIsRaisedByFuture(self):
+        def fail():
+            raise ValueError("No connection")
+        future = self.worker.submit(fail)
+        self.assertRaises(ValueError, future.result, 5)
+        # The worker keeps handling commands after an error
+        self.assertEqual(1, self.worker.run(lambda: 1))
+
+    def test_runFromWorkerThreadDoesNotDeadlock(self):
+        future = self.worker.submit(lambda: self.worker.run(lambda: "inner"))
+        self.assertEqual("inner", future.result(timeout=5))
+
+    def test_stopRunsCommandsAlreadySent(self):
+        event = threading.Event()
+        self.worker.submit(event.wait, 1)
+        future = self.worker.submit(lambda: "done")
+        event.set()
+        self.worker.stop()
+        self.assertEqual("done", future.result(timeout=0))
+        self.assertFalse(self.worker.thread.is_alive())
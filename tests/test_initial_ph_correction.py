@@ -0,0 +1,72 @@
+import datetime
+import unittest
+
+import yaml
+
+from InitialPhCorrection import InitialPhCorrection
+from ProtocolLoader import load_protocol
+from Scheduler import Scheduler
+from Simulation import SimulatedPhysicalSystems
+from VirtualClock import VirtualClock
+
+
+class Test_InitialPhCorrection(unittest.TestCase):
+
+    def setUp(self):
+        self.correction = InitialPhCorrection(None, 5.6, datetime.datetime(2023, 1, 1, 12))
+
+    def test_pumpsAsMuchAsAllowedUntilTheResponseIsKnown(self):
+        self.correction.update_ph_increase_per_pump(5.0)
+        self.assertEqual(3, self.correction.get_number_of_pumps(5.0, 3))
+        self.assertEqual(60, self.correction.get_wait_in_seconds(5.0, 15, 60))
+
+    def test_pumpsWhatIsNeededToReachTheTarget(self):
+        self.correction.update_ph_increase_per_pump(5.0)
+        self.correction.number_of_pumps_last_time = 3
+        self.correction.update_ph_increase_per_pump(5.3)
+        self.assertAlmostEqual(0.1, self.correction.ph_increase_per_pump)
+        self.assertEqual(3, self.correction.get_number_of_pumps(5.3, 5))
+        self.assertEqual(1, self.correction.get_number_of_pumps(5.55, 5))
+        self.assertEqual(5, self.correction.get_number_of_pumps(4.0, 5))
+
+    def test_waitsShorterWhenFarFromTheTarget(self):
+        self.correction.update_ph_increase_per_pump(4.5)
+        self.correction.number_of_pumps_last_time = 1
+        self.correction.update_ph_increase_per_pump(4.6)
+        self.assertEqual(60, self.correction.get_wait_in_seconds(5.55, 15, 60))
+        self.assertEqual(30, self.correction.get_wait_in_seconds(5.4, 15, 60))
+        self.assertEqual(15, self.correction.get_wait_in_seconds(4.6, 15, 60))
+
+    def test_noResponseKeepsThePreviousEstimate(self):
+        self.correction.update_ph_increase_per_pump(5.0)
+        self.correction.number_of_pumps_last_time = 2
+        self.correction.update_ph_increase_per_pump(5.0)  # The tubes were still filling
+        self.assertEqual(3, self.correction.get_number_of_pumps(5.0, 3))
+        self.assertFalse(self.correction.is_done(float("NaN")))
+        self.assertTrue(self.correction.is_done(5.6))
+
+
+class Test_SimulatedInitialPhCorrection(unittest.TestCase):
+
+    def test_allSamplesReachTheirStartPh(self):
+        with open('test_config.yml', 'r') as file:
+            settings = yaml.safe_load(file)
+        settings["simulation"]["MeasurementNoiseInPH"] = 0
+        start_time = datetime.datetime(2023, 1, 1, 12)
+        clock = VirtualClock(start_time)
+        physical_systems = SimulatedPhysicalSystems(settings, clock)
+        physical_systems.initialize_systems()
+        scheduler = Scheduler(settings, physical_systems)
+        scheduler.use_clock(clock)
+        protocol = load_protocol("test_protocol.xlsx").get_dataframe()
+        physical_systems.initialize_pumps_used_in_protocol(protocol)
+        task_queue = scheduler.initialize_task_priority_queue(protocol)
+
+        scheduler.run_ensure_correct_start_pH_value(protocol, task_queue)
+
+        for task in task_queue:
+            ph = physical_systems.plant.get_measured_ph(task.get_ph_probe_id())
+            self.assertLessEqual(task.ph_at_start, ph)
+            self.assertLess(ph, task.ph_at_start + 0.1)
+        # Dosing every minute, the sample needing the most base would take 10 minutes
+        self.assertLess(clock.now() - start_time, datetime.timedelta(minutes=6))
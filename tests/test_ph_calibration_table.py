@@ -0,0 +1,53 @@
+import math
+import unittest
+
+import numpy as np
+
+from PhCalibrationTable import PhCalibrationTable
+
+
+def convert_mv_value_to_ph_value(mv_value: float, probe_calibration: dict) -> float:
+    # Like PhMeter did before the calibration data was compiled
+    ph_slope = (probe_calibration["LowPH"] - probe_calibration["HighPH"]) / \
+               (probe_calibration["LowPHmV"] - probe_calibration["HighPHmV"])
+    return probe_calibration["LowPH"] + (mv_value - probe_calibration["LowPHmV"]) * ph_slope
+
+
+class TestPhCalibrationTable(unittest.TestCase):
+
+    def setUp(self):
+        self.calibration_data = {"F.0.1.22_1": {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43},
+                                 "F.0.1.22_3": {"HighPH": 7.0, "HighPHmV": 0.0, "LowPH": 4.0, "LowPHmV": 177.48},
+                                 "F.0.1.21_2": {"HighPH": 10.0, "HighPHmV": -160.0, "LowPH": 4.01, "LowPHmV": 175.0}}
+        self.table = PhCalibrationTable(self.calibration_data)
+
+    def test_sameAsTheCalibrationData(self):
+        for probe_id, probe_calibration in self.calibration_data.items():
+            for mv_value in [-200.0, -70.7, 0.0, 70.7, 171.43]:
+                self.assertAlmostEqual(convert_mv_value_to_ph_value(mv_value, probe_calibration),
+                                       self.table.convert_mv_value_to_ph_value(mv_value, probe_id), 12)
+
+    def test_allProbesAtOnce(self):
+        probe_ids = ["F.0.1.21_2", "F.0.1.22_1", "F.0.1.22_3", "F.0.1.22_1"]
+        mv_values = np.array([10.0, -70.7, 70.7, 0.0])
+        ph_values = self.table.convert_mv_values_to_ph_values(mv_values, probe_ids)
+        for probe_id, mv_value, ph_value in zip(probe_ids, mv_values, ph_values):
+            self.assertAlmostEqual(convert_mv_value_to_ph_value(mv_value, self.calibration_data[probe_id]), ph_value, 12)
+
+    def test_allChannelsOfAModuleAtOnce(self):
+        ph_values = self.table.convert_mv_values_of_module_to_ph_values(np.array([0.0, 10.0, 177.48, 0.0]), "F.0.1.22")
+        self.assertAlmostEqual(convert_mv_value_to_ph_value(0.0, self.calibration_data["F.0.1.22_1"]), ph_values[0], 12)
+        self.assertAlmostEqual(4.0, ph_values[2], 12)
+        # The channels without a calibrated probe
+        self.assertTrue(math.isnan(ph_values[1]))
+        self.assertTrue(math.isnan(ph_values[3]))
+
+    def test_unknownProbe(self):
+        with self.assertRaises(KeyError):
+            self.table.convert_mv_value_to_ph_value(0.0, "F.0.1.22_2")
+        with self.assertRaises(KeyError):
+            self.table.convert_mv_values_to_ph_values(np.zeros(2), ["F.0.1.22_1", "F.0.1.23_1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 import math
+import threading
+import time
 import unittest
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
 import yaml
 
 from Controllers import DerivativeControllerWithMemory
@@ -33,18 +37,144 @@ class TestPH_Meter(unittest.TestCase):
     def test_sendRequestMVCommand(self):
         self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'\x10\x11\x12')])
         self.ph_meter.send_request_mv_command("F.1.0.22")
-        self.assertEqual(self.mock_serial_connection.read_all(), b'\x10\x11\x12')
+        # The start of the reply, up to the length byte, has been read while waiting for the rest
+        self.assertEqual(2, self.ph_meter.number_of_reply_bytes_read)
+        self.assertEqual(b'\x10\x11', self.ph_meter.reply_buffer[:2])
+        self.assertEqual(self.mock_serial_connection.read_all(), b'\x12')
         self.assertTrue(self.mock_serial_connection.dtr)
 
+    def test_sendRequestMVCommand_waitsUntilTheReplyHasArrived(self):
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.time_dependent_actions = []
+        self.ph_meter.timer = mock_timer
+        reply = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x9F\x0D\x0A'
+        self.mock_serial_connection.add_write_action(b'M\x06\n\x0f\x01\x00"\x8f\r\n', lambda: None)
+        time_sent = mock_timer.now()
+        # The first half of the reply has arrived after 0.05 seconds, and the rest after 0.1 seconds
+        mock_timer.add_time_dependent_action(lambda now: setattr(self.mock_serial_connection, "read_buffer",
+                                                                 reply[:(now - time_sent).microseconds//50000*9]))
+        self.ph_meter.send_request_mv_command("F.1.0.22")
+        self.assertAlmostEqual(0.1, (mock_timer.now() - time_sent).total_seconds(), 6)
+        summary = self.ph_meter.get_response_time_summary()
+        self.assertEqual(1, summary["Replies"])
+        self.assertEqual(0, summary["Timeouts"])
+        self.assertAlmostEqual(0.1, summary["ResponseSeconds max"], 6)
+
+    def test_sendRequestMVCommand_waitsAtMostTheTimeout(self):
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.time_dependent_actions = []
+        self.ph_meter.timer = mock_timer
+        self.settings["phmeter"]["ReplyTimeoutInSeconds"] = 0.5
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E')])
+        time_sent = mock_timer.now()
+        self.ph_meter.send_request_mv_command("F.1.0.22")
+        self.assertAlmostEqual(0.5, (mock_timer.now() - time_sent).total_seconds(), 6)
+        self.assertEqual({"Replies": 0, "Timeouts": 1}, self.ph_meter.get_response_time_summary())
+        with self.assertRaises(PhReadException):
+            self.ph_meter.read_mv_result()
+
+    def test_sendRequestMVCommand_shortReplyIsNotWaitedForUntilTheTimeout(self):
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.time_dependent_actions = []
+        self.ph_meter.timer = mock_timer
+        self.settings["phmeter"]["ReplyTimeoutInSeconds"] = 0.5
+        # A reply without data, e.g. an error, whose length byte says it is 10 bytes instead of the 18 of a mV reply
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x06\x10\x0f\x01\x00"\x00\x0D\x0A')])
+        time_sent = mock_timer.now()
+        self.ph_meter.send_request_mv_command("F.1.0.22")
+        self.assertEqual(0, (mock_timer.now() - time_sent).total_seconds())
+        self.assertEqual([], mock_timer.sleep_list)
+        self.assertEqual({"Replies": 1, "Timeouts": 0}, {name: value for name, value in self.ph_meter.get_response_time_summary().items()
+                                                         if name in ("Replies", "Timeouts")})
+        with self.assertRaises(PhReadException):
+            self.ph_meter.read_mv_result()
+        self.assertEqual(b'', self.mock_serial_connection.read_buffer)
+
+    def test_readMvResult_wrongChecksumIsBroken(self):
+        self.settings["phmeter"]["ShouldVerifyReplyChecksums"] = True
+        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x9F\x0D\x0A'
+        self.assertEqual(b'\x9F', self.ph_meter.read_mv_result().checksum)
+        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x01\x9F\x0D\x0A'
+        with self.assertRaises(PhReadException):
+            self.ph_meter.read_mv_result()
+
+    def test_brokenReplyIsReadAgainWithinTheSameCall(self):
+        self.settings["phmeter"]["ShouldVerifyReplyChecksums"] = True
+        self.settings["phmeter"]["ReadRetries"] = 2
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.time_dependent_actions = []
+        self.ph_meter.timer = mock_timer
+        self.calibration_data["F.1.0.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        command = b'M\x06\n\x0f\x01\x00"\x8f\r\n'
+        self.mock_serial_connection.set_write_to_read_list([(command, b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x01\x9F\x0D\x0A'),
+                                                            (command, b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x9F\x0D\x0A')])
+        self.assertAlmostEqual(5.76, self.ph_meter.get_ph_value_of_selected_probes(["F.1.0.22_2"])["F.1.0.22_2"], 2)
+        self.assertEqual({"F.1.0.22": 1}, self.ph_meter.corrupt_replies_of_modules)
+        self.assertEqual([0.1], mock_timer.sleep_list)  # Only the backoff, as the replies arrive at once
+
+    def test_readingFailsAfterTheRetries(self):
+        self.settings["phmeter"]["ReadRetries"] = 2
+        self.settings["phmeter"]["ReadRetryBackoffInSeconds"] = 0.5
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.time_dependent_actions = []
+        self.ph_meter.timer = mock_timer
+        self.settings["phmeter"]["ReplyTimeoutInSeconds"] = 0
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10')]*3)
+        with self.assertRaises(PhReadException):
+            self.ph_meter.get_mv_values_of_module("F.1.0.22")
+        self.assertEqual(3, len(self.mock_serial_connection.written_commands))
+        self.assertEqual([0.5, 1.0], mock_timer.sleep_list)
+        self.assertEqual({"F.1.0.22": 3}, self.ph_meter.corrupt_replies_of_modules)
+
+    def test_readRetriesIsTheTotalNumberOfRetries(self):
+        # Neither measuring a probe nor reading selected probes asks the module again on top of ReadRetries
+        self.settings["phmeter"]["ReadRetries"] = 2
+        self.settings["phmeter"]["ReplyTimeoutInSeconds"] = 0
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.time_dependent_actions = []
+        self.ph_meter.timer = mock_timer
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10')]*6)
+        with self.assertRaises(PhReadException):
+            self.ph_meter.measure_ph_with_probe("F.1.0.22_1")
+        self.assertEqual(3, len(self.mock_serial_connection.written_commands))
+        with self.assertRaises(PhReadException):
+            self.ph_meter.get_ph_value_of_selected_probes(["F.1.0.22_1", "F.1.0.22_2"])
+        self.assertEqual(6, len(self.mock_serial_connection.written_commands))
+        self.assertEqual([0.1, 0.2]*2, mock_timer.sleep_list)  # Only the backoffs
+
     def test_readMvResult_correctIDGiven(self):
-        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x01\x01\x10\x10\x12\x34\x00\x0D\x0A'
+        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x01\x01\x10\x10\x12\x34\x08\x0D\x0A'
         read_result = self.ph_meter.read_mv_result()
         self.assertEqual(read_result.recipient, b'P')
         self.assertEqual(read_result.length_of_reply, b'\x0E')
         self.assertEqual(read_result.command_acted_upon, b'\x10')
-        self.assertEqual(read_result.data, b'\x00\x00\x01\x01\x10\x10\x12\x34')
+        self.assertEqual(read_result.mv_values, [0.0, 25.7, 411.2, 466.0])
         self.assertEqual(read_result.reply_device_id, [b'\x0f', b'\x01', b'\x00', b'"'])
-        # TODO also look at checksum
+        self.assertEqual(read_result.checksum, b'\x08')
+        self.assertTrue(self.ph_meter.has_correct_checksum(18))
+
+    def test_readMvResult_readsTheReplyAtOnce(self):
+        read_sizes = []
+        read = self.mock_serial_connection.read
+        self.mock_serial_connection.read = lambda number_of_bytes=1: read_sizes.append(number_of_bytes) or read(number_of_bytes)
+        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x9F\x0D\x0A\x00'
+        read_result = self.ph_meter.read_mv_result()
+        self.assertEqual([18], read_sizes)
+        self.assertEqual(b'\x9F', read_result.checksum)
+        self.assertEqual([0.0, 70.7, -70.7, 0.0], read_result.mv_values)
+        self.assertEqual([0.0, 70.7, -70.7, 0.0], self.ph_meter.convert_raw_mv_bin_data_to_mv_values(self.ph_meter.reply_buffer[7:15]))
+
+    def test_readMvResult_longerReplyIsBroken(self):
+        self.mock_serial_connection.read_buffer = b'P\x10\x10\x0f\x01\x00"\x00\x00\x01\x01\x10\x10\x12\x34\x56\x78\x00\x0D\x0A'
+        with self.assertRaises(PhReadException):
+            self.ph_meter.read_mv_result()
+        self.assertEqual(b'', self.mock_serial_connection.read_buffer)
+
+    def test_readMvResult_brokenReplyIsDiscarded(self):
+        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0BP\x0E'
+        with self.assertRaises(PhReadException):
+            self.ph_meter.read_mv_result()
+        self.assertEqual(b'', self.mock_serial_connection.read_buffer)
 
     def test_bytesToMvValue(self):
         self.assertEqual(0, self.ph_meter.get_mv_value_from_bytes(b'\x00'[0], b'\x00'[0]))
@@ -69,12 +199,14 @@ class TestPH_Meter(unittest.TestCase):
         self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_2"), 2)
 
     def test_handles_1_missing_serial_output(self):
+        self.settings["phmeter"]["ReadRetries"] = 1  # The broken reply is asked for again once
         self.calibration_data["F.1.0.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
         self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10'), # First output is invalid, it will have to try to measure again
                                                             (b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A')])
         self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_2"), 2)
 
     def test_handles_error_at_2_missing_serial_output(self):
+        self.settings["phmeter"]["ReadRetries"] = 1  # The broken reply is asked for again once
         self.calibration_data["F.1.0.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
         self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10'), # First output is invalid, it will have to try to measure again
                                                             (b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10'), # Second is also invalid
@@ -83,6 +215,7 @@ class TestPH_Meter(unittest.TestCase):
             self.ph_meter.measure_ph_with_probe("F.1.0.22_2")
 
     def test_measure_associated_task_ph_missing_output_results_in_NaN(self):
+        self.settings["phmeter"]["ReadRetries"] = 1  # The broken reply is asked for again once
         self.calibration_data["F.0.1.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
         self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x00\x01"\x8f\r\n', b'P\x0E\x10'), # First output is invalid, it will have to try to measure again
                                                             (b'M\x06\n\x0f\x00\x01"\x8f\r\n', b'P\x0E\x10'), # Second is also invalid
@@ -106,3 +239,127 @@ class TestPH_Meter(unittest.TestCase):
         self.assertAlmostEqual(7.0, ph_values[ph_probes[0]], 2)
         self.assertAlmostEqual(5.76,  ph_values[ph_probes[1]], 2)
 
+
+    def test_reading_reused_within_ttl(self):
+        self.settings['phmeter']["ReadingCacheTTLInSeconds"] = 5
+        mock_timer = mock_objects.MockTimer()
+        self.ph_meter.timer = mock_timer
+        self.calibration_data["F.1.0.22_1"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        self.calibration_data["F.1.0.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A'),
+                                                            (b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x02\xC3\x00\x00\xFD\x3D\x00\x00\x00\x0D\x0A')])
+        self.assertAlmostEqual(7.0, self.ph_meter.measure_ph_with_probe("F.1.0.22_1"), 2)
+        # The other probes of the module are answered from the same reading
+        self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_2"), 2)
+        self.assertEqual({"F.1.0.22_2": 70.7}, self.ph_meter.get_mv_values_of_selected_probes(["F.1.0.22_2"]))
+        self.assertEqual(1, len(self.mock_serial_connection.written_commands))
+
+        # When the reading is too old, the module is read again
+        mock_timer.sleep(6)
+        self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_1"), 2)
+        self.assertEqual(2, len(self.mock_serial_connection.written_commands))
+
+    def test_reading_asked_for_by_user_is_made_anew(self):
+        self.settings['phmeter']["ReadingCacheTTLInSeconds"] = 60
+        self.ph_meter.timer = mock_objects.MockTimer()
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A'),
+                                                            (b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x02\xC3\x00\x00\xFD\x3D\x00\x00\x00\x0D\x0A')])
+        self.assertEqual({"F.1.0.22_2": 70.7}, self.ph_meter.get_mv_values_of_selected_probes(["F.1.0.22_2"]))
+        self.assertEqual({"F.1.0.22_2": 0.0}, self.ph_meter.get_mv_values_of_selected_probes(["F.1.0.22_2"], False))
+        self.assertEqual(2, len(self.mock_serial_connection.written_commands))
+        # The new reading is then reused by the others
+        self.assertEqual({"F.1.0.22_2": 0.0}, self.ph_meter.get_mv_values_of_selected_probes(["F.1.0.22_2"]))
+        self.assertEqual(2, len(self.mock_serial_connection.written_commands))
+
+    def test_poller_readsModulesInTheBackground(self):
+        self.settings['phmeter']["ReadingCacheTTLInSeconds"] = 60
+        self.settings['phmeter']["PollingIntervalInSeconds"] = 0.01
+        self.calibration_data["F.1.0.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        self.mock_serial_connection.add_write_action(
+            b'M\x06\n\x0f\x01\x00"\x8f\r\n',
+            lambda: b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A')
+        time_started = time.time()
+        self.ph_meter.start_polling(["F.1.0.22"])
+        while len(self.ph_meter.reading_buffer) < 3 and time.time() - time_started < 5:
+            time.sleep(0.01)
+        self.ph_meter.stop_polling()
+        self.assertFalse(self.ph_meter.is_polling())
+
+        number_of_readings = len(self.mock_serial_connection.written_commands)
+        self.assertLessEqual(3, number_of_readings)
+        times, module_ids, mv_values = self.ph_meter.get_mv_readings_between(time_started, time.time())
+        self.assertEqual(number_of_readings, len(times))
+        self.assertTrue((np.diff(times) >= 0).all())
+        self.assertEqual([0.0, 70.7, -70.7, 0.0], self.ph_meter.get_latest_mv_values_of_module("F.1.0.22")[1].tolist())
+        latest_ph_values = self.ph_meter.get_latest_ph_values_of_module("F.1.0.22")[1]
+        self.assertAlmostEqual(5.76, latest_ph_values[1], 2)
+        self.assertTrue(math.isnan(latest_ph_values[0]))  # Not calibrated
+        # The polled reading is used instead of asking the ph-meter, until the probe is pumped into
+        self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_2"), 2)
+        self.assertEqual(number_of_readings, len(self.mock_serial_connection.written_commands))
+        self.ph_meter.invalidate_cached_reading_of_probe("F.1.0.22_2")
+        self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_2"), 2)
+        self.assertEqual(number_of_readings + 1, len(self.mock_serial_connection.written_commands))
+
+    def test_poller_readsUsingTheWorkerAndIsStoppedOnDisconnect(self):
+        self.settings['phmeter']["ShouldPollInBackground"] = True
+        self.settings['phmeter']["PollingIntervalInSeconds"] = 0.01
+        self.mock_serial_connection.add_write_action(
+            b'M\x06\n\x0f\x01\x00"\x8f\r\n',
+            lambda: b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A')
+        physical_systems = PhysicalSystems(self.settings)
+        physical_systems.ph_meter = self.ph_meter
+        physical_systems.pump_to_probe = {"2": "F.1.0.22_2"}
+        reading_threads = []
+        request_mv_values_of_module = self.ph_meter.request_mv_values_of_module
+        self.ph_meter.request_mv_values_of_module = lambda module_id: reading_threads.append(threading.current_thread()) \
+                                                                      or request_mv_values_of_module(module_id)
+        physical_systems.start_ph_polling()
+        time_started = time.time()
+        while len(self.ph_meter.reading_buffer) < 3 and time.time() - time_started < 5:
+            time.sleep(0.01)
+        physical_systems.disconnect(pd.DataFrame({"Pump": [2], "pH probe": ["F.1.0.22_2"]}))
+
+        self.assertLessEqual(3, len(reading_threads))
+        self.assertTrue(all(thread is physical_systems.ph_meter_worker.thread for thread in reading_threads))
+        self.assertFalse(self.ph_meter.is_polling())
+        self.assertEqual([], self.ph_meter.polled_modules)
+        self.assertFalse(physical_systems.ph_meter_worker.thread.is_alive())
+        number_of_readings = len(self.mock_serial_connection.written_commands)
+        time.sleep(0.05)
+        self.assertEqual(number_of_readings, len(self.mock_serial_connection.written_commands))
+
+    def test_updatedCalibrationDataIsUsed(self):
+        self.mock_serial_connection.read_buffer = b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A'
+        mv_response = self.ph_meter.read_mv_result()
+        # A probe added to the calibration data after it was compiled is found
+        self.calibration_data["F.1.0.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        self.assertAlmostEqual(5.76, self.ph_meter.get_ph_value_of_probe_from_mv_response(mv_response, "F.1.0.22_2"), 2)
+        self.ph_meter.update_calibration_data({"F.1.0.22_2": {"HighPH": 7.0, "HighPHmV": 0.0, "LowPH": 4.0, "LowPHmV": 177.48}})
+        self.assertAlmostEqual(7 - 70.7/59.16, self.ph_meter.get_ph_value_of_probe_from_mv_response(mv_response, "F.1.0.22_2"), 5)
+
+    def test_reading_not_reused_when_ttl_is_zero(self):
+        self.calibration_data["F.1.0.22_1"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        self.ph_meter.timer = mock_objects.MockTimer()
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A'),
+                                                            (b'M\x06\n\x0f\x01\x00"\x8f\r\n', b'P\x0E\x10\x0f\x01\x00"\x02\xC3\x00\x00\xFD\x3D\x00\x00\x00\x0D\x0A')])
+        self.assertAlmostEqual(7.0, self.ph_meter.measure_ph_with_probe("F.1.0.22_1"), 2)
+        self.assertAlmostEqual(5.76, self.ph_meter.measure_ph_with_probe("F.1.0.22_1"), 2)
+
+    def test_cached_reading_invalidated_after_pumping(self):
+        self.settings['phmeter']["ReadingCacheTTLInSeconds"] = 60
+        self.ph_meter.timer = mock_objects.MockTimer()
+        self.calibration_data["F.0.1.22_2"] = {"HighPH": 9.0, "HighPHmV": -114.29, "LowPH": 4, "LowPHmV": 171.43}
+        physical_systems = PhysicalSystems(self.settings)
+        physical_systems.ph_meter = self.ph_meter
+        physical_systems.pump_to_probe = {"2": "F.0.1.22_2"}
+        pump_serial_connection = mock_objects.MockSerialConnection(None)
+        pump_serial_connection.set_write_to_read_list([(b'2 RUN\r', b'')])
+        physical_systems.pump_system.serial_connection = pump_serial_connection
+        physical_systems.pump_system.timer = mock_objects.MockTimer()
+        self.mock_serial_connection.set_write_to_read_list([(b'M\x06\n\x0f\x00\x01"\x8f\r\n', b'P\x0E\x10\x0f\x00\x01"\x00\x00\x02\xC3\xFD\x3D\x00\x00\x00\x0D\x0A'),
+                                                            (b'M\x06\n\x0f\x00\x01"\x8f\r\n', b'P\x0E\x10\x0f\x00\x01"\x00\x00\x00\x00\xFD\x3D\x00\x00\x00\x0D\x0A')])
+
+        self.assertAlmostEqual(5.76, physical_systems.get_ph_values_of_selected_probes(["F.0.1.22_2"])["F.0.1.22_2"], 2)
+        physical_systems.pump_n_times(2, 1)
+        self.assertAlmostEqual(7.0, physical_systems.get_ph_values_of_selected_probes(["F.0.1.22_2"])["F.0.1.22_2"], 2)
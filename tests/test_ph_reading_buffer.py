@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from PhReadingBuffer import PhReadingBuffer
+
+
+class TestPhReadingBuffer(unittest.TestCase):
+
+    def test_latestReadingOfEachModule(self):
+        buffer = PhReadingBuffer(10)
+        self.assertIsNone(buffer.get_latest("F.0.1.22"))
+        buffer.add(1.0, "F.0.1.22", [1, 2, 3, 4])
+        buffer.add(2.0, "F.0.1.21", [5, 6, 7, 8])
+        buffer.add(3.0, "F.0.1.22", [9, 10, 11, 12])
+        time, mv_values = buffer.get_latest("F.0.1.22")
+        self.assertEqual(3.0, time)
+        self.assertEqual([9, 10, 11, 12], mv_values.tolist())
+        self.assertEqual(3, len(buffer))
+
+    def test_oldestReadingsAreOverwritten(self):
+        buffer = PhReadingBuffer(3)
+        for reading in range(5):
+            buffer.add(float(reading), "F.0.1.22" if reading % 2 == 0 else "F.0.1.21", [reading]*4)
+        self.assertEqual(3, len(buffer))
+        times, module_ids, mv_values = buffer.get_readings_between(0, 10)
+        self.assertEqual([2.0, 3.0, 4.0], times.tolist())
+        self.assertEqual(["F.0.1.22", "F.0.1.21", "F.0.1.22"], module_ids.tolist())
+        self.assertEqual([[2]*4, [3]*4, [4]*4], mv_values.tolist())
+        # The latest reading of a module is kept, also when it has been overwritten in the ring
+        buffer.add(5.0, "F.0.1.22", [5]*4)
+        buffer.add(6.0, "F.0.1.22", [6]*4)
+        buffer.add(7.0, "F.0.1.22", [7]*4)
+        self.assertEqual(3.0, buffer.get_latest("F.0.1.21")[0])
+
+    def test_readingsOfAModuleInATimeWindow(self):
+        buffer = PhReadingBuffer(10)
+        for reading in range(6):
+            buffer.add(float(reading), "F.0.1.22" if reading % 2 == 0 else "F.0.1.21", [reading]*4)
+        times, module_ids, mv_values = buffer.get_readings_between(1, 4, "F.0.1.22")
+        self.assertEqual([2.0, 4.0], times.tolist())
+        self.assertTrue((module_ids == "F.0.1.22").all())
+        self.assertEqual((2, 4), mv_values.shape)
+        times, module_ids, mv_values = buffer.get_readings_between(1, 4, "F.0.1.23")
+        self.assertEqual(0, len(times))
+        self.assertEqual((0, 4), mv_values.shape)
+        self.assertTrue(np.array_equal([0.0, 1.0, 2.0], buffer.get_readings_between(-1, 2)[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
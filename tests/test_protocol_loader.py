@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+from ProtocolLoader import load_protocol
+
+
+class Test_ProtocolLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.protocol_path = os.path.join(self.directory, "protocol.xlsx")
+        shutil.copyfile("test_protocol.xlsx", self.protocol_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_compiledProtocolMatchesWorkbook(self):
+        protocol = load_protocol("test_protocol_multi_task.xlsx")
+        dataframe = pd.read_excel("test_protocol_multi_task.xlsx")
+        self.assertTrue(dataframe.equals(protocol.get_dataframe()))
+        self.assertEqual(tuple(sorted(set(dataframe["Pump"]))), protocol.pumps)
+        self.assertEqual(tuple(sorted(set(dataframe["pH probe"]))), protocol.ph_probes)
+        for task, (_, row) in zip(protocol.tasks, dataframe.iterrows()):
+            self.assertEqual(row["Pump"], task.pump_id)
+            self.assertEqual(row["pH probe"], task.ph_probe)
+            self.assertEqual(row["Pump"], protocol.probe_to_pump[task.ph_probe])
+            self.assertEqual(task.ph_probe, protocol.pump_to_probe[task.pump_id])
+            self.assertEqual(row.to_list()[3:8], list(vars(task.segments[0]).values()))
+        self.assertLess(1, max(len(task.segments) for task in protocol.tasks))
+
+    def test_workbookOnlyParsedOnce(self):
+        with patch("ProtocolLoader.pd.read_excel", wraps=pd.read_excel) as read_excel:
+            protocol = load_protocol(self.protocol_path)
+            for _ in range(5):
+                self.assertIs(protocol, load_protocol(self.protocol_path))
+            self.assertEqual(1, read_excel.call_count)
+
+    def test_unchangedContentNotParsedAgain(self):
+        protocol = load_protocol(self.protocol_path)
+        file_stats = os.stat(self.protocol_path)
+        os.utime(self.protocol_path, ns=(file_stats.st_atime_ns, file_stats.st_mtime_ns + 10**9))
+        with patch("ProtocolLoader.pd.read_excel", wraps=pd.read_excel) as read_excel:
+            self.assertIs(protocol, load_protocol(self.protocol_path))
+            self.assertEqual(0, read_excel.call_count)
+
+    def test_changedProtocolParsedAgain(self):
+        protocol = load_protocol(self.protocol_path)
+        shutil.copyfile("test_protocol_off.xlsx", self.protocol_path)
+        file_stats = os.stat(self.protocol_path)
+        os.utime(self.protocol_path, ns=(file_stats.st_atime_ns, file_stats.st_mtime_ns + 10**9))
+        changed_protocol = load_protocol(self.protocol_path)
+        self.assertIsNot(protocol, changed_protocol)
+        self.assertNotEqual(protocol.content_hash, changed_protocol.content_hash)
+        self.assertTrue(pd.read_excel("test_protocol_off.xlsx").equals(changed_protocol.get_dataframe()))
+
+    def test_changingDataframeDoesNotChangeCache(self):
+        protocol = load_protocol(self.protocol_path)
+        dataframe = protocol.get_dataframe()
+        dataframe["Pump"] = 0
+        self.assertNotIn(0, load_protocol(self.protocol_path).get_dataframe()["Pump"].to_list())
+        with self.assertRaises(TypeError):
+            protocol.probe_to_pump["F.0.1.22_1"] = 0
@@ -3,7 +3,7 @@ import unittest
 import datetime
 import mock_objects
 from Controllers import DerivativeControllerWithMemory
-from PumpTasks import PumpTask
+from PumpTasks import PumpTask, SegmentTablePumpTask
 
 
 class TestPumpTask(unittest.TestCase):
@@ -36,4 +36,50 @@ class TestPumpTask(unittest.TestCase):
         self.assertEqual(1, len(mock_timer.sleep_list))
         self.assertAlmostEqual(wait_time, mock_timer.sleep_list[0], 3)
 
+    def create_segment_table_task(self, start_time: datetime.datetime) -> SegmentTablePumpTask:
+        # Three segments: 5 -> 6 over 60 minutes, 6 -> 6.5 over 30 minutes and 7 -> 7 over 30 minutes
+        return SegmentTablePumpTask(pump_id=1,
+                                    ph_meter_id=("F.0.1.22", "1"),
+                                    task_start_time=start_time,
+                                    time_next_operation=start_time,
+                                    controller=DerivativeControllerWithMemory(),
+                                    segment_end_offsets=[60, 90, 120],
+                                    segment_intercepts=[5, 6, 7],
+                                    segment_slopes=[1/60, 0.5/30, 0],
+                                    segment_dose_volumes=[5, 10, 15],
+                                    segment_minimum_delays=[2, 3, 4])
 
+    def test_segmentTableExpectedPh(self):
+        start_time = datetime.datetime.now()
+        task = self.create_segment_table_task(start_time)
+        self.assertAlmostEqual(5, task.get_expected_ph_at_time(start_time))
+        self.assertAlmostEqual(5.5, task.get_expected_ph_at_time(start_time + datetime.timedelta(minutes=30)))
+        self.assertAlmostEqual(6.25, task.get_expected_ph_at_time(start_time + datetime.timedelta(minutes=75)))
+        self.assertAlmostEqual(7, task.get_expected_ph_at_time(start_time + datetime.timedelta(minutes=100)))
+
+        mock_timer = mock_objects.MockTimer()
+        mock_timer.set_time(start_time + datetime.timedelta(minutes=45))
+        task.datetimer = mock_timer
+        self.assertAlmostEqual(5.75, task.get_expected_ph_at_current_time())
+
+    def test_segmentTableCurrentSegment(self):
+        start_time = datetime.datetime.now()
+        task = self.create_segment_table_task(start_time)
+        self.assertEqual(start_time + datetime.timedelta(minutes=60), task.get_end_time())
+        self.assertEqual(start_time + datetime.timedelta(minutes=120), task.get_task_end_time())
+        self.assertEqual((60, 5, 6, 5, 2), (task.task_time, task.ph_at_start, task.ph_at_end, task.dose_volume,
+                                            task.minimum_delay))
+
+        self.assertIs(task, task.get_next_segment(start_time + datetime.timedelta(minutes=61)))
+        self.assertEqual(1, task.segment)
+        self.assertEqual(start_time + datetime.timedelta(minutes=60), task.start_time)
+        self.assertAlmostEqual(6.5, task.ph_at_end)
+        self.assertEqual(3, task.minimum_delay)
+
+    def test_segmentTableSkipsSegmentsThatHaveEnded(self):
+        start_time = datetime.datetime.now()
+        task = self.create_segment_table_task(start_time)
+        self.assertIs(task, task.get_next_segment(start_time + datetime.timedelta(minutes=95)))
+        self.assertEqual(2, task.segment)
+        self.assertIsNone(task.get_next_segment(start_time + datetime.timedelta(minutes=95)))
+        self.assertEqual(2, task.segment)
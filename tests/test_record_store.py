@@ -0,0 +1,75 @@
+import datetime
+import unittest
+
+import pandas as pd
+
+from RecordStore import RecordStore
+
+
+class Test_RecordStore(unittest.TestCase):
+
+    def create_record(self, i: int, time_point: datetime.datetime) -> dict:
+        return {"PumpTask": i % 5 + 1, "TimePoint": time_point + datetime.timedelta(minutes=i),
+                "ExpectedPH": 5.6 + i/1000, "ActualPH": 5.5 + i/1000, "DidPump": i % 2 == 0, "PumpMultiplier": i % 3}
+
+    def test_emptyStore(self):
+        record_store = RecordStore()
+        self.assertEqual(0, len(record_store))
+        records = record_store.to_dataframe()
+        self.assertEqual(0, len(records.index))
+        self.assertEqual(['PumpTask', 'TimePoint', 'ExpectedPH', 'ActualPH', 'DidPump', 'PumpMultiplier'],
+                         records.columns.tolist())
+
+    def test_appendMoreThanOneChunk(self):
+        record_store = RecordStore()
+        start_time = datetime.datetime.now()
+        number_of_records = 2*RecordStore.CHUNK_SIZE + 10
+        for i in range(number_of_records):
+            record_store.append(self.create_record(i, start_time))
+
+        self.assertEqual(number_of_records, len(record_store))
+        self.assertEqual(3, len(record_store.chunks))
+        records = record_store.to_dataframe()
+        self.assertEqual(number_of_records, len(records.index))
+        for i in [0, RecordStore.CHUNK_SIZE - 1, RecordStore.CHUNK_SIZE, number_of_records - 1]:
+            expected_record = self.create_record(i, start_time)
+            self.assertEqual(expected_record["PumpTask"], records["PumpTask"][i])
+            self.assertEqual(pd.Timestamp(expected_record["TimePoint"]), records["TimePoint"][i])
+            self.assertEqual(expected_record["ExpectedPH"], records["ExpectedPH"][i])
+            self.assertEqual(expected_record["ActualPH"], records["ActualPH"][i])
+            self.assertEqual(expected_record["DidPump"], records["DidPump"][i])
+            self.assertEqual(expected_record["PumpMultiplier"], records["PumpMultiplier"][i])
+
+    def test_dataframeIsOnlyCreatedWhenChanged(self):
+        record_store = RecordStore()
+        start_time = datetime.datetime.now()
+        record_store.append(self.create_record(0, start_time))
+        records = record_store.to_dataframe()
+        self.assertIs(records, record_store.to_dataframe())
+        record_store.append(self.create_record(1, start_time))
+        self.assertEqual(2, len(record_store.to_dataframe().index))
+
+    def test_fromDataframe(self):
+        start_time = datetime.datetime.now()
+        old_records = pd.DataFrame([self.create_record(i, start_time) for i in range(10)])
+        record_store = RecordStore.from_dataframe(old_records)
+        record_store.append(self.create_record(10, start_time))
+        records = record_store.to_dataframe()
+        self.assertEqual(11, len(records.index))
+        self.assertEqual(old_records["ActualPH"].tolist(), records["ActualPH"].tolist()[:10])
+        self.assertEqual(old_records["TimePoint"].tolist(), records["TimePoint"].tolist()[:10])
+
+    def test_fromDataframeWithMoreThanOneChunk(self):
+        start_time = datetime.datetime.now()
+        number_of_records = RecordStore.CHUNK_SIZE + 10
+        old_records = pd.DataFrame([self.create_record(i, start_time) for i in range(number_of_records)])
+        record_store = RecordStore.from_dataframe(old_records)
+        self.assertEqual(number_of_records, len(record_store))
+        self.assertEqual(2, len(record_store.chunks))
+        record_store.append(self.create_record(number_of_records, start_time))
+        records = record_store.to_dataframe()
+        self.assertEqual(number_of_records + 1, len(records.index))
+        for column in old_records.columns:
+            self.assertEqual(old_records[column].tolist(), records[column].tolist()[:number_of_records])
+        self.assertEqual(self.create_record(number_of_records, start_time)["PumpMultiplier"],
+                         records["PumpMultiplier"].iloc[-1])
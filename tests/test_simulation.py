@@ -0,0 +1,201 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+import yaml
+
+import Scheduler
+from PhMeter import PhMeter, REPLY_POLL_INTERVAL_IN_SECONDS
+from Simulation import SimulatedPhMeterConnection, SimulatedPhysicalSystems, SimulatedPlant, simulate_protocol, simulate_protocols
+from VirtualClock import VirtualClock
+
+
+class Test_Simulation(unittest.TestCase):
+
+    def setUp(self):
+        with open('test_config.yml', 'r') as file:
+            self.settings = yaml.safe_load(file)
+        self.settings["simulation"]["MeasurementNoiseInPH"] = 0
+        self.start_time = datetime.datetime(2023, 1, 1, 12)
+        self.clock = VirtualClock(self.start_time)
+        self.results_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.results_directory)
+
+    def test_virtualClockOnlyMovesWhenSleeping(self):
+        self.assertEqual(self.start_time, self.clock.now())
+        self.clock.sleep(90)
+        self.clock.sleep(-5)
+        self.assertEqual(self.start_time + datetime.timedelta(seconds=90), self.clock.now())
+        self.assertEqual(self.start_time.timestamp() + 90, self.clock.time())
+
+    def test_plantGetsMoreAcidicWithTimeAndPumpingRaisesPh(self):
+        plant = SimulatedPlant(self.settings["simulation"], self.clock)
+        self.assertAlmostEqual(5.4, plant.get_measured_ph("F.0.1.22_1"))
+        self.clock.sleep(60*60)
+        self.assertAlmostEqual(5.3, plant.get_measured_ph("F.0.1.22_1"))
+        plant.add_base("F.0.1.22_1", 50)
+        self.assertAlmostEqual(5.4, plant.get_measured_ph("F.0.1.22_1"))
+        self.assertAlmostEqual(5.3, plant.get_measured_ph("F.0.1.22_2"))
+
+    def test_phMeterMeasuresSimulatedPh(self):
+        with open('test_calibration_data.yml', 'r') as file:
+            calibration_data = yaml.safe_load(file)
+        ph_meter = PhMeter(self.settings["phmeter"], calibration_data)
+        ph_meter.timer = self.clock
+        plant = SimulatedPlant(self.settings["simulation"], self.clock)
+        ph_meter.serial_connection = SimulatedPhMeterConnection(plant, ph_meter)
+        plant.add_base("F.0.1.22_3", 100)
+        ph_values = ph_meter.get_ph_value_of_selected_probes(["F.0.1.22_1", "F.0.1.22_3"])
+        self.assertAlmostEqual(5.4, ph_values["F.0.1.22_1"], 2)
+        self.assertAlmostEqual(5.6, ph_values["F.0.1.22_3"], 2)
+        # It only waits until the reply has arrived
+        self.assertAlmostEqual(self.settings["simulation"]["PhMeterResponseTimeInSeconds"],
+                               (self.clock.now() - self.start_time).total_seconds(), delta=REPLY_POLL_INTERVAL_IN_SECONDS)
+        self.assertEqual(1, ph_meter.get_response_time_summary()["Replies"])
+
+    def test_phMeterRecoversFromCorruptReplies(self):
+        self.settings["simulation"]["CorruptReplyProbability"] = 0.3
+        self.settings["phmeter"]["ShouldVerifyReplyChecksums"] = True
+        self.settings["phmeter"]["ReadRetries"] = 5
+        with open('test_calibration_data.yml', 'r') as file:
+            calibration_data = yaml.safe_load(file)
+        ph_meter = PhMeter(self.settings["phmeter"], calibration_data)
+        ph_meter.timer = self.clock
+        plant = SimulatedPlant(self.settings["simulation"], self.clock)
+        ph_meter.serial_connection = SimulatedPhMeterConnection(plant, ph_meter)
+        for _ in range(50):
+            self.assertAlmostEqual(5.4, ph_meter.get_ph_value_of_selected_probes(["F.0.1.22_1"])["F.0.1.22_1"], 2)
+        self.assertLess(0, ph_meter.corrupt_replies_of_modules["F.0.1.22"])
+
+    def test_simulatedRunFollowsProtocol(self):
+        protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", protocol_path)
+        records = simulate_protocol(self.settings, protocol_path, self.start_time)
+
+        self.assertEqual({1, 2, 3, 4, 5}, set(records["PumpTask"]))
+        self.assertTrue(records["TimePoint"].is_monotonic_increasing)
+        self.assertLess(0, records["DidPump"].sum())
+        # The protocol has tasks of 240 minutes, and one with a second segment of 700 minutes.
+        for pump_id, task_time in [(1, 940), (2, 240), (5, 240)]:
+            rows = records.loc[records["PumpTask"] == pump_id]
+            duration = (rows["TimePoint"].iloc[-1] - self.start_time).total_seconds()/60
+            self.assertAlmostEqual(task_time, duration, delta=5)
+        # After the first hour, the pH follows the expected pH
+        after_first_hour = records.loc[self.start_time + datetime.timedelta(hours=1) < records["TimePoint"]]
+        self.assertLess((after_first_hour["ActualPH"] - after_first_hour["ExpectedPH"]).abs().max(), 0.1)
+        self.assertEqual(1, len([file for file in os.listdir(self.results_directory) if "_results_" in file]))
+
+    def test_simulatedRunWithTheShippedConfig(self):
+        # The features that are on in config.yml together, like pumping in the background, checkpoints every step
+        # and the journal, while the other tests turn them on one at a time. Also with the module batching.
+        with open(os.path.join("..", "config.yml"), 'r') as file:
+            shipped_settings = yaml.safe_load(file)
+        shipped_settings["calibration_data_path"] = "test_calibration_data.yml"
+        for window_in_seconds in [shipped_settings["scheduler"]["ModuleBatchingWindowInSeconds"], 20]:
+            with self.subTest(window_in_seconds=window_in_seconds):
+                shipped_settings["scheduler"]["ModuleBatchingWindowInSeconds"] = window_in_seconds
+                results_directory = tempfile.mkdtemp(dir=self.results_directory)
+                protocol_path = os.path.join(results_directory, "test_protocol.xlsx")
+                shutil.copy("test_protocol.xlsx", protocol_path)
+                records = simulate_protocol(shipped_settings, protocol_path, self.start_time)
+
+                self.assertEqual({1, 2, 3, 4, 5}, set(records["PumpTask"]))
+                self.assertTrue(records["TimePoint"].is_monotonic_increasing)
+                self.assertFalse(records["ActualPH"].isna().any())
+                # With the measurement noise of the shipped simulation settings
+                after_first_hour = records.loc[self.start_time + datetime.timedelta(hours=1) < records["TimePoint"]]
+                errors = (after_first_hour["ActualPH"] - after_first_hour["ExpectedPH"]).abs()
+                self.assertLess(errors.mean(), 0.05)
+                self.assertLess(errors.max(), 0.15)
+                self.assertEqual(1, len([file for file in os.listdir(results_directory) if file.endswith("_timings.csv")]))
+
+    def test_stepTimingsAreSaved(self):
+        self.settings["scheduler"]["ShouldSaveStepTimings"] = True
+        protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", protocol_path)
+        records = simulate_protocol(self.settings, protocol_path, self.start_time)
+        timings_files = [file for file in os.listdir(self.results_directory) if file.endswith("_timings.csv")]
+        self.assertEqual(1, len(timings_files))
+        timings = pd.read_csv(os.path.join(self.results_directory, timings_files[0]))
+        self.assertEqual(records["PumpTask"].to_list(), timings["PumpTask"].to_list())
+
+    def test_simulatedRunIsRepeatable(self):
+        self.settings["simulation"]["MeasurementNoiseInPH"] = 0.02
+        protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", protocol_path)
+        first_records = simulate_protocol(self.settings, protocol_path, self.start_time)
+        second_records = simulate_protocol(self.settings, protocol_path, self.start_time)
+        self.assertTrue(first_records.equals(second_records))
+
+    def test_devicesAreDisconnectedWhenTheRunIsStopped(self):
+        protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", protocol_path)
+        with patch.object(Scheduler.Scheduler, "run_tasks", side_effect=KeyboardInterrupt), \
+                patch.object(SimulatedPhysicalSystems, "disconnect", autospec=True) as disconnect:
+            with self.assertRaises(KeyboardInterrupt):
+                simulate_protocol(self.settings, protocol_path, self.start_time)
+        disconnect.assert_called_once()
+
+    def test_asyncSchedulerCanBeSimulated(self):
+        self.settings["scheduler"]["ShouldUseAsyncScheduler"] = True
+        protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", protocol_path)
+        records = simulate_protocol(self.settings, protocol_path, self.start_time)
+        self.assertEqual({1, 2, 3, 4, 5}, set(records["PumpTask"]))
+        self.assertLess(records["TimePoint"].iloc[-1] - self.start_time, datetime.timedelta(minutes=950))
+
+    def create_second_protocol(self, pumps: list[int]) -> str:
+        # Two tasks of the test protocol, on other pumps and probes
+        protocol = pd.read_excel("test_protocol.xlsx").iloc[1:3, :8].reset_index(drop=True)
+        protocol["Pump"] = pumps
+        protocol["pH probe"] = ["F.0.1.21_2", "F.0.1.21_3"]
+        protocol_path = os.path.join(self.results_directory, "second_protocol.xlsx")
+        protocol.to_excel(protocol_path, index=False)
+        return protocol_path
+
+    def test_protocolsCanBeRunAtTheSameTime(self):
+        self.settings["scheduler"]["ShouldRecordStepsWhileRunning"] = True
+        first_protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", first_protocol_path)
+        second_protocol_path = self.create_second_protocol([6, 7])
+        first_records, second_records = simulate_protocols(self.settings, [first_protocol_path, second_protocol_path],
+                                                           [0, 30], self.start_time)
+
+        self.assertEqual({1, 2, 3, 4, 5}, set(first_records["PumpTask"]))
+        self.assertEqual({6, 7}, set(second_records["PumpTask"]))
+        delay_of_second_protocol = second_records["TimePoint"].iloc[0] - first_records["TimePoint"].iloc[0]
+        self.assertAlmostEqual(30, delay_of_second_protocol.total_seconds()/60, delta=1)
+        self.assertLess((second_records["ActualPH"] - second_records["ExpectedPH"]).iloc[-20:].abs().max(), 0.1)
+        # Each protocol has its own results and journal
+        for protocol_name, records in [("test_protocol", first_records), ("second_protocol", second_records)]:
+            results_files = [file for file in os.listdir(self.results_directory) if file.startswith(f"{protocol_name}_results_")]
+            self.assertEqual(2, len(results_files))
+            journal_file = next(file for file in results_files if file.endswith(".csv"))
+            journal = pd.read_csv(os.path.join(self.results_directory, journal_file))
+            self.assertEqual(records["PumpTask"].to_list(), journal["PumpTask"].to_list())
+
+    def test_protocolsCannotShareAPump(self):
+        first_protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", first_protocol_path)
+        second_protocol_path = self.create_second_protocol([5, 6])
+        with self.assertRaises(ValueError):
+            simulate_protocols(self.settings, [first_protocol_path, second_protocol_path], start_time=self.start_time)
+
+    def test_modelBasedControllerPumpsLessOften(self):
+        self.settings["simulation"]["MeasurementNoiseInPH"] = 0.01
+        protocol_path = os.path.join(self.results_directory, "test_protocol.xlsx")
+        shutil.copy("test_protocol.xlsx", protocol_path)
+        derivative_records = simulate_protocol(self.settings, protocol_path, self.start_time)
+        self.settings["scheduler"]["DosingController"] = "ModelBased"
+        model_based_records = simulate_protocol(self.settings, protocol_path, self.start_time)
+
+        self.assertLess(model_based_records["DidPump"].sum(), derivative_records["DidPump"].sum())
+        for records in [derivative_records, model_based_records]:
+            after_first_hour = records.loc[self.start_time + datetime.timedelta(hours=1) < records["TimePoint"]]
+            self.assertLess((after_first_hour["ActualPH"] - after_first_hour["ExpectedPH"]).abs().mean(), 0.03)
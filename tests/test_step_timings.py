@@ -0,0 +1,53 @@
+import datetime
+import unittest
+
+import numpy as np
+
+from StepTimings import StepTiming, StepTimings
+
+
+class Test_StepTimings(unittest.TestCase):
+
+    def setUp(self):
+        self.start_time = datetime.datetime(2023, 1, 1, 12)
+        self.step_timings = StepTimings()
+        # Task 1 is always on time, while task 2 gets later and later
+        for step in range(100):
+            scheduled_time = self.start_time + datetime.timedelta(minutes=2*step)
+            self.step_timings.add(StepTiming(1, scheduled_time, scheduled_time, minimum_delay=2,
+                                             measure_seconds=1, pump_seconds=0.5, persistence_seconds=0.01))
+            self.step_timings.add(StepTiming(2, scheduled_time, scheduled_time + datetime.timedelta(seconds=2*step),
+                                             minimum_delay=1, measure_seconds=1))
+
+    def test_lateness(self):
+        scheduled_time = self.start_time
+        self.assertEqual(5, StepTiming(1, scheduled_time, scheduled_time + datetime.timedelta(seconds=5), 1).lateness_seconds)
+        self.assertEqual(-5, StepTiming(1, scheduled_time, scheduled_time - datetime.timedelta(seconds=5), 1).lateness_seconds)
+
+    def test_summaryPerTask(self):
+        summary = self.step_timings.get_summary()
+        self.assertEqual([1, 2], summary.index.to_list())
+        self.assertEqual([100, 100], summary["Steps"].to_list())
+        self.assertEqual(0, summary.loc[1, "LatenessSeconds max"])
+        self.assertEqual(198, summary.loc[2, "LatenessSeconds max"])
+        self.assertAlmostEqual(np.percentile(np.arange(100)*2, 95), summary.loc[2, "LatenessSeconds p95"])
+        self.assertEqual(0.5, summary.loc[1, "PumpSeconds p50"])
+        # Task 2 is more than its minimum delay of a minute late in the steps after the 30th
+        self.assertEqual(0, summary.loc[1, "MissedDelays"])
+        self.assertEqual(69, summary.loc[2, "MissedDelays"])
+
+    def test_histogramPerTask(self):
+        histogram = self.step_timings.get_histogram()
+        # The bins include their start, so the steps that are on time are in the first bin after 0
+        self.assertEqual([0, 100, 0, 0, 0, 0, 0, 0, 0], histogram.loc[1].to_list())
+        self.assertEqual([0, 1, 2, 2, 10, 15, 30, 40, 0], histogram.loc[2].to_list())
+
+    def test_toDataframe(self):
+        timings = self.step_timings.to_dataframe()
+        self.assertEqual(200, len(timings.index))
+        self.assertEqual(self.start_time + datetime.timedelta(seconds=2), timings["StartTime"].iloc[3] - datetime.timedelta(minutes=2))
+        self.assertEqual(2, timings["LatenessSeconds"].iloc[3])
+
+    def test_emptySummary(self):
+        self.assertEqual(0, len(StepTimings().get_summary().index))
+        self.assertEqual("No steps have been timed yet", StepTimings().format_summary())